@@ -0,0 +1,94 @@
+'''
+Cart Transform Benchmark
+
+Compares process_cart_data against the previous json_normalize +
+groupby + merge approach on synthetic dummyjson-shaped carts, at sizes
+up to several million cart lines.
+
+Usage:
+    python benchmarks/bench_carts.py [lines ...]
+
+'''
+import os
+import random
+import sys
+import time
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from transform import process_cart_data
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 2_000_000]
+
+def make_carts(n_lines, lines_per_cart=5, seed=0):
+    """
+    Generate dummyjson-shaped carts totalling roughly `n_lines` cart lines.
+
+    Args:
+        n_lines (int): Number of cart lines to generate.
+        lines_per_cart (int): Average products per cart.
+        seed (int): Random seed.
+
+    Returns:
+        list: Cart records with `id`, `userId` and a `products` array.
+    """
+    rng = random.Random(seed)
+    carts = []
+    cart_id = 0
+    while n_lines > 0:
+        cart_id += 1
+        size = min(n_lines, rng.randint(1, 2 * lines_per_cart - 1))
+        n_lines -= size
+        carts.append({
+            "id": cart_id,
+            "userId": rng.randint(1, 200),
+            "products": [
+                {
+                    "id": rng.randint(1, 200),
+                    "title": f"Product {rng.randint(1, 200)}",
+                    "price": round(rng.uniform(1, 2000), 2),
+                    "quantity": rng.randint(1, 5),
+                }
+                for _ in range(size)
+            ],
+        })
+    return carts
+
+def groupby_merge_cart_data(json_data):
+    """
+    Reference implementation: json_normalize, groupby().sum() and merge back.
+
+    Args:
+        json_data (list): Cart records.
+
+    Returns:
+        pd.DataFrame: Same columns as process_cart_data.
+    """
+    carts_df = pd.json_normalize(json_data, record_path=['products'], meta=['id', 'userId'],
+                                 record_prefix='product_', meta_prefix='cart_')
+    carts_df = carts_df.rename(columns={
+        'cart_userId': 'user_id', 'product_title': 'name',
+        'product_quantity': 'quantity', 'product_price': 'price',
+    })
+    carts_df['total_price'] = carts_df['quantity'] * carts_df['price']
+    totals = carts_df.groupby('cart_id')['total_price'].sum().reset_index()
+    totals = totals.rename(columns={'total_price': 'total_cart_value'})
+    final_df = carts_df.merge(totals, on='cart_id')
+    return final_df[['cart_id', 'user_id', 'product_id', 'name', 'quantity', 'price', 'total_cart_value']]
+
+def time_call(func, data):
+    start = time.perf_counter()
+    result = func(data)
+    return time.perf_counter() - start, result
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f"{'lines':>10} {'carts':>9} {'vectorized s':>13} {'groupby s':>10} {'speedup':>8} {'lines/s':>12}")
+    for n_lines in sizes:
+        carts = make_carts(n_lines)
+        fast_seconds, fast = time_call(process_cart_data, carts)
+        slow_seconds, slow = time_call(groupby_merge_cart_data, carts)
+        assert len(fast) == len(slow) == n_lines
+        assert abs(fast['total_cart_value'].sum() - slow['total_cart_value'].sum()) < 1e-6 * max(1.0, slow['total_cart_value'].sum())
+        print(f"{n_lines:>10} {len(carts):>9} {fast_seconds:>13.3f} {slow_seconds:>10.3f} "
+              f"{slow_seconds / fast_seconds:>7.1f}x {n_lines / fast_seconds:>12,.0f}")
@@ -0,0 +1,71 @@
+'''
+DAG Parse-time Benchmark
+
+Measures how long the scheduler spends importing dags/etl_pipeline.py.
+Airflow itself is imported first in each fresh interpreter, as it is
+already loaded in the DAG processor, so only the DAG module's own cost
+is timed. Fails if the median exceeds the budget or if the DAG module
+pulls in any heavy library Airflow had not already loaded.
+
+Usage:
+    python benchmarks/bench_dag_parse.py [runs]
+
+'''
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+DAGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dags")
+
+# Median seconds the DAG module may take to import
+PARSE_BUDGET_SECONDS = float(os.environ.get("DAG_PARSE_BUDGET_SECONDS", 0.25))
+
+# Libraries that belong inside task callables, not at DAG parse time
+HEAVY_MODULES = ["requests", "google.cloud.storage", "google.cloud.bigquery", "google.oauth2.service_account",
+                 "google.api_core", "grpc", "google_crc32c", "pandas", "numpy", "pyarrow"]
+
+# Runs in a fresh interpreter: import Airflow, then time the DAG module import alone
+PARSE_SCRIPT = """
+import json, sys, time
+import airflow
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+sys.path.insert(0, {dags_dir!r})
+preloaded = set(sys.modules)
+start = time.perf_counter()
+import etl_pipeline
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "tasks": len(etl_pipeline.dag.tasks),
+    "heavy": [name for name in {heavy!r} if name in sys.modules and name not in preloaded],
+}}))
+"""
+
+def time_parse():
+    """
+    Import the DAG module once in a fresh interpreter.
+
+    Returns:
+        dict: Import seconds, task count and heavy modules that got imported.
+    """
+    script = PARSE_SCRIPT.format(dags_dir=os.path.abspath(DAGS_DIR), heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = [time_parse() for _ in range(runs)]
+    seconds = [result["seconds"] for result in results]
+    median = statistics.median(seconds)
+    heavy = sorted({name for result in results for name in result["heavy"]})
+    print(f"{runs} parses of etl_pipeline.py ({results[0]['tasks']} tasks): "
+          f"median {median * 1000:.1f} ms, min {min(seconds) * 1000:.1f} ms, max {max(seconds) * 1000:.1f} ms")
+    print(f"Heavy modules imported at parse time: {', '.join(heavy) or 'none'}")
+
+    if heavy or median > PARSE_BUDGET_SECONDS:
+        print(f"FAIL: budget is {PARSE_BUDGET_SECONDS * 1000:.0f} ms with no heavy imports")
+        sys.exit(1)
+    print(f"OK: within the {PARSE_BUDGET_SECONDS * 1000:.0f} ms budget")
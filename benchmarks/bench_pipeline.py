@@ -0,0 +1,257 @@
+'''
+End-to-end Pipeline Benchmark on Synthetic Data
+
+Generates dummyjson-shaped users, products and carts (see synthetic.py),
+writes them as the raw object in an in-memory GCS, runs the streaming
+transform and the BigQuery load against in-memory backends, and reports
+per-stage latency, throughput and peak memory from the pipeline's own
+metrics (scripts/metrics.py). No network or credentials are needed.
+
+Each entity and size runs in a fresh interpreter, so peak memory is that
+case's alone. The in-memory GCS holds the raw object, so the largest
+sizes need roughly the raw size in RAM (about 1.4 KB per user, 1.3 KB
+per product and 1.2 KB per cart).
+
+Results can be saved with --output and compared against a saved run with
+--baseline, which adds a column with the change in each stage's time.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--entities users products carts] [--sizes 10000 100000 ...]
+        [--format parquet|csv|avro] [--raw-format ndjson|json] [--output results.json] [--baseline results.json]
+
+'''
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# The pipeline modules live in scripts/, the in-memory GCS and BigQuery stand-ins in tests/
+sys.path += [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", directory) for directory in ("scripts", "tests")]
+from synthetic import iter_records, make_envelope
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+DEFAULT_ENTITIES = ["users", "products", "carts"]
+
+BUCKET = "bench-bucket"
+
+DATASET = "bench-project.bench_dataset"
+
+# Records generated and written to the raw object per page, like one API page
+PAGE_SIZE = 1_000
+
+def write_raw_object(bucket, entity, count, raw_format, seed=0):
+    """
+    Write a synthetic raw dump the way the extractor would.
+
+    Generation happens outside the timed `extract.write_raw` stage, so the
+    stage measures serialization and upload only.
+
+    Args:
+        bucket (FakeBucket): Bucket to write to.
+        entity (str): "users", "products" or "carts".
+        count (int): Number of records.
+        raw_format (str): "ndjson" (current extractor output) or "json" (legacy envelope).
+        seed (int): Random seed.
+
+    Returns:
+        str: Name of the raw object.
+    """
+    import metrics
+    from ndjson_io import COMPRESS_RAW, NDJSONBlobWriter, raw_blob_name
+
+    records = iter_records(entity, count, seed)
+    if raw_format == "json":
+        blob_name = f"raw/{entity}_raw.json"
+        envelope = make_envelope(entity, list(records))
+        with metrics.stage("extract.write_raw", entity=entity) as timer:
+            payload = json.dumps(envelope, indent=4).encode("utf-8")
+            bucket.blob(blob_name).upload_from_string(payload, content_type="application/json")
+            timer.add(rows=count, bytes=len(payload))
+        return blob_name
+
+    blob_name = raw_blob_name(entity)
+    with NDJSONBlobWriter(bucket.blob(blob_name), compress=COMPRESS_RAW) as writer:
+        remaining = count
+        while remaining > 0:
+            page = [next(records) for _ in range(min(PAGE_SIZE, remaining))]
+            remaining -= len(page)
+            with metrics.stage("extract.write_raw", entity=entity) as timer:
+                before = writer.bytes_written
+                writer.write_records(page)
+                timer.add(rows=len(page), bytes=writer.bytes_written - before)
+    return blob_name
+
+def run_case(entity, count, output_format, raw_format, batch_size, latency, seed=0):
+    """
+    Benchmark one entity at one size in this process.
+
+    Args:
+        entity (str): "users", "products" or "carts".
+        count (int): Number of raw records.
+        output_format (str): Transform output format.
+        raw_format (str): "ndjson" or "json".
+        batch_size (int): Records per transform batch.
+        latency (float): Seconds added to every fake GCS request.
+        seed (int): Random seed.
+
+    Returns:
+        dict: Per-stage measurements and totals of the case.
+    """
+    from clients import register_client
+    from columnar import output_path
+    from fake_bigquery import FakeBigQueryClient
+    from fake_gcs import FakeStorageClient
+    import load
+    import metrics
+    import streaming_transform
+
+    storage_client = FakeStorageClient(latency=latency)
+    bigquery_client = FakeBigQueryClient(storage_client=storage_client)
+    register_client("storage", storage_client)
+    register_client("bigquery", bigquery_client)
+    bucket = storage_client.bucket(BUCKET)
+
+    started = time.perf_counter()
+    blob_name = write_raw_object(bucket, entity, count, raw_format, seed)
+    raw_bytes = bucket.get_blob(blob_name).size
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_file = output_path(os.path.join(output_dir, entity), output_format)
+        rows = streaming_transform.stream_transform(BUCKET, blob_name, entity, output_file, batch_size=batch_size)
+        output_bytes = os.path.getsize(output_file) if rows else 0
+        table_id = f"{DATASET}.{entity}_table"
+        result = load.load_tables_to_bigquery({table_id: output_file}, client=bigquery_client)[table_id]
+    total_seconds = time.perf_counter() - started
+    if result["error"]:
+        raise RuntimeError(f"Load of {entity} failed: {result['error']}")
+    if result["rows"] != rows:
+        raise RuntimeError(f"Load of {entity} loaded {result['rows']} rows but the transform wrote {rows}")
+
+    stages = []
+    for aggregate in metrics.snapshot()["stages"]:
+        seconds = aggregate["seconds"]
+        stages.append({
+            "stage": aggregate["stage"],
+            "calls": aggregate["calls"],
+            "seconds": seconds,
+            "rows": aggregate["rows"],
+            "bytes": aggregate["bytes"],
+            "rows_per_second": aggregate["rows"] / seconds if seconds else 0.0,
+            "mb_per_second": aggregate["bytes"] / seconds / 1e6 if seconds else 0.0,
+            "peak_rss_bytes": aggregate["peak_rss_bytes"],
+        })
+    return {
+        "entity": entity,
+        "records": count,
+        "output_format": output_format,
+        "raw_format": raw_format,
+        "raw_bytes": raw_bytes,
+        "output_rows": rows,
+        "output_bytes": output_bytes,
+        "loaded_rows": result["rows"],
+        "total_seconds": total_seconds,
+        "records_per_second": count / total_seconds,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "stages": stages,
+    }
+
+def run_case_in_subprocess(entity, count, args):
+    """
+    Run one case in a fresh interpreter so its peak memory is measured in isolation.
+
+    Args:
+        entity (str): "users", "products" or "carts".
+        count (int): Number of raw records.
+        args (argparse.Namespace): Parsed command line.
+
+    Returns:
+        dict: The case's run_case result.
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--case", entity, str(count),
+               "--format", args.format, "--raw-format", args.raw_format, "--batch-size", str(args.batch_size),
+               "--latency", str(args.latency)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Case {entity} x {count} failed:\n{completed.stderr.strip().splitlines()[-1]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def baseline_seconds(baseline, case, stage):
+    """Return a stage's time in the matching case of a saved run, or None."""
+    for previous in baseline:
+        if (previous["entity"], previous["records"], previous["output_format"], previous["raw_format"]) == \
+                (case["entity"], case["records"], case["output_format"], case["raw_format"]):
+            if stage is None:
+                return previous["total_seconds"]
+            for previous_stage in previous["stages"]:
+                if previous_stage["stage"] == stage:
+                    return previous_stage["seconds"]
+    return None
+
+def print_case(case, baseline):
+    """Print one case's stages, slowest first, and its totals."""
+    def change(seconds, previous):
+        return f"{(seconds / previous - 1) * 100:>+8.1f}%" if previous else f"{'':>9}"
+
+    print(f"\n{case['entity']}: {case['records']:,} records, {case['raw_bytes'] / 1e6:,.1f} MB raw "
+          f"({case['raw_format']}) -> {case['output_rows']:,} rows, {case['output_bytes'] / 1e6:,.1f} MB "
+          f"{case['output_format']}, {case['loaded_rows']:,} loaded")
+    print(f"  {'stage':<24} {'calls':>7} {'seconds':>9} {'rows/s':>12} {'MB/s':>8} {'peak MiB':>9}"
+          + (f" {'vs base':>9}" if baseline else ""))
+    for stage in case["stages"]:
+        line = (f"  {stage['stage']:<24} {stage['calls']:>7} {stage['seconds']:>9.3f} {stage['rows_per_second']:>12,.0f} "
+                f"{stage['mb_per_second']:>8.1f} {stage['peak_rss_bytes'] / 2**20:>9.0f}")
+        if baseline:
+            line += " " + change(stage["seconds"], baseline_seconds(baseline, case, stage["stage"]))
+        print(line)
+    line = (f"  {'total':<24} {'':>7} {case['total_seconds']:>9.3f} {case['records_per_second']:>12,.0f} "
+            f"{case['raw_bytes'] / case['total_seconds'] / 1e6:>8.1f} {case['peak_rss_bytes'] / 2**20:>9.0f}")
+    if baseline:
+        line += " " + change(case["total_seconds"], baseline_seconds(baseline, case, None))
+    print(line)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic dummyjson-shaped data.")
+    parser.add_argument("--entities", nargs="+", default=DEFAULT_ENTITIES, choices=DEFAULT_ENTITIES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="Raw records per entity.")
+    parser.add_argument("--format", default="parquet", choices=["parquet", "csv", "avro"],
+                        help="Transform output format.")
+    parser.add_argument("--raw-format", default="ndjson", choices=["ndjson", "json"],
+                        help="Raw object format: extractor NDJSON or the legacy dummyjson envelope.")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="Records per transform batch.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every fake GCS request.")
+    parser.add_argument("--output", help="Save the results as JSON.")
+    parser.add_argument("--baseline", help="Compare against results saved with --output.")
+    parser.add_argument("--case", nargs=2, metavar=("ENTITY", "SIZE"), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+
+    if args.case:
+        # Child process: run one case and report it on the last line of stdout
+        entity, count = args.case[0], int(args.case[1])
+        print(json.dumps(run_case(entity, count, args.format, args.raw_format, args.batch_size, args.latency)))
+        sys.exit(0)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = []
+    for count in args.sizes:
+        for entity in args.entities:
+            case = run_case_in_subprocess(entity, count, args)
+            print_case(case, baseline)
+            results.append(case)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"\nSaved {len(results)} cases to {args.output}")
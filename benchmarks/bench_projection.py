@@ -0,0 +1,120 @@
+'''
+User Projection Benchmark
+
+Compares flatten_json, which extracts the configured user columns with a
+compiled projection (scripts/projection.py), against the path it replaced:
+the spec applied to every record, then one path-getter closure per column
+called on every row. The older json_normalize-then-select approach is
+reported as well. Wide synthetic dummyjson users are used, and time and
+peak memory allocated are reported for each (all measured under
+tracemalloc, which slows them alike).
+
+Usage:
+    python benchmarks/bench_projection.py [users ...]
+
+'''
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from endpoints import ENTITIES, output_columns
+from record_spec import SPECS, select_records
+from synthetic import iter_users
+from transform import flatten_json
+
+DEFAULT_SIZES = [10_000, 100_000, 500_000]
+
+def path_getter(path):
+    """Compile a column path into a closure reading it from a record, as transform.py did before projection.py."""
+    alternatives = [alternative.split(".") for alternative in path.split("|")]
+
+    def get(record):
+        for keys in alternatives:
+            value = record
+            for key in keys:
+                value = value.get(key) if isinstance(value, dict) else None
+                if value is None:
+                    break
+            if value is not None:
+                return value
+        return None
+
+    return get
+
+def select_then_get(json_data, entity="users"):
+    """
+    Reference implementation: the getter-based transform_records the compiled projection replaced.
+
+    Every record goes through the entity's spec (select_records), then every
+    column is read from every row by its own path_getter closure.
+
+    Args:
+        json_data (list): Records of an entity without a record path or derived columns.
+        entity (str): Key of endpoints.ENTITIES.
+
+    Returns:
+        pd.DataFrame: Same columns as transform_records.
+    """
+    config = ENTITIES[entity]
+    records = list(select_records(json_data, SPECS[entity]))
+    columns = {}
+    for name, path, _ in config["parent_columns"] + config["columns"]:
+        get = path_getter(path)
+        columns[name] = np.array([get(record) for record in records], dtype=object)
+    if config["required"] and records:
+        keep = np.ones(len(records), dtype=bool)
+        for name in config["required"]:
+            keep &= np.array([value is not None for value in columns[name]], dtype=bool)
+        columns = {name: values[keep] for name, values in columns.items()}
+    return pd.DataFrame({name: columns[name] for name, _ in output_columns(entity)}).infer_objects()
+
+def normalize_then_select(json_data):
+    """
+    Reference implementation: json_normalize every nested field, then keep eight columns.
+
+    Args:
+        json_data (list): User records.
+
+    Returns:
+        pd.DataFrame: Same columns as flatten_json.
+    """
+    flat_data = pd.json_normalize(json_data)
+    flat_data = flat_data[['id', 'firstName', 'lastName', 'gender', 'age',
+                           'address.address', 'address.city', 'address.postalCode']]
+    return flat_data.rename(columns={
+        'firstName': 'first_name',
+        'lastName': 'last_name',
+        'address.address': 'street',
+        'address.city': 'city',
+        'address.postalCode': 'postal_code',
+    })
+
+def measure(func, data):
+    """Return the seconds taken, peak bytes allocated and result of func(data)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(data)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, result
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f"{'users':>9} {'compiled s':>11} {'getters s':>10} {'speedup':>8} {'normalize s':>12} "
+          f"{'compiled MiB':>13} {'getters MiB':>12} {'normalize MiB':>14}")
+    for count in sizes:
+        users = list(iter_users(count, seed=0))
+        fast_seconds, fast_peak, fast = measure(flatten_json, users)
+        base_seconds, base_peak, base = measure(select_then_get, users)
+        slow_seconds, slow_peak, slow = measure(normalize_then_select, users)
+        pd.testing.assert_frame_equal(fast, base)
+        pd.testing.assert_frame_equal(fast, slow, check_dtype=False)
+        print(f"{count:>9} {fast_seconds:>11.3f} {base_seconds:>10.3f} {base_seconds / fast_seconds:>7.1f}x "
+              f"{slow_seconds:>12.3f} {fast_peak / 2**20:>13.1f} {base_peak / 2**20:>12.1f} {slow_peak / 2**20:>14.1f}")
@@ -0,0 +1,241 @@
+'''
+Synthetic dummyjson-shaped Data
+
+Generates users, products and carts with the same fields, nesting and
+value types as https://dummyjson.com (see scripts/data/users_raw.json),
+in any quantity. Records are produced lazily and deterministically from a
+seed, so 10M-record datasets can be streamed to a sink without ever
+being held in memory, and two runs see identical data.
+
+About one product in ten has no `brand`, and a few prices are strings,
+as in the real API, so the transforms' cleaning paths are exercised.
+
+'''
+import random
+
+FIRST_NAMES = ["Emily", "Michael", "Sophia", "James", "Emma", "Olivia", "Alexander", "Ava", "Ethan", "Isabella",
+               "Liam", "Mia", "Noah", "Charlotte", "William", "Amelia", "Benjamin", "Harper", "Lucas", "Evelyn"]
+LAST_NAMES = ["Johnson", "Williams", "Brown", "Davis", "Miller", "Wilson", "Moore", "Taylor", "Anderson", "Thomas",
+              "Jackson", "White", "Harris", "Martin", "Garcia", "Martinez", "Robinson", "Clark", "Lewis", "Lee"]
+CITIES = [("Phoenix", "Mississippi", "MS"), ("Houston", "Alabama", "AL"), ("Washington", "Kansas", "KS"),
+          ("Seattle", "Pennsylvania", "PA"), ("Jacksonville", "Tennessee", "TN"), ("Denver", "Nebraska", "NE"),
+          ("Columbus", "Michigan", "MI"), ("San Francisco", "Wisconsin", "WI"), ("Fort Worth", "Ohio", "OH")]
+STREETS = ["Main Street", "Oak Street", "Pine Street", "Maple Avenue", "Cedar Lane", "Elm Street", "Tenth Street"]
+DEPARTMENTS = ["Engineering", "Support", "Research and Development", "Human Resources", "Marketing", "Legal"]
+CATEGORIES = ["beauty", "fragrances", "furniture", "groceries", "home-decoration", "kitchen-accessories",
+              "laptops", "mens-shirts", "smartphones", "sports-accessories", "tops", "womens-bags"]
+BRANDS = ["Essence", "Glamour Beauty", "Velvet Touch", "Chic Cosmetics", "Nail Couture", "Calvin Klein",
+          "Chanel", "Dior", "Annibale Colombo", "Furniture Co.", "Knoll", "Bath Trends", "Apple", "Samsung"]
+ADJECTIVES = ["Essential", "Classic", "Deluxe", "Compact", "Premium", "Vintage", "Modern", "Portable", "Organic"]
+NOUNS = ["Mascara", "Eyeshadow Palette", "Powder Canister", "Lipstick", "Perfume", "Bed", "Sofa", "Table Lamp",
+         "Apple", "Coffee Mug", "Laptop", "Shirt", "Smartphone", "Football", "Handbag"]
+AVAILABILITY = ["In Stock", "Low Stock", "Out of Stock"]
+SHIPPING = ["Ships in 1 month", "Ships in 1-2 business days", "Ships overnight", "Ships in 2 weeks"]
+WARRANTY = ["1 month warranty", "1 year warranty", "2 year warranty", "Lifetime warranty", "No warranty"]
+RETURNS = ["30 days return policy", "60 days return policy", "90 days return policy", "No return policy"]
+
+def _address(rng):
+    city, state, state_code = rng.choice(CITIES)
+    return {
+        "address": f"{rng.randint(1, 9999)} {rng.choice(STREETS)}",
+        "city": city,
+        "state": state,
+        "stateCode": state_code,
+        "postalCode": f"{rng.randint(10000, 99999)}",
+        "coordinates": {"lat": round(rng.uniform(-90, 90), 6), "lng": round(rng.uniform(-180, 180), 6)},
+        "country": "United States",
+    }
+
+def _hex(rng, digits):
+    return f"{rng.getrandbits(4 * digits):0{digits}x}"
+
+def iter_users(count, seed=0, start_id=1):
+    """
+    Generate dummyjson-shaped user records.
+
+    Args:
+        count (int): Number of users.
+        seed (int): Random seed.
+        start_id (int): Id of the first user.
+
+    Yields:
+        dict: One user at a time.
+    """
+    rng = random.Random(seed)
+    for user_id in range(start_id, start_id + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{first.lower()}{user_id}"
+        yield {
+            "id": user_id,
+            "firstName": first,
+            "lastName": last,
+            "maidenName": rng.choice(LAST_NAMES) if rng.random() < 0.3 else "",
+            "age": rng.randint(18, 80),
+            "gender": rng.choice(("female", "male")),
+            "email": f"{first.lower()}.{last.lower()}{user_id}@x.dummyjson.com",
+            "phone": f"+{rng.randint(1, 99)} {rng.randint(100, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+            "username": username,
+            "password": f"{username}pass",
+            "birthDate": f"{rng.randint(1944, 2006)}-{rng.randint(1, 12)}-{rng.randint(1, 28)}",
+            "image": f"https://dummyjson.com/icon/{username}/128",
+            "bloodGroup": rng.choice(("O-", "O+", "A-", "A+", "B-", "B+", "AB-", "AB+")),
+            "height": round(rng.uniform(150, 200), 2),
+            "weight": round(rng.uniform(45, 120), 2),
+            "eyeColor": rng.choice(("Green", "Brown", "Blue", "Gray", "Amber", "Hazel")),
+            "hair": {"color": rng.choice(("Brown", "Black", "Blonde", "Red", "Gray")),
+                     "type": rng.choice(("Curly", "Straight", "Wavy", "Kinky"))},
+            "ip": f"{rng.randint(1, 254)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            "address": _address(rng),
+            "macAddress": ":".join(_hex(rng, 2) for _ in range(6)),
+            "university": f"University of {rng.choice(CITIES)[1]}",
+            "bank": {
+                "cardExpire": f"{rng.randint(1, 12):02d}/{rng.randint(25, 32)}",
+                "cardNumber": f"{rng.getrandbits(53):016d}"[:16],
+                "cardType": rng.choice(("Elo", "Visa", "Mastercard", "Amex")),
+                "currency": rng.choice(("USD", "EUR", "CNY", "GBP")),
+                "iban": _hex(rng, 24).upper(),
+            },
+            "company": {
+                "department": rng.choice(DEPARTMENTS),
+                "name": f"{rng.choice(LAST_NAMES)}, {rng.choice(LAST_NAMES)} and {rng.choice(LAST_NAMES)}",
+                "title": rng.choice(("Sales Manager", "Engineer", "Analyst", "Director", "Support Specialist")),
+                "address": _address(rng),
+            },
+            "ein": f"{rng.randint(100, 999)}-{rng.randint(100, 999)}",
+            "ssn": f"{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}",
+            "userAgent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)",
+            "crypto": {"coin": "Bitcoin", "wallet": f"0x{_hex(rng, 40)}", "network": "Ethereum (ERC20)"},
+            "role": rng.choice(("admin", "moderator", "user", "user", "user")),
+        }
+
+def iter_products(count, seed=0, start_id=1):
+    """
+    Generate dummyjson-shaped product records.
+
+    Args:
+        count (int): Number of products.
+        seed (int): Random seed.
+        start_id (int): Id of the first product.
+
+    Yields:
+        dict: One product at a time.
+    """
+    rng = random.Random(seed)
+    for product_id in range(start_id, start_id + count):
+        title = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+        price = round(rng.uniform(1, 2000), 2)
+        product = {
+            "id": product_id,
+            "title": title,
+            "description": f"The {title} is a dependable choice for everyday use, made to last.",
+            "category": rng.choice(CATEGORIES),
+            # A few prices arrive as strings, like the upstream data
+            "price": str(price) if rng.random() < 0.02 else price,
+            "discountPercentage": round(rng.uniform(0, 20), 2),
+            "rating": round(rng.uniform(1, 5), 2),
+            "stock": rng.randint(0, 150),
+            "tags": rng.sample(CATEGORIES, 2),
+            "sku": _hex(rng, 8).upper(),
+            "weight": rng.randint(1, 10),
+            "dimensions": {"width": round(rng.uniform(5, 30), 2), "height": round(rng.uniform(5, 30), 2),
+                           "depth": round(rng.uniform(5, 30), 2)},
+            "warrantyInformation": rng.choice(WARRANTY),
+            "shippingInformation": rng.choice(SHIPPING),
+            "availabilityStatus": rng.choice(AVAILABILITY),
+            "reviews": [
+                {"rating": rng.randint(1, 5), "comment": "Very satisfied!", "date": "2024-05-23T08:56:21.618Z",
+                 "reviewerName": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                 "reviewerEmail": f"reviewer{rng.randint(1, 10_000)}@x.dummyjson.com"}
+                for _ in range(3)
+            ],
+            "returnPolicy": rng.choice(RETURNS),
+            "minimumOrderQuantity": rng.randint(1, 50),
+            "meta": {"createdAt": "2024-05-23T08:56:21.618Z", "updatedAt": "2024-05-23T08:56:21.618Z",
+                     "barcode": f"{rng.getrandbits(40):013d}"[:13], "qrCode": "https://assets.dummyjson.com/public/qr-code.png"},
+            "images": [f"https://cdn.dummyjson.com/products/images/{product_id}/1.png"],
+            "thumbnail": f"https://cdn.dummyjson.com/products/images/{product_id}/thumbnail.png",
+        }
+        # Unbranded products (groceries, for instance) have no brand key at all
+        if rng.random() >= 0.1:
+            product["brand"] = rng.choice(BRANDS)
+        yield product
+
+def iter_carts(count, seed=0, start_id=1, lines_per_cart=5, users=200, products=200):
+    """
+    Generate dummyjson-shaped cart records.
+
+    Args:
+        count (int): Number of carts.
+        seed (int): Random seed.
+        start_id (int): Id of the first cart.
+        lines_per_cart (int): Average products per cart.
+        users (int): Carts belong to users 1..users.
+        products (int): Cart lines reference products 1..products.
+
+    Yields:
+        dict: One cart at a time.
+    """
+    rng = random.Random(seed)
+    for cart_id in range(start_id, start_id + count):
+        lines = []
+        for _ in range(rng.randint(1, 2 * lines_per_cart - 1)):
+            product_id = rng.randint(1, products)
+            price = round(rng.uniform(1, 2000), 2)
+            quantity = rng.randint(1, 5)
+            discount = round(rng.uniform(0, 20), 2)
+            total = round(price * quantity, 2)
+            lines.append({
+                "id": product_id,
+                "title": f"{ADJECTIVES[product_id % len(ADJECTIVES)]} {NOUNS[product_id % len(NOUNS)]}",
+                "price": price,
+                "quantity": quantity,
+                "total": total,
+                "discountPercentage": discount,
+                "discountedTotal": round(total * (1 - discount / 100), 2),
+                "thumbnail": f"https://cdn.dummyjson.com/products/images/{product_id}/thumbnail.png",
+            })
+        yield {
+            "id": cart_id,
+            "products": lines,
+            "total": round(sum(line["total"] for line in lines), 2),
+            "discountedTotal": round(sum(line["discountedTotal"] for line in lines), 2),
+            "userId": rng.randint(1, users),
+            "totalProducts": len(lines),
+            "totalQuantity": sum(line["quantity"] for line in lines),
+        }
+
+# Generator of each entity
+GENERATORS = {
+    "users": iter_users,
+    "products": iter_products,
+    "carts": iter_carts,
+}
+
+def iter_records(entity, count, seed=0):
+    """
+    Generate records of an entity.
+
+    Args:
+        entity (str): "users", "products" or "carts".
+        count (int): Number of records.
+        seed (int): Random seed.
+
+    Yields:
+        dict: One record at a time.
+    """
+    return GENERATORS[entity](count, seed=seed)
+
+def make_envelope(entity, records, total=None, skip=0):
+    """
+    Wrap records in the dummyjson page envelope.
+
+    Args:
+        entity (str): Key of the record list, e.g. "users".
+        records (list): Records of the page.
+        total (int): Total records of the endpoint; defaults to the page size.
+        skip (int): Offset of the page.
+
+    Returns:
+        dict: `{entity: records, "total": ..., "skip": ..., "limit": ...}`.
+    """
+    return {entity: records, "total": len(records) if total is None else total, "skip": skip, "limit": len(records)}
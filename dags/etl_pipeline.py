@@ -1,82 +1,84 @@
+import os
+import sys
 import json
 import logging
-import requests
+import tempfile
 from airflow import DAG
+from airflow.exceptions import AirflowSkipException
 from datetime import datetime
-from google.cloud import storage
-from google.cloud import bigquery
-from google.oauth2 import service_account
-from airflow.operators.python_operator import PythonOperator
-from google.api_core.exceptions import GoogleAPIError, NotFound
-from requests.exceptions import RequestException, HTTPError, Timeout
-from requests.exceptions import RequestException, HTTPError, Timeout
-
-# Define the API endpoints
-API_ENDPOINTS = {
-    "users": "https://dummyjson.com/users",
-    "products": "https://dummyjson.com/products",
-    "carts": "https://dummyjson.com/carts"
-}
+from airflow.operators.python import PythonOperator
+
+# Make the shared pipeline modules in scripts/ importable from the DAG
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+# Only lightweight modules are imported here: the scheduler re-parses this file continuously.
+# GCP clients, requests, pandas and pyarrow are imported inside the task callables.
+from endpoints import API_ENDPOINTS, FACTS, TABLES, delta_blob_name, raw_blob_name
 
 # Define the GCS bucket name
 GCS_BUCKET = "savannah_informatics_assesment"
 
+# BigQuery dataset holding the users, products and carts tables and the fact tables
+BIGQUERY_DATASET = "savannahinformaticsassessment.savannah_informatics_assessment_data"
+
+# Number of API pages fetched in parallel per endpoint
+EXTRACT_CONCURRENCY = 8
+
+# Transformed shards are staged per run under gs://<bucket>/<prefix>/<entity>/ and loaded from there
+STAGING_PREFIX = "staged/{{ ts_nodash }}"
+
+# Service account key used by the load tasks
+CREDENTIALS_PATH = '/home/malcolmbuluku/data_pipeline/credentials/credentials.json'
+
+# "full" rewrites raw/{api_name}_raw.ndjson; "changes" or "append" write raw/{api_name}/delta_<run_ts>.ndjson,
+# which is then transformed and merged on its own
+EXTRACT_MODE = "full"
+# "truncate" replaces each table; "merge" upserts the staged rows on the entity's primary key.
+# With EXTRACT_MODE "full" the staged rows are the whole transform output, so every merge reads the
+# full output and touches every row of the table; only incremental modes merge just the changes.
+LOAD_MODE = "truncate"
+
+# A delta only holds new or changed records: truncating a table down to it would lose the rest
+if EXTRACT_MODE != "full" and LOAD_MODE != "merge":
+    raise ValueError(f"EXTRACT_MODE '{EXTRACT_MODE}' writes deltas, which must be loaded with LOAD_MODE 'merge'.")
+
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def fetch_and_save_to_gcs(api_name, gcs_bucket):
+def fetch_and_save_to_gcs(api_name, gcs_bucket, concurrency=EXTRACT_CONCURRENCY, mode=EXTRACT_MODE, run_ts=None):
     """
-    Fetch data from an API endpoint and save it as a separate object in a GCS bucket.
+    Fetch every page of an API endpoint and save it as a separate object in a GCS bucket.
 
     Args:
         api_name (str): The key of the API endpoint to fetch data from.
         gcs_bucket (str): Name of the GCS bucket to upload the file to.
+        concurrency (int): Number of API pages fetched in parallel.
+        mode (str): "full", or "changes"/"append" for incremental extraction.
+        run_ts (str): Run timestamp used to name incremental deltas.
 
     Returns:
         None
-    """
-    try:
-        # Fetch data from the API
-        logging.info(f"Fetching data from API endpoint: {API_ENDPOINTS[api_name]}")
-        response = requests.get(API_ENDPOINTS[api_name], timeout=10)
-        response.raise_for_status()  # Will raise an HTTPError for bad responses (4xx, 5xx)
-        data = response.json()
-    except Timeout:
-        logging.error(f"Request to {API_ENDPOINTS[api_name]} timed out.")
-        return
-    except HTTPError as http_err:
-        logging.error(f"HTTP error occurred while accessing {API_ENDPOINTS[api_name]}: {http_err}")
-        return
-    except RequestException as req_err:
-        logging.error(f"Request error occurred: {req_err}")
-        return
-    except json.JSONDecodeError:
-        logging.error(f"Failed to decode JSON response from {API_ENDPOINTS[api_name]}.")
-        return
-    except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
-        return
 
-    # Convert data to a JSON string
-    data_json = json.dumps(data, indent=4)
-
-    # Initialize GCS client
-    try:
-        client = storage.Client()
-        bucket = client.bucket(gcs_bucket)
+    Raises:
+        RuntimeError: If the extraction failed, so the task fails instead of feeding stale raw data downstream.
+    """
+    import extract
 
-        # Upload data to GCS
-        blob_name = f"raw/{api_name}_raw.json"
-        blob = bucket.blob(blob_name)
-        blob.upload_from_string(data_json, content_type="application/json")
-        logging.info(f"Data uploaded to GCS bucket '{gcs_bucket}' at '{blob_name}'")
-    except Exception as e:
-        logging.error(f"Error uploading data to GCS: {e}")
+    if mode == "full":
+        result = extract.fetch_and_save_to_gcs(api_name, gcs_bucket, concurrency=concurrency)
+    else:
+        result = extract.fetch_incremental_to_gcs(api_name, gcs_bucket, run_ts=run_ts, mode=mode, concurrency=concurrency)
+    # The extractor logs the cause and returns None on failure
+    if result is None:
+        raise RuntimeError(f"Extraction of {api_name} failed; see the log above for the cause")
+    # Return nothing so the fetched payload is not pushed to XCom
 
 def perform_transformation_task(source_blob, target_blob):
     """
     Transform data from a source blob and save the transformed data to a target blob in GCS.
 
+    Products are filtered and projected by the "premium_products" spec of
+    record_spec.py while the source is parsed, and written as compact JSON.
+
     Args:
         source_blob (str): Path to the source blob in GCS.
         target_blob (str): Path to the target blob in GCS.
@@ -84,23 +86,23 @@ def perform_transformation_task(source_blob, target_blob):
     Returns:
         None
     """
+    from clients import get_storage_client
+    from ndjson_io import read_raw_records
+    from record_spec import SPECS
+
     try:
         logging.info(f"Transforming data from source blob '{source_blob}'")
         # Initialize GCS client
-        client = storage.Client()
+        client = get_storage_client()
         bucket = client.bucket(GCS_BUCKET)
 
-        # Download source data
-        source_data = bucket.blob(source_blob).download_as_text()
-        source_json = json.loads(source_data)
-
-        # Perform transformation (example: filter or modify the data)
+        # Download source data, keeping only the spec's products and fields while parsing
         transformed_data = {
-            "transformed_items": [item for item in source_json.get("products", []) if item.get("price", 0) > 100]
+            "transformed_items": read_raw_records(bucket.blob(source_blob), "products", spec=SPECS["premium_products"])
         }
 
-        # Convert transformed data to JSON string
-        transformed_json = json.dumps(transformed_data, indent=4)
+        # Convert transformed data to compact JSON
+        transformed_json = json.dumps(transformed_data, separators=(",", ":"))
 
         # Save transformed data to target blob
         target_blob_instance = bucket.blob(target_blob)
@@ -109,136 +111,325 @@ def perform_transformation_task(source_blob, target_blob):
     except Exception as e:
         logging.error(f"Error during data transformation: {e}")
 
-def load_csv_to_bigquery(credentials_path, table_id, file_path):
+def plan_entity_transform(gcs_bucket, entity, staging_prefix, mode=EXTRACT_MODE, run_ts=None):
+    """
+    Plan the transform shards of one entity, or skip the transform if its raw data is unchanged.
+
+    In incremental mode only this run's delta is transformed, and the
+    transform is skipped when the extraction found nothing new.
+
+    Args:
+        gcs_bucket (str): Name of the GCS bucket holding the raw objects and the staged outputs.
+        entity (str): "users", "products" or "carts".
+        staging_prefix (str): Prefix the output shards are uploaded under.
+        mode (str): "full", or "changes"/"append" for incremental extraction.
+        run_ts (str): Run timestamp the deltas are named with.
+
+    Returns:
+        list: One op_kwargs dict per shard, mapped over by the transform task.
+    """
+    from clients import get_storage_client
+    import run_transforms
+
+    if mode != "full":
+        blob_name = delta_blob_name(entity, run_ts)
+        if get_storage_client().bucket(gcs_bucket).get_blob(blob_name) is None:
+            raise AirflowSkipException(f"No new or changed {entity} records in this run.")
+        tasks = run_transforms.plan_tasks(gcs_bucket, [entity], staging_prefix=staging_prefix,
+                                          blob_names={entity: blob_name})
+        logging.info(f"Planned {len(tasks)} transform shards for the {entity} delta {blob_name}")
+        # A delta is never transformed twice, so it has no fingerprint to skip on
+        return [{'task': dict(task, fingerprint=None)} for task in tasks]
+
+    fingerprints, unchanged = run_transforms.find_unchanged(gcs_bucket, [entity])
+    if entity in unchanged:
+        raise AirflowSkipException(f"Raw {entity} data unchanged; reusing {unchanged[entity]['source_uri']}")
+    tasks = run_transforms.plan_tasks(gcs_bucket, [entity], staging_prefix=staging_prefix)
+    logging.info(f"Planned {len(tasks)} transform shards for {entity}")
+    return [{'task': dict(task, fingerprint=fingerprints.get(entity))} for task in tasks]
+
+def transform_shard(task):
+    """
+    Transform one planned shard and stage its output in GCS.
+
+    Args:
+        task (dict): A task built by plan_entity_transform.
+
+    Returns:
+        dict: Rows written and the staged output URI.
+    """
+    import run_transforms
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        task = dict(task, output_file=os.path.join(output_dir, os.path.basename(task['output_file'])))
+        result = run_transforms.run_transform_task(task)
+    if result['error']:
+        raise RuntimeError(f"Transform of {task['entity']} shard {task['shard']} failed: {result['error']}")
+    return {'rows': result['rows'], 'output': result['output'] if result['rows'] else None}
+
+def record_entity_transform(gcs_bucket, entity, staging_prefix, ti):
+    """
+    Record an entity's completed transform once all of its shards succeeded.
+
+    Args:
+        gcs_bucket (str): Name of the GCS bucket holding the state objects.
+        entity (str): "users", "products" or "carts".
+        staging_prefix (str): Prefix the output shards were uploaded under.
+        ti (TaskInstance): Supplied by Airflow; used to read the plan and shard results.
+
+    Returns:
+        None
+    """
+    from clients import get_storage_client
+    import run_transforms
+
+    planned = ti.xcom_pull(task_ids=f'plan_transform_{entity}')
+    results = list(ti.xcom_pull(task_ids=f'transform_{entity}'))
+    bucket = get_storage_client().bucket(gcs_bucket)
+    run_transforms.record_transform(
+        bucket, entity, planned[0]['task']['fingerprint'],
+        run_transforms.staged_uri_pattern(gcs_bucket, staging_prefix, entity),
+        sum(result['rows'] for result in results),
+        [result['output'] for result in results if result['output']],
+    )
+
+def load_entity(credentials_path, gcs_bucket, entity, load_mode=LOAD_MODE):
     """
-    Load a CSV file into a BigQuery table with schema on write.
+    Load an entity's latest staged outputs into its BigQuery table.
+
+    The staged location is read from the entity's transform state, and the
+    load is skipped when the staged objects are unchanged since the last one.
 
     Args:
         credentials_path (str): Path to the GCP service account JSON key file.
-        table_id (str): BigQuery table identifier in the format `project_id.dataset_name.table_name`.
-        file_path (str): Path to the CSV file.
+        gcs_bucket (str): Name of the GCS bucket holding the staged outputs and state.
+        entity (str): "users", "products" or "carts", or a fact table such as "cart_lines".
+        load_mode (str): "truncate" replaces the table; "merge" upserts on the entity's primary key
+            (the whole staged output in full mode, the run's delta in incremental mode).
 
     Returns:
         None
     """
-    try:
-        # Authenticate using the service account
-        credentials = service_account.Credentials.from_service_account_file(credentials_path)
-        client = bigquery.Client(credentials=credentials)
-
-        # Ensure the table exists
-        logging.info(f"Checking if table {table_id} exists...")
-        create_table_if_not_exists(client, table_id)
-
-        # Configure the load job for schema on write
-        job_config = bigquery.LoadJobConfig(
-            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,  # Overwrites the table
-            source_format=bigquery.SourceFormat.CSV,
-            field_delimiter=",",
-            skip_leading_rows=1,
-            autodetect=True,  # Enable schema detection
-        )
+    from clients import get_storage_client
+    import fingerprint
+    import load
+
+    state = fingerprint.load_stage_state(get_storage_client().bucket(gcs_bucket), "transform", entity)
+    if state is None:
+        raise RuntimeError(f"No transformed {entity} data has been staged yet.")
+    table_id = f'{BIGQUERY_DATASET}.{TABLES[entity]}'
+
+    upserts = None
+    if load_mode == "merge":
+        upserts = {
+            table_id: {'key_columns': load.ENTITY_KEYS[entity], 'clustering_fields': load.ENTITY_KEYS[entity]},
+        }
 
-        # Load the CSV file into BigQuery
-        logging.info(f"Starting the load job for table: {table_id}")
-        with open(file_path, "rb") as source_file:
-            job = client.load_table_from_file(source_file, table_id, job_config=job_config)
+    results = load.load_tables_to_bigquery({table_id: state["source_uri"]}, credentials_path, upserts=upserts,
+                                           skip_unchanged=True)
+    if results[table_id]["error"]:
+        raise RuntimeError(f"Load of {table_id} failed: {results[table_id]['error']}")
+    if results[table_id]["skipped"]:
+        raise AirflowSkipException(f"Staged {entity} data unchanged; nothing to load.")
 
-        # Wait for the job to complete
-        job.result()
-        logging.info("Data loaded successfully!")
+def build_fact_table(gcs_bucket, fact, staging_prefix):
+    """
+    Build a fact table from the raw objects of its entities and stage it in GCS.
 
-        # Retrieve table details and print summary
-        table = client.get_table(table_id)
-        logging.info(f"Loaded {table.num_rows} rows and {len(table.schema)} columns to {table_id}")
+    Args:
+        gcs_bucket (str): Name of the GCS bucket holding the raw objects and the staged outputs.
+        fact (str): Key of endpoints.FACTS.
+        staging_prefix (str): Prefix the output is uploaded under.
 
-    except FileNotFoundError:
-        logging.error(f"File not found: {file_path}")
-    except GoogleAPIError as e:
-        logging.error(f"Google API Error: {e.message}")
-    except Exception as e:
-        logging.error(f"An unexpected error occurred: {str(e)}")
-    finally:
-        logging.info("Script execution completed.")
+    Returns:
+        int: Rows written.
+    """
+    import facts
 
+    with tempfile.TemporaryDirectory() as output_dir:
+        result = facts.run_fact(gcs_bucket, fact, staging_prefix, output_dir=output_dir)
+    if result['skipped']:
+        raise AirflowSkipException(f"Raw data of {fact} unchanged; reusing {result['source_uri']}")
+    return result['rows']
 
-def create_table_if_not_exists(client, table_id):
+def export_task_metrics(context):
     """
-    Create a BigQuery table if it doesn't exist.
+    Export the stage metrics a task recorded, as its success or failure callback.
+
+    The JSON document lands in gs://<bucket>/metrics/<run_id>/<task_id>.json
+    (and in the configured local, Prometheus and StatsD destinations, see metrics.py).
 
     Args:
-        client (bigquery.Client): BigQuery client.
-        table_id (str): BigQuery table identifier in the format `project_id.dataset_name.table_name`.
+        context (dict): Airflow task context.
 
     Returns:
         None
     """
-    try:
-        client.get_table(table_id)  # Check if the table exists
-        logging.info(f"Table {table_id} already exists.")
-    except NotFound:
-        # Table does not exist; create it
-        table = bigquery.Table(table_id)
-        client.create_table(table)
-        logging.info(f"Table {table_id} created successfully.")
+    from clients import get_storage_client
+    import metrics
 
-# Default arguments for the DAG
-default_args = {
-    'owner': 'airflow',
-    'depends_on_past': False,
-    'start_date': datetime(2023, 12, 1),
-    'retries': 1,
-}
+    ti = context['ti']
+    task = ti.task_id if ti.map_index < 0 else f"{ti.task_id}-{ti.map_index}"
+    metrics.export_metrics(run_id=context['run_id'], task=task, bucket=get_storage_client().bucket(GCS_BUCKET))
 
-# Define the DAG
-dag = DAG(
-    'extract_json_to_gcs',
-    default_args=default_args,
-    description='A DAG to extract JSON data from APIs and save to GCS',
-    schedule_interval=None,  # Trigger manually or set a schedule
-    catchup=False,
-)
-
-# Create tasks for each API endpoint
-def create_task(api_name):
-    return PythonOperator(
-        task_id=f'fetch_and_save_{api_name}',
+def build_entity_branch(dag, entity):
+    """
+    Add an independent extract -> plan -> transform shards -> record -> load branch for one entity.
+
+    The transform is mapped over the shards returned by the plan task, so a
+    large entity is spread across workers. If the plan skips an unchanged
+    entity, the load still runs (trigger rule none_failed) to retry a
+    previously failed load, and skips itself when nothing changed.
+
+    Args:
+        dag (DAG): DAG to add the tasks to.
+        entity (str): Key of the API endpoint.
+
+    Returns:
+        tuple: The first and last task of the branch.
+    """
+    extract_task = PythonOperator(
+        task_id=f'fetch_and_save_{entity}',
         python_callable=fetch_and_save_to_gcs,
-        op_kwargs={'api_name': api_name, 'gcs_bucket': GCS_BUCKET},
+        op_kwargs={
+            'api_name': entity,
+            'gcs_bucket': GCS_BUCKET,
+            'concurrency': EXTRACT_CONCURRENCY,
+            'mode': EXTRACT_MODE,
+            'run_ts': '{{ ts_nodash }}',
+        },
+        dag=dag,
+    )
+    plan_task = PythonOperator(
+        task_id=f'plan_transform_{entity}',
+        python_callable=plan_entity_transform,
+        op_kwargs={
+            'gcs_bucket': GCS_BUCKET,
+            'entity': entity,
+            'staging_prefix': STAGING_PREFIX,
+            'mode': EXTRACT_MODE,
+            'run_ts': '{{ ts_nodash }}',
+        },
+        dag=dag,
+    )
+    transform_tasks = PythonOperator.partial(
+        task_id=f'transform_{entity}',
+        python_callable=transform_shard,
+        dag=dag,
+    ).expand(op_kwargs=plan_task.output)
+    record_task = PythonOperator(
+        task_id=f'record_transform_{entity}',
+        python_callable=record_entity_transform,
+        op_kwargs={'gcs_bucket': GCS_BUCKET, 'entity': entity, 'staging_prefix': STAGING_PREFIX},
         dag=dag,
     )
 
-# Create the transformation task
-def create_transformation_task():
-    return PythonOperator(
-        task_id='transform_data',
-        python_callable=perform_transformation_task,
-        op_kwargs={'source_blob': 'raw/products_raw.json', 'target_blob': 'transformed/products_transformed.json'},
+    load_task = PythonOperator(
+        task_id=f'load_{entity}',
+        python_callable=load_entity,
+        op_kwargs={
+            'credentials_path': CREDENTIALS_PATH,
+            'gcs_bucket': GCS_BUCKET,
+            'entity': entity,
+            'load_mode': LOAD_MODE,
+        },
+        trigger_rule='none_failed',
         dag=dag,
     )
 
-# Create the loading task
-def create_loading_task():
-    return PythonOperator(
-        task_id='load_to_bigquery',
-        python_callable=load_csv_to_bigquery,
+    extract_task >> plan_task >> transform_tasks >> record_task >> load_task
+    return extract_task, load_task
+
+def build_fact_branch(dag, fact, branches):
+    """
+    Add a build -> load branch for one fact table, after the extracts of the entities it joins.
+
+    Args:
+        dag (DAG): DAG to add the tasks to.
+        fact (str): Key of endpoints.FACTS.
+        branches (dict): First and last task of each entity branch.
+
+    Returns:
+        None
+    """
+    build_task = PythonOperator(
+        task_id=f'build_{fact}',
+        python_callable=build_fact_table,
+        op_kwargs={'gcs_bucket': GCS_BUCKET, 'fact': fact, 'staging_prefix': STAGING_PREFIX},
+        dag=dag,
+    )
+    load_task = PythonOperator(
+        task_id=f'load_{fact}',
+        python_callable=load_entity,
         op_kwargs={
-            'credentials_path': '/home/malcolmbuluku/data_pipeline/credentials/credentials.json',
-            'table_id': 'savannahinformaticsassessment.savannah_informatics_assessment_data.products_table',
-            'file_path': '/home/malcolmbuluku/data_pipeline/scripts/filtered_products.csv',
+            'credentials_path': CREDENTIALS_PATH,
+            'gcs_bucket': GCS_BUCKET,
+            'entity': fact,
+            'load_mode': LOAD_MODE,
         },
+        trigger_rule='none_failed',
         dag=dag,
     )
+    entities = [FACTS[fact]['source']] + [entity for entity, _, _ in FACTS[fact]['dimensions']]
+    for entity in dict.fromkeys(entities):
+        branches[entity][0] >> build_task
+    build_task >> load_task
 
-# Add tasks to the DAG
-user_task = create_task("users")
-product_task = create_task("products")
-cart_task = create_task("carts")
-transformation_task = create_transformation_task()
-loading_task = create_loading_task()
+def create_etl_dag(dag_id, entities, default_args):
+    """
+    Build the pipeline DAG with one parallel branch per entity.
+
+    Branches share no dependencies, so the run takes as long as the slowest
+    entity rather than the sum of all of them.
 
-# Set task dependencies
-user_task >> product_task >> cart_task >> transformation_task >> loading_task
+    Args:
+        dag_id (str): ID of the DAG.
+        entities (iterable): Keys of the API endpoints to extract, transform and load.
+        default_args (dict): Default task arguments.
+
+    Returns:
+        DAG: The DAG.
+    """
+    dag = DAG(
+        dag_id,
+        default_args=default_args,
+        description='A DAG to extract JSON data from APIs, transform it and load it into BigQuery',
+        schedule_interval=None,  # Trigger manually or set a schedule
+        catchup=False,
+    )
+    branches = {entity: build_entity_branch(dag, entity) for entity in entities}
+    # The tasks below read the full raw dumps, which incremental runs do not refresh
+    if EXTRACT_MODE != "full":
+        return dag
+
+    # The filtered products document only needs the products extract
+    if "products" in branches:
+        transformation_task = PythonOperator(
+            task_id='transform_data',
+            python_callable=perform_transformation_task,
+            op_kwargs={'source_blob': raw_blob_name('products'), 'target_blob': 'transformed/products_transformed.json'},
+            dag=dag,
+        )
+        branches["products"][0] >> transformation_task
+
+    # Fact tables are built once every entity they join has been extracted
+    for fact, config in FACTS.items():
+        if all(entity in branches for entity in [config['source']] + [entity for entity, _, _ in config['dimensions']]):
+            build_fact_branch(dag, fact, branches)
+    return dag
+
+# Default arguments for the DAG
+default_args = {
+    'owner': 'airflow',
+    'depends_on_past': False,
+    'start_date': datetime(2023, 12, 1),
+    'retries': 1,
+    'on_success_callback': export_task_metrics,
+    'on_failure_callback': export_task_metrics,
+}
+
+# Define the DAG
+dag = create_etl_dag('extract_json_to_gcs', API_ENDPOINTS, default_args)
 
 # Additional script functions
 def additional_task_function():
@@ -258,8 +449,10 @@ def upload_logs_to_gcs(logs_path, gcs_bucket):
     Returns:
         None
     """
+    from clients import get_storage_client
+
     try:
-        client = storage.Client()
+        client = get_storage_client()
         bucket = client.bucket(gcs_bucket)
 
         blob_name = "logs/execution_logs.txt"
@@ -0,0 +1,227 @@
+'''
+Shared GCP Client Registry
+
+One storage, BigQuery and BigQuery Storage Write client per process and
+set of credentials, created on first use and reused by every function
+afterwards, so authentication and TLS setup are paid once rather than on
+every call. Credentials are loaded once per key file and shared by all
+client kinds. The HTTP clients run on a session whose connection pool is
+sized by GCP_CLIENT_POOL_SIZE, so concurrent uploads and load jobs keep
+their connections alive instead of opening new ones.
+
+The storage and BigQuery clients accept a ready-made session only through
+their `_http` argument, which google-cloud-core keeps for exactly this
+use but does not promise to keep. It is checked for at construction
+(tested with google-cloud-storage 3.x and google-cloud-bigquery 3.x):
+should a release drop or ignore it, the client is still created, on its
+default connection pool, with a warning rather than an error or a silently
+unpooled client. tests/test_clients.py fails on such a release.
+
+The registry is reset in a forked child, since pooled connections must
+not be shared across processes.
+
+'''
+import inspect
+import logging
+import os
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Pooled HTTP connections per client; match it to the number of threads using a client
+POOL_SIZE = int(os.environ.get("GCP_CLIENT_POOL_SIZE", 32))
+
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+_lock = threading.RLock()
+_clients = {}
+_credentials = {}
+_stats = {}
+_pid = os.getpid()
+
+def _check_fork():
+    """Drop every client inherited from a parent process; the caller holds the lock."""
+    global _pid
+    if os.getpid() != _pid:
+        _clients.clear()
+        _credentials.clear()
+        _stats.clear()
+        _pid = os.getpid()
+
+def load_credentials(credentials_path=None):
+    """
+    Load credentials once per key file.
+
+    Args:
+        credentials_path (str): Path to a service account JSON key file, or None
+            for application default credentials.
+
+    Returns:
+        tuple: (google.auth.credentials.Credentials, project id or None).
+    """
+    with _lock:
+        _check_fork()
+        if credentials_path not in _credentials:
+            if credentials_path is None:
+                import google.auth
+                _credentials[None] = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+            else:
+                from google.oauth2 import service_account
+                credentials = service_account.Credentials.from_service_account_file(
+                    credentials_path, scopes=[CLOUD_PLATFORM_SCOPE],
+                )
+                _credentials[credentials_path] = (credentials, credentials.project_id)
+        return _credentials[credentials_path]
+
+def _authorized_session(credentials, pool_size):
+    """Build an authorized HTTP session with a connection pool of `pool_size`."""
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def pooled_client(client_class, project, credentials, pool_size):
+    """
+    Construct a storage or BigQuery client on a session with a connection pool of `pool_size`.
+
+    Args:
+        client_class (type): storage.Client or bigquery.Client.
+        project (str): Project id, or None.
+        credentials (google.auth.credentials.Credentials): Credentials of the client.
+        pool_size (int): Pooled HTTP connections.
+
+    Returns:
+        The client; on its library's default session if the `_http` argument is gone or ignored.
+    """
+    name = f"{client_class.__module__}.{client_class.__name__}"
+    if "_http" not in inspect.signature(client_class).parameters:
+        logging.warning(f"{name} no longer accepts _http; using its default connection pool")
+        return client_class(project=project, credentials=credentials)
+    session = _authorized_session(credentials, pool_size)
+    client = client_class(project=project, credentials=credentials, _http=session)
+    if getattr(client, "_http", None) is not session:
+        logging.warning(f"{name} ignored the pooled session; using its default connection pool")
+    return client
+
+def _create_storage_client(credentials_path, pool_size):
+    from google.cloud import storage
+    credentials, project = load_credentials(credentials_path)
+    return pooled_client(storage.Client, project, credentials, pool_size)
+
+def _create_bigquery_client(credentials_path, pool_size):
+    from google.cloud import bigquery
+    credentials, project = load_credentials(credentials_path)
+    return pooled_client(bigquery.Client, project, credentials, pool_size)
+
+def _create_write_client(credentials_path, pool_size):
+    try:
+        from google.cloud import bigquery_storage_v1
+    except ImportError as e:
+        raise ImportError("Streaming writes require the 'google-cloud-bigquery-storage' package.") from e
+    credentials, _ = load_credentials(credentials_path)
+    return bigquery_storage_v1.BigQueryWriteClient(credentials=credentials)
+
+# Factory of each client kind
+CLIENT_FACTORIES = {
+    "storage": _create_storage_client,
+    "bigquery": _create_bigquery_client,
+    "bigquery_write": _create_write_client,
+}
+
+def get_client(kind, credentials_path=None, pool_size=None):
+    """
+    Return the process-wide client of a kind, creating it on first use.
+
+    Args:
+        kind (str): "storage", "bigquery" or "bigquery_write".
+        credentials_path (str): Path to a service account JSON key file, or None
+            for application default credentials.
+        pool_size (int): Connection pool size of a newly created client; defaults to POOL_SIZE.
+
+    Returns:
+        The shared client.
+    """
+    key = (kind, credentials_path)
+    with _lock:
+        _check_fork()
+        stats = _stats.setdefault(kind, {"created": 0, "reused": 0})
+        if key in _clients:
+            stats["reused"] += 1
+            return _clients[key]
+        client = CLIENT_FACTORIES[kind](credentials_path, pool_size or POOL_SIZE)
+        _clients[key] = client
+        stats["created"] += 1
+        logging.info(f"Created shared {kind} client"
+                     f"{f' for {credentials_path}' if credentials_path else ''} (pool size {pool_size or POOL_SIZE})")
+        return client
+
+def get_storage_client(credentials_path=None):
+    """
+    Return the shared google.cloud.storage client.
+
+    Args:
+        credentials_path (str): Path to a service account JSON key file, or None for default credentials.
+
+    Returns:
+        storage.Client: The shared client.
+    """
+    return get_client("storage", credentials_path)
+
+def get_bigquery_client(credentials_path=None):
+    """
+    Return the shared google.cloud.bigquery client.
+
+    Args:
+        credentials_path (str): Path to a service account JSON key file, or None for default credentials.
+
+    Returns:
+        bigquery.Client: The shared client.
+    """
+    return get_client("bigquery", credentials_path)
+
+def get_write_client(credentials_path=None):
+    """
+    Return the shared BigQuery Storage Write API client.
+
+    Args:
+        credentials_path (str): Path to a service account JSON key file, or None for default credentials.
+
+    Returns:
+        bigquery_storage_v1.BigQueryWriteClient: The shared client.
+    """
+    return get_client("bigquery_write", credentials_path)
+
+def register_client(kind, client, credentials_path=None):
+    """
+    Install a client for a kind, e.g. an in-memory fake for offline runs.
+
+    Args:
+        kind (str): "storage", "bigquery" or "bigquery_write".
+        client: The client returned by later get_client calls.
+        credentials_path (str): Credentials key the client is registered under.
+    """
+    with _lock:
+        _check_fork()
+        _clients[(kind, credentials_path)] = client
+
+def client_stats():
+    """
+    Report how often each client kind was created and reused in this process.
+
+    Returns:
+        dict: Per kind, `created` and `reused` counts.
+    """
+    with _lock:
+        return {kind: dict(stats) for kind, stats in _stats.items()}
+
+def reset_clients():
+    """Forget every shared client, credential and counter."""
+    with _lock:
+        _clients.clear()
+        _credentials.clear()
+        _stats.clear()
@@ -0,0 +1,196 @@
+'''
+Columnar Output for Transformed Data
+
+Writes the transformed tables as Parquet (snappy or zstd) or Avro with
+explicit typed schemas derived from the entity configuration, so BigQuery loads typed,
+compressed files instead of parsing all-STRING CSV.
+
+Money columns are written as decimal128(38, 9), which BigQuery loads as
+NUMERIC, rounded to its nine decimal places on the way out; the
+transforms themselves compute them as float64.
+
+'''
+import logging
+import os
+import metrics
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from endpoints import ENTITIES, FACTS, output_columns
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Output format of the transform step: "parquet", "avro" or "csv"
+OUTPUT_FORMAT = os.environ.get("TRANSFORM_OUTPUT_FORMAT", "parquet")
+
+# Parquet settings; row groups are the unit BigQuery reads in parallel
+PARQUET_COMPRESSION = os.environ.get("TRANSFORM_PARQUET_COMPRESSION", "zstd")
+DEFAULT_ROW_GROUP_SIZE = 100_000
+
+FILE_EXTENSIONS = {"parquet": ".parquet", "avro": ".avro", "csv": ".csv"}
+
+# Arrow type of each column type used in endpoints.ENTITIES
+ARROW_TYPES = {"int64": pa.int64(), "float64": pa.float64(), "string": pa.string()}
+
+# Money columns of any entity or fact table, stored as exact decimals with NUMERIC's precision and scale
+MONEY_COLUMNS = {"price", "total_cart_value"}
+MONEY_SCALE = 9
+MONEY_TYPE = pa.decimal128(38, MONEY_SCALE)
+
+# Typed schemas of the transform outputs
+ENTITY_SCHEMAS = {
+    entity: pa.schema([
+        (name, MONEY_TYPE if name in MONEY_COLUMNS else ARROW_TYPES[column_type])
+        for name, column_type in output_columns(entity)
+    ])
+    for entity in list(ENTITIES) + list(FACTS)
+}
+
+def output_path(stem, output_format=OUTPUT_FORMAT):
+    """
+    Build an output file name for the given format.
+
+    Args:
+        stem (str): File name without extension (e.g. "users").
+        output_format (str): "parquet", "avro" or "csv".
+
+    Returns:
+        str: The file name, e.g. `users.parquet`.
+    """
+    if output_format not in FILE_EXTENSIONS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    return stem + FILE_EXTENSIONS[output_format]
+
+def to_arrow_table(df, entity):
+    """
+    Convert a DataFrame to an Arrow table with the entity's typed schema.
+
+    Columns missing from the DataFrame are left out of the schema; columns
+    not in the schema are dropped.
+
+    Args:
+        df (pd.DataFrame): Transformed data.
+        entity (str): "users", "products" or "carts".
+
+    Returns:
+        pyarrow.Table: The typed table.
+    """
+    schema = ENTITY_SCHEMAS[entity]
+    missing = [field.name for field in schema if field.name not in df.columns]
+    if missing:
+        logging.warning(f"Columns missing from {entity} data: {missing}")
+        schema = pa.schema([field for field in schema if field.name not in missing])
+    # Money columns are read as float64 and rounded to the decimal scale, which Arrow cannot do from pandas directly
+    float_schema = pa.schema([field.with_type(pa.float64()) if field.type == MONEY_TYPE else field for field in schema])
+    # Drop the pandas metadata blob; BigQuery only needs the Arrow types
+    table = pa.Table.from_pandas(df, schema=float_schema, preserve_index=False).replace_schema_metadata(None)
+    for index, field in enumerate(schema):
+        if field.type == MONEY_TYPE:
+            table = table.set_column(index, field, pc.round(table.column(index), MONEY_SCALE).cast(MONEY_TYPE))
+    return table
+
+def round_money(df):
+    """
+    Round the money columns of a DataFrame to NUMERIC's scale, for text output.
+
+    Args:
+        df (pd.DataFrame): Transformed data.
+
+    Returns:
+        pd.DataFrame: The data, with money columns holding at most MONEY_SCALE decimals.
+    """
+    return df.assign(**{name: df[name].round(MONEY_SCALE) for name in MONEY_COLUMNS if name in df.columns})
+
+def save_to_parquet(df, output_file, entity, compression=PARQUET_COMPRESSION, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Save a DataFrame to a Parquet file with a typed schema.
+
+    Args:
+        df (pd.DataFrame): DataFrame to save.
+        output_file (str): Path to save the Parquet file.
+        entity (str): "users", "products" or "carts".
+        compression (str): Parquet codec, e.g. "zstd" or "snappy".
+        row_group_size (int): Maximum rows per row group.
+    """
+    try:
+        logging.info(f"Saving data to Parquet file '{output_file}' ({compression})")
+        pq.write_table(to_arrow_table(df, entity), output_file, compression=compression, row_group_size=row_group_size)
+        logging.info(f"{len(df)} rows saved to {output_file}")
+    except Exception as e:
+        logging.error(f"Failed to save data to Parquet: {e}")
+        raise
+
+def avro_schema(entity, arrow_schema):
+    """
+    Translate an Arrow schema into an Avro record schema with nullable fields.
+
+    Args:
+        entity (str): Record name.
+        arrow_schema (pyarrow.Schema): Schema to translate.
+
+    Returns:
+        dict: The Avro schema.
+    """
+    avro_types = {
+        pa.int64(): "long",
+        pa.float64(): "double",
+        pa.string(): "string",
+        pa.bool_(): "boolean",
+        MONEY_TYPE: {"type": "bytes", "logicalType": "decimal", "precision": 38, "scale": MONEY_SCALE},
+    }
+    return {
+        "type": "record",
+        "name": entity,
+        "fields": [
+            {"name": field.name, "type": ["null", avro_types[field.type]], "default": None}
+            for field in arrow_schema
+        ],
+    }
+
+def save_to_avro(df, output_file, entity, codec="deflate"):
+    """
+    Save a DataFrame to an Avro file with a typed schema.
+
+    Requires the optional `fastavro` package.
+
+    Args:
+        df (pd.DataFrame): DataFrame to save.
+        output_file (str): Path to save the Avro file.
+        entity (str): "users", "products" or "carts".
+        codec (str): Avro block codec.
+    """
+    try:
+        import fastavro
+    except ImportError as e:
+        raise ImportError("Avro output requires the 'fastavro' package.") from e
+
+    try:
+        logging.info(f"Saving data to Avro file '{output_file}' ({codec})")
+        table = to_arrow_table(df, entity)
+        with open(output_file, "wb") as avro_file:
+            rows = (row for batch in table.to_batches() for row in batch.to_pylist())
+            fastavro.writer(avro_file, avro_schema(entity, table.schema), rows, codec=codec)
+        logging.info(f"{len(df)} rows saved to {output_file}")
+    except Exception as e:
+        logging.error(f"Failed to save data to Avro: {e}")
+        raise
+
+def save_output(df, output_file, entity):
+    """
+    Save a DataFrame in the format implied by the output file's extension.
+
+    Args:
+        df (pd.DataFrame): DataFrame to save.
+        output_file (str): Path ending in .parquet, .avro or .csv.
+        entity (str): "users", "products" or "carts".
+    """
+    with metrics.stage("transform.write_output", entity=entity) as timer:
+        if output_file.endswith(".parquet"):
+            save_to_parquet(df, output_file, entity)
+        elif output_file.endswith(".avro"):
+            save_to_avro(df, output_file, entity)
+        else:
+            logging.info(f"Saving data to CSV file '{output_file}'")
+            round_money(df).to_csv(output_file, index=False)
+        timer.add(rows=len(df), bytes=os.path.getsize(output_file))
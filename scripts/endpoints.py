@@ -0,0 +1,188 @@
+'''
+API Endpoints and Entities of the Pipeline
+
+Every entity the pipeline extracts, transforms and loads is declared
+here as configuration, and one code path executes all of them: the
+extractor pages through `path`, the transform turns records into typed
+rows (transform.transform_records) and the load writes them to `table`.
+Adding an endpoint means adding an entry to ENTITIES. Fact tables joining
+entities for analytics are declared the same way in FACTS.
+
+Kept free of heavy imports so the Airflow DAG can build one branch per
+endpoint at parse time without loading the extraction libraries.
+
+'''
+import os
+
+# Base URL of the dummyjson-style API (override to point at a local stand-in server)
+API_BASE_URL = os.environ.get("API_BASE_URL", "https://dummyjson.com")
+
+# Gzip the raw NDJSON objects; read by the extractor and by every reader of the raw objects
+COMPRESS_RAW = os.environ.get("EXTRACT_COMPRESS_RAW", "false").lower() == "true"
+
+# Products priced at or below this are dropped by the products transform
+PRODUCTS_MIN_PRICE = float(os.environ.get("PRODUCTS_MIN_PRICE", 50))
+
+# Declarative description of each entity:
+#   path: API path under API_BASE_URL
+#   record_key: key of the record list in each API page
+#   record_path: key of a nested list whose items become the rows (e.g. cart lines), or None for one row per record
+#   parent_columns: (name, path, type) taken from each record and repeated on each of its rows
+#   columns: (name, path, type) of each row; dotted paths reach into nested objects and "a|b" falls back to b
+#   numeric, where: coercions and conditions on raw fields, applied while parsing (see record_spec.py)
+#   required: rows with no value in any of these columns are dropped
+#   derived: (name, operation, source columns) computed from the extracted columns (see transform.DERIVED_OPERATIONS)
+#   output_stem, table, key_columns: transform output file stem, BigQuery table name and primary key
+# Types are "int64", "float64" or "string"; output columns are the parent columns, the columns and
+# the derived columns not starting with "_", in that order.
+ENTITIES = {
+    "users": {
+        "path": "users",
+        "record_key": "users",
+        "record_path": None,
+        "parent_columns": [],
+        "columns": [
+            ("id", "id", "int64"),
+            ("first_name", "firstName", "string"),
+            ("last_name", "lastName", "string"),
+            ("gender", "gender", "string"),
+            ("age", "age", "int64"),
+            ("street", "address.address", "string"),
+            ("city", "address.city", "string"),
+            ("postal_code", "address.postalCode", "string"),
+        ],
+        "numeric": [],
+        "where": [],
+        "required": ["id"],
+        "derived": [],
+        "output_stem": "users",
+        "table": "users_table",
+        "key_columns": ["id"],
+    },
+    "products": {
+        "path": "products",
+        "record_key": "products",
+        "record_path": None,
+        "parent_columns": [],
+        "columns": [
+            ("id", "id", "int64"),
+            ("title", "title", "string"),
+            ("category", "category", "string"),
+            ("brand", "brand", "string"),
+            ("price", "price", "float64"),
+        ],
+        "numeric": ["price"],
+        "where": [("price", ">", PRODUCTS_MIN_PRICE)],
+        "required": ["id", "price"],
+        "derived": [],
+        "output_stem": "products",
+        "table": "products_table",
+        "key_columns": ["id"],
+    },
+    "carts": {
+        "path": "carts",
+        "record_key": "carts",
+        "record_path": "products",
+        "parent_columns": [
+            ("cart_id", "cart_id|id", "int64"),
+            ("user_id", "user_id|userId", "int64"),
+        ],
+        "columns": [
+            ("product_id", "id", "int64"),
+            ("name", "title", "string"),
+            ("quantity", "quantity", "int64"),
+            ("price", "price", "float64"),
+        ],
+        "numeric": [],
+        "where": [],
+        "required": ["cart_id", "user_id", "product_id", "quantity", "price"],
+        "derived": [
+            ("_line_total", "multiply", ["quantity", "price"]),
+            ("total_cart_value", "record_sum", ["_line_total"]),
+        ],
+        "output_stem": "cart",
+        "table": "carts_table",
+        "key_columns": ["cart_id", "product_id"],
+    },
+}
+
+# How fact rows whose key has no match in a dimension are handled: "keep" (null attributes), "drop" or "fail"
+FACT_MISSING_KEYS = os.environ.get("FACT_MISSING_KEYS", "keep")
+
+# Join-ready fact tables: the rows of a source entity enriched with attributes of dimension entities (see facts.py)
+#   source: entity whose transformed rows are enriched
+#   dimensions: (dimension entity, fact column holding its key, [(output name, dimension column)]);
+#       a dimension is indexed on its first key column and its columns are read from every raw record,
+#       regardless of the entity's own filters
+#   missing_keys: see FACT_MISSING_KEYS
+#   output_stem, table, key_columns: as for ENTITIES
+# Output columns are the source's output columns followed by the dimension attributes.
+FACTS = {
+    "cart_lines": {
+        "source": "carts",
+        "dimensions": [
+            ("users", "user_id", [("user_city", "city"), ("user_gender", "gender"), ("user_age", "age")]),
+            ("products", "product_id", [("product_category", "category"), ("product_brand", "brand")]),
+        ],
+        "missing_keys": FACT_MISSING_KEYS,
+        "output_stem": "cart_lines",
+        "table": "cart_lines_fact",
+        "key_columns": ["cart_id", "product_id"],
+    },
+}
+
+# Define the API endpoints
+API_ENDPOINTS = {entity: f"{API_BASE_URL}/{config['path']}" for entity, config in ENTITIES.items()}
+
+# BigQuery table name of every entity and fact table
+TABLES = {name: config["table"] for name, config in list(ENTITIES.items()) + list(FACTS.items())}
+
+def output_columns(entity):
+    """
+    List the output columns of an entity or fact table, in order, with their types.
+
+    Args:
+        entity (str): Key of ENTITIES or FACTS.
+
+    Returns:
+        list: (name, type) tuples.
+    """
+    if entity in FACTS:
+        columns = output_columns(FACTS[entity]["source"])
+        for dimension, _, attributes in FACTS[entity]["dimensions"]:
+            types = dict(output_columns(dimension))
+            columns += [(name, types[column]) for name, column in attributes]
+        return columns
+    config = ENTITIES[entity]
+    columns = [(name, column_type) for name, _, column_type in config["parent_columns"] + config["columns"]]
+    columns += [(name, "float64") for name, _, _ in config["derived"] if not name.startswith("_")]
+    return columns
+
+def raw_blob_name(api_name, compress=None):
+    """
+    Build the GCS object name of an endpoint's raw NDJSON dump.
+
+    Args:
+        api_name (str): The key of the API endpoint (e.g. "users").
+        compress (bool): Whether the object is gzip-compressed; defaults to COMPRESS_RAW.
+
+    Returns:
+        str: The object name, e.g. `raw/users_raw.ndjson`.
+    """
+    compress = COMPRESS_RAW if compress is None else compress
+    return f"raw/{api_name}_raw.ndjson" + (".gz" if compress else "")
+
+def delta_blob_name(api_name, run_ts, compress=None):
+    """
+    Build the GCS object name of an incremental extraction's delta.
+
+    Args:
+        api_name (str): The key of the API endpoint (e.g. "users").
+        run_ts (str): Run timestamp, e.g. `20240101T000000`.
+        compress (bool): Whether the object is gzip-compressed; defaults to COMPRESS_RAW.
+
+    Returns:
+        str: The object name, e.g. `raw/users/delta_20240101T000000.ndjson`.
+    """
+    compress = COMPRESS_RAW if compress is None else compress
+    return f"raw/{api_name}/delta_{run_ts}.ndjson" + (".gz" if compress else "")
@@ -2,85 +2,362 @@
 Extracting JSON Data and Saving on GCS
 
 '''
+import os
 import requests
 import json
 import logging
-from google.cloud import storage
+import metrics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from clients import get_storage_client
+from datetime import datetime, timezone
+from endpoints import API_ENDPOINTS, ENTITIES
+from ndjson_io import COMPRESS_RAW, NDJSONBlobWriter, delta_blob_name, raw_blob_name
+from response_cache import DEFAULT_MAX_BYTES, DEFAULT_TTL_SECONDS, DiskResponseCache
+from watermark import load_watermark, save_watermark, select_changes
+from retry import RetryingAdapter, TokenBucket
 from requests.exceptions import RequestException, HTTPError, Timeout
 
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Define the API endpoints
-API_ENDPOINTS = {
-    "users": "https://dummyjson.com/users",
-    "products": "https://dummyjson.com/products",
-    "carts": "https://dummyjson.com/carts"
-}
+# Pagination settings: records requested per page and number of pages fetched in parallel
+DEFAULT_PAGE_SIZE = int(os.environ.get("EXTRACT_PAGE_SIZE", 100))
+DEFAULT_CONCURRENCY = int(os.environ.get("EXTRACT_CONCURRENCY", 8))
+REQUEST_TIMEOUT = 10
 
-def fetch_and_save_to_gcs(api_name, gcs_bucket):
+# Upstream quota and per-request retry policy shared by all pages of an endpoint
+RATE_LIMIT_PER_SECOND = float(os.environ.get("EXTRACT_RATE_LIMIT", 20))
+RATE_LIMIT_BURST = int(os.environ.get("EXTRACT_RATE_BURST", 20))
+MAX_RETRIES = int(os.environ.get("EXTRACT_MAX_RETRIES", 5))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+# A page whose Retry-After asks for a longer wait than this fails the extraction rather than retrying early
+MAX_RETRY_AFTER_SECONDS = float(os.environ.get("EXTRACT_MAX_RETRY_AFTER", 300))
+
+# Opt-in: upload raw objects as parallel composite parts of this size (e.g. transfer.PART_SIZE), holding
+# up to (TRANSFER_WORKERS + 1) parts in memory; 0 uses a single resumable upload streaming in 8 MiB chunks
+UPLOAD_PART_SIZE = int(os.environ.get("EXTRACT_UPLOAD_PART_SIZE", 0))
+
+# Directory of the on-disk HTTP response cache; unset disables conditional requests
+CACHE_DIR = os.environ.get("EXTRACT_CACHE_DIR")
+CACHE_MAX_BYTES = int(os.environ.get("EXTRACT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+CACHE_TTL_SECONDS = int(os.environ.get("EXTRACT_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+
+# Extraction mode: "full" rewrites the raw dump, "changes"/"append" write deltas (see fetch_incremental_to_gcs)
+EXTRACT_MODE = os.environ.get("EXTRACT_MODE", "full")
+
+def create_session(pool_size=DEFAULT_CONCURRENCY, rate_limit=RATE_LIMIT_PER_SECOND, max_retries=MAX_RETRIES):
+    """
+    Create a keep-alive HTTP session whose connection pool matches the worker count.
+
+    Every request made through the session is rate limited by a shared token
+    bucket and retried with exponential backoff on transient failures.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host.
+        rate_limit (float): Requests per second across all workers; 0 disables limiting.
+        max_retries (int): Retries per request after the first attempt.
+
+    Returns:
+        requests.Session: Session shared by all page requests.
+    """
+    session = requests.Session()
+    rate_limiter = TokenBucket(rate_limit, RATE_LIMIT_BURST) if rate_limit else None
+    adapter = RetryingAdapter(
+        rate_limiter=rate_limiter,
+        max_retries=max_retries,
+        base_delay=BACKOFF_BASE_SECONDS,
+        max_delay=BACKOFF_MAX_SECONDS,
+        max_retry_after=MAX_RETRY_AFTER_SECONDS,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_page(session, url, skip, limit, cache=None):
+    """
+    Fetch a single page of a dummyjson-style endpoint.
+
+    Args:
+        session (requests.Session): Session used for the request.
+        url (str): Endpoint URL.
+        skip (int): Number of records to skip.
+        limit (int): Maximum number of records to return.
+        cache (DiskResponseCache): Optional response cache used for conditional requests.
+
+    Returns:
+        dict: The page envelope (records plus `total`, `skip` and `limit`).
+    """
+    params = {"skip": skip, "limit": limit}
+    metrics.increment("extract.pages", endpoint=url)
+    if cache is not None:
+        return cache.get_json(session, url, params, REQUEST_TIMEOUT)
+    response = session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()  # Will raise an HTTPError for bad responses (4xx, 5xx)
+    metrics.increment("extract.response_bytes", len(response.content), endpoint=url)
+    return response.json()
+
+def iter_record_pages(url, record_key, session, page_size=DEFAULT_PAGE_SIZE, concurrency=DEFAULT_CONCURRENCY, start=0,
+                      cache=None):
+    """
+    Yield the records of a paginated endpoint one page at a time, in order.
+
+    The first page is fetched on its own to read `total`; the remaining
+    pages are fetched concurrently, with at most `concurrency * 2` pages
+    in flight so memory stays bounded on large pulls.
+
+    Args:
+        url (str): Endpoint URL.
+        record_key (str): Key of the record list in the envelope (e.g. "users").
+        session (requests.Session): Shared keep-alive session.
+        page_size (int): Records requested per page.
+        concurrency (int): Number of pages fetched in parallel.
+        start (int): Offset of the first record to fetch.
+        cache (DiskResponseCache): Optional response cache used for conditional requests.
+
+    Yields:
+        list: The records of each page.
+    """
+    first_page = fetch_page(session, url, start, page_size, cache)
+    records = first_page.get(record_key, [])
+    total = first_page.get("total", len(records))
+    yield records
+
+    # The server may cap the page size, so step by what it actually returned
+    step = len(records)
+    if step == 0 or start + step >= total:
+        return
+    offsets = range(start + step, total, step)
+    logging.info(f"Fetching {len(offsets)} more pages of {step} records from {url} ({total} total)")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        for skip in offsets:
+            pending.append(executor.submit(fetch_page, session, url, skip, step, cache))
+            if len(pending) >= concurrency * 2:
+                yield pending.popleft().result().get(record_key, [])
+        while pending:
+            yield pending.popleft().result().get(record_key, [])
+
+def fetch_all_records(api_name, page_size=DEFAULT_PAGE_SIZE, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Fetch every record of an API endpoint, following the `total`/`skip`/`limit` envelope.
+
+    Args:
+        api_name (str): The key of the API endpoint to fetch data from.
+        page_size (int): Records requested per page.
+        concurrency (int): Number of pages fetched in parallel.
+
+    Returns:
+        dict: Envelope with all records under `api_name`, plus `total`, `skip` and `limit`.
+    """
+    records = []
+    record_key = ENTITIES[api_name]["record_key"]
+    with create_session(concurrency) as session:
+        for page in iter_record_pages(API_ENDPOINTS[api_name], record_key, session, page_size, concurrency):
+            records.extend(page)
+    return {api_name: records, "total": len(records), "skip": 0, "limit": len(records)}
+
+def open_cache(cache_dir):
+    """
+    Open the on-disk response cache, if one is configured.
+
+    Args:
+        cache_dir (str): Cache directory, or None to disable caching.
+
+    Returns:
+        DiskResponseCache: The cache, or None.
     """
-    Fetch data from an API endpoint and save it as a separate object in a GCS bucket.
+    if not cache_dir:
+        return None
+    return DiskResponseCache(os.path.join(cache_dir, "http"), CACHE_MAX_BYTES, CACHE_TTL_SECONDS)
+
+def fetch_and_save_to_gcs(api_name, gcs_bucket, page_size=DEFAULT_PAGE_SIZE, concurrency=DEFAULT_CONCURRENCY,
+                          compress=COMPRESS_RAW, cache_dir=CACHE_DIR):
+    """
+    Fetch data from an API endpoint and stream it as NDJSON to a separate object in a GCS bucket.
+
+    Pages are written through a resumable upload as they arrive, so only
+    the pages in flight are ever held in memory.
+
+    With a response cache, every page is first revalidated with conditional
+    requests; if upstream reports no change and the raw object exists, the
+    upload is skipped entirely, otherwise the pages are streamed to GCS from
+    the freshly filled cache. New validators are staged and only committed
+    to the cache once the upload has succeeded, so a failed upload is
+    retried in full by the next run instead of being reported unchanged.
     
     Args:
         api_name (str): The key of the API endpoint to fetch data from.
         gcs_bucket (str): Name of the GCS bucket to upload the file to.
+        page_size (int): Records requested per page.
+        concurrency (int): Number of pages fetched in parallel.
+        compress (bool): Gzip the NDJSON object.
+        cache_dir (str): Directory of the on-disk response cache, or None to disable it.
     
     Returns:
-        dict: The fetched data, or None in case of failure.
+        dict: Summary with the object name, record/byte counts and an `unchanged` flag,
+            or None in case of failure.
     """
+    blob_name = raw_blob_name(api_name, compress)
+    url = API_ENDPOINTS[api_name]
+    record_key = ENTITIES[api_name]["record_key"]
+    cache = None
     try:
-        # Fetch data from the API
-        logging.info(f"Fetching data from API endpoint: {API_ENDPOINTS[api_name]}")
-        response = requests.get(API_ENDPOINTS[api_name], timeout=10)
-        response.raise_for_status()  # Will raise an HTTPError for bad responses (4xx, 5xx)
-        data = response.json()
+        cache = open_cache(cache_dir)
+        client = get_storage_client()
+        bucket = client.bucket(gcs_bucket)
+        logging.info(f"Fetching data from API endpoint: {url}")
+        with create_session(concurrency) as session:
+            if cache is not None:
+                # Revalidate every page; bodies land in the cache, not in memory
+                cache.stage()
+                pages = iter_record_pages(url, record_key, session, page_size, concurrency, cache=cache)
+                revalidated = sum(len(page) for page in pages)
+                if not cache.changed and bucket.get_blob(blob_name) is not None:
+                    cache.commit()
+                    logging.info(f"{api_name} is unchanged upstream ({revalidated} records); skipping upload.")
+                    return {"blob_name": blob_name, "records": revalidated, "bytes": 0, "unchanged": True}
+                cache.offline = True
+
+            # Stream every page straight into the upload
+            writer = NDJSONBlobWriter(bucket.blob(blob_name), compress=compress, part_size=UPLOAD_PART_SIZE)
+            with metrics.stage("extract.fetch_and_save", entity=api_name) as timer, writer:
+                for page in iter_record_pages(url, record_key, session, page_size, concurrency, cache=cache):
+                    writer.write_records(page)
+                    timer.add(rows=len(page))
+                timer.add(bytes=writer.bytes_written)
+        if cache is not None:
+            cache.commit()
+        logging.info(f"Data uploaded to GCS bucket '{gcs_bucket}' at '{blob_name}'")
     except Timeout:
-        logging.error(f"Request to {API_ENDPOINTS[api_name]} timed out.")
+        logging.error(f"Request to {url} timed out.")
         return None
     except HTTPError as http_err:
-        logging.error(f"HTTP error occurred while accessing {API_ENDPOINTS[api_name]}: {http_err}")
+        logging.error(f"HTTP error occurred while accessing {url}: {http_err}")
         return None
     except RequestException as req_err:
         logging.error(f"Request error occurred: {req_err}")
         return None
     except json.JSONDecodeError:
-        logging.error(f"Failed to decode JSON response from {API_ENDPOINTS[api_name]}.")
+        logging.error(f"Failed to decode JSON response from {url}.")
         return None
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        logging.error(f"Error uploading data to GCS: {e}")
         return None
+    finally:
+        # Validators of a failed run are dropped, so the next run fetches the pages again
+        if cache is not None:
+            cache.discard()
+
+    return {"blob_name": blob_name, "records": writer.records_written, "bytes": writer.bytes_written, "unchanged": False}
+
+def fetch_incremental_to_gcs(api_name, gcs_bucket, run_ts=None, mode="changes", page_size=DEFAULT_PAGE_SIZE,
+                             concurrency=DEFAULT_CONCURRENCY, compress=COMPRESS_RAW, cache_dir=CACHE_DIR):
+    """
+    Fetch only new or changed records of an endpoint and stream them to a delta object in GCS.
+
+    Two modes are supported:
+      - "changes": every page is fetched and each record's content hash is
+        compared with the watermark, so updates are detected as well as inserts.
+      - "append": only pages past the previously seen offset are fetched, which
+        saves API calls for append-only endpoints but does not see updates.
+
+    The watermark, and the validators of a response cache, are only saved
+    after the delta upload succeeds, so a failed run is simply retried from
+    the previous watermark.
 
-    # Convert data to a JSON string
-    data_json = json.dumps(data, indent=4)
+    Args:
+        api_name (str): The key of the API endpoint to fetch data from.
+        gcs_bucket (str): Name of the GCS bucket holding deltas and watermarks.
+        run_ts (str): Run timestamp used in the delta object name; defaults to now (UTC).
+        mode (str): "changes" or "append".
+        page_size (int): Records requested per page.
+        concurrency (int): Number of pages fetched in parallel.
+        compress (bool): Gzip the NDJSON delta.
+        cache_dir (str): Directory of the on-disk response cache, or None to disable it.
 
-    # Initialize GCS client
+    Returns:
+        dict: Summary with the delta object name and record counts, or None in case of failure.
+    """
+    if mode not in ("changes", "append"):
+        raise ValueError(f"Unknown incremental mode: {mode}")
+    run_ts = run_ts or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    blob_name = delta_blob_name(api_name, run_ts, compress)
+    record_key = ENTITIES[api_name]["record_key"]
+    cache = None
     try:
-        client = storage.Client()
+        client = get_storage_client()
         bucket = client.bucket(gcs_bucket)
+        watermark = load_watermark(bucket, api_name)
+        cache = open_cache(cache_dir)
+        if cache is not None:
+            cache.stage()
+        start = watermark["offset"] if mode == "append" else 0
+        scanned = 0
 
-        # Upload data to GCS
-        blob_name = f"raw/{api_name}_raw.json"
-        blob = bucket.blob(blob_name)
-        blob.upload_from_string(data_json, content_type="application/json")
-        logging.info(f"Data uploaded to GCS bucket '{gcs_bucket}' at '{blob_name}'")
+        logging.info(f"Fetching {mode} from API endpoint {API_ENDPOINTS[api_name]} starting at offset {start}")
+        writer = NDJSONBlobWriter(bucket.blob(blob_name), compress=compress, part_size=UPLOAD_PART_SIZE)
+        with metrics.stage("extract.fetch_incremental", entity=api_name) as timer, \
+                create_session(concurrency) as session, writer:
+            pages = iter_record_pages(API_ENDPOINTS[api_name], record_key, session, page_size, concurrency, start, cache)
+            for page in pages:
+                scanned += len(page)
+                writer.write_records(select_changes(page, watermark))
+            timer.add(rows=scanned, bytes=writer.bytes_written)
+
+        watermark["offset"] = start + scanned
+        watermark["updated_at"] = run_ts
+        save_watermark(bucket, api_name, watermark)
+        if cache is not None:
+            cache.commit()
+        logging.info(f"{writer.records_written} of {scanned} scanned {api_name} records were new or changed.")
+    except Timeout:
+        logging.error(f"Request to {API_ENDPOINTS[api_name]} timed out.")
+        return None
+    except HTTPError as http_err:
+        logging.error(f"HTTP error occurred while accessing {API_ENDPOINTS[api_name]}: {http_err}")
+        return None
+    except RequestException as req_err:
+        logging.error(f"Request error occurred: {req_err}")
+        return None
+    except json.JSONDecodeError:
+        logging.error(f"Failed to decode JSON response from {API_ENDPOINTS[api_name]}.")
+        return None
     except Exception as e:
-        logging.error(f"Error uploading data to GCS: {e}")
+        logging.error(f"Error during incremental extraction of {api_name}: {e}")
         return None
+    finally:
+        if cache is not None:
+            cache.discard()
 
-    return data
+    # No object is written when nothing changed
+    return {
+        "blob_name": blob_name if writer.records_written else None,
+        "records": writer.records_written,
+        "scanned": scanned,
+    }
 
 if __name__ == "__main__":
     GCS_BUCKET = "savannah_informatics_assesment" 
 
     # Loop through all API endpoints and save data separately
     for api_name in API_ENDPOINTS.keys():
-        result = fetch_and_save_to_gcs(api_name, GCS_BUCKET)
+        if EXTRACT_MODE == "full":
+            result = fetch_and_save_to_gcs(api_name, GCS_BUCKET)
+        else:
+            result = fetch_incremental_to_gcs(api_name, GCS_BUCKET, mode=EXTRACT_MODE)
+
         if result is None:
             logging.error(f"Failed to process data for {api_name}.")
         else:
             logging.info(f"Successfully processed data for {api_name}.")
 
+    metrics.export_metrics(task="extract")
+
 
 
 
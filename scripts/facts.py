@@ -0,0 +1,228 @@
+'''
+Join-ready Fact Tables
+
+Builds the fact tables declared in endpoints.FACTS: the transformed rows
+of a source entity (cart lines) enriched with attributes of dimension
+entities (the user's city, gender and age, the product's category and
+brand), so dashboards read one table instead of joining users and
+products in BigQuery on every query.
+
+Each dimension is read once from its raw object into a hash index on its
+key. The source is then streamed through its transform batch by batch
+and every batch is joined against the indexes in memory, so the source
+is read in a single pass and peak memory is the dimension attributes
+plus one batch.
+
+With a staging prefix, the output is uploaded next to the entity outputs
+and recorded like an entity's transform, so the DAG loads it with the
+same load task and skips it when its inputs and code are unchanged.
+
+'''
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+import fingerprint
+import metrics
+from clients import get_storage_client
+from columnar import OUTPUT_FORMAT, output_path
+from endpoints import ENTITIES, FACTS
+from ndjson_io import raw_blob_name
+from projection import extract_columns
+from record_spec import SPECS
+from run_transforms import record_transform, staged_uri_pattern
+from streaming_transform import DEFAULT_BATCH_SIZE, DOWNLOAD_CHUNK_SIZE, BatchOutputWriter, iter_batches, iter_raw_records
+from transform import transform_records
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MISSING_KEY_MODES = ("keep", "drop", "fail")
+
+def column_path(entity, column):
+    """Return the raw record path of an entity's output column."""
+    for name, path, _ in ENTITIES[entity]["parent_columns"] + ENTITIES[entity]["columns"]:
+        if name == column:
+            return path
+    raise KeyError(f"{entity} has no column '{column}'.")
+
+def build_dimension_index(bucket_name, entity, columns, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Read a dimension's raw object into a hash index on its key.
+
+    Every raw record is indexed, regardless of the entity's own filters, so
+    that facts referencing e.g. a cheap product are still enriched. When a
+    key appears more than once, its last record wins.
+
+    Args:
+        bucket_name (str): Name of the GCS bucket holding the raw object.
+        entity (str): Dimension entity, a key of endpoints.ENTITIES.
+        columns (list): Output columns of the entity to index.
+        batch_size (int): Records extracted per batch.
+
+    Returns:
+        dict: `entity`, `index` (pd.Index of the keys) and `attributes` (pd.DataFrame
+            aligned with the index, plus a trailing all-null row for missing keys).
+    """
+    key = ENTITIES[entity]["key_columns"][0]
+    names = [key] + [column for column in columns if column != key]
+    paths = [column_path(entity, name) for name in names]
+    blob_name = raw_blob_name(entity)
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+
+    with metrics.stage("transform.index", entity=entity) as timer:
+        chunks = []
+        with blob.open("rb", chunk_size=DOWNLOAD_CHUNK_SIZE) as stream:
+            for batch in iter_batches(iter_raw_records(stream, blob_name, ENTITIES[entity]["record_key"]), batch_size):
+                chunks.append(extract_columns(batch, paths))
+        values = [np.concatenate([chunk[number] for chunk in chunks]) if chunks else np.empty(0, dtype=object)
+                  for number in range(len(names))]
+        df = pd.DataFrame(dict(zip(names, values))).infer_objects()
+        df = df[df[key].notna()].drop_duplicates(key, keep="last")
+        # The trailing null row is what a missing key (position -1) resolves to
+        attributes = pd.concat([df[columns], pd.DataFrame({column: [None] for column in columns})], ignore_index=True)
+        timer.add(rows=len(df))
+    logging.info(f"Indexed {len(df)} {entity} on {key}")
+    return {"entity": entity, "index": pd.Index(df[key]), "attributes": attributes.convert_dtypes()}
+
+def join_dimension(df, dimension, key_column, attributes, missing_keys="keep", fact=None):
+    """
+    Add a dimension's attributes to fact rows by hash lookup of their key.
+
+    Args:
+        df (pd.DataFrame): Fact rows.
+        dimension (dict): Index built by build_dimension_index.
+        key_column (str): Column of `df` holding the dimension key.
+        attributes (list): (output name, dimension column) pairs to add.
+        missing_keys (str): "keep" rows without a match with null attributes, "drop" them,
+            or "fail" the batch.
+        fact (str): Fact table name, used in metrics and messages.
+
+    Returns:
+        pd.DataFrame: The rows with the attributes appended.
+    """
+    if missing_keys not in MISSING_KEY_MODES:
+        raise ValueError(f"Unknown missing key handling: {missing_keys}")
+    positions = dimension["index"].get_indexer(df[key_column])
+    missing = positions < 0
+    missed = int(missing.sum())
+    if missed:
+        metrics.increment("transform.missing_keys", missed, fact=fact, dimension=dimension["entity"])
+        sample = df[key_column][missing].unique()[:5].tolist()
+        if missing_keys == "fail":
+            raise ValueError(f"{missed} {fact} rows have a {key_column} missing from {dimension['entity']}, e.g. {sample}")
+        if missing_keys == "drop":
+            logging.warning(f"Dropped {missed} {fact} rows with a {key_column} missing from {dimension['entity']}, e.g. {sample}")
+            df = df[~missing].reset_index(drop=True)
+            positions = positions[~missing]
+    matched = dimension["attributes"].take(positions)
+    # Extension arrays keep integer attributes integer where a key is missing
+    return df.assign(**{name: matched[column].array for name, column in attributes})
+
+def build_fact(bucket_name, fact, output_file, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Build a fact table in a single streaming pass over its source.
+
+    Args:
+        bucket_name (str): Name of the GCS bucket holding the raw objects.
+        fact (str): Key of endpoints.FACTS.
+        output_file (str): Path of the .parquet, .avro or .csv output.
+        batch_size (int): Source records transformed and joined per batch.
+
+    Returns:
+        int: Number of rows written.
+    """
+    config = FACTS[fact]
+    source = config["source"]
+    # Each dimension is indexed once, on every column any of its joins needs
+    columns = {}
+    for entity, _, attributes in config["dimensions"]:
+        columns[entity] = list(dict.fromkeys(columns.get(entity, []) + [column for _, column in attributes]))
+    dimensions = {entity: build_dimension_index(bucket_name, entity, entity_columns, batch_size)
+                  for entity, entity_columns in columns.items()}
+
+    blob_name = raw_blob_name(source)
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    logging.info(f"Building {fact} from gs://{bucket_name}/{blob_name} in batches of {batch_size}")
+    with metrics.stage("transform.build_fact", entity=fact) as timer, \
+            blob.open("rb", chunk_size=DOWNLOAD_CHUNK_SIZE) as stream, BatchOutputWriter(output_file, fact) as writer:
+        records = iter_raw_records(stream, blob_name, ENTITIES[source]["record_key"], SPECS[source])
+        for batch in iter_batches(records, batch_size):
+            df = transform_records(batch, source)
+            for entity, key_column, attributes in config["dimensions"]:
+                df = join_dimension(df, dimensions[entity], key_column, attributes, config["missing_keys"], fact)
+            writer.write(df)
+        timer.add(rows=writer.rows_written)
+
+    logging.info(f"{fact}: wrote {writer.rows_written} rows to {output_file}")
+    return writer.rows_written
+
+def fact_inputs(fact):
+    """Return the raw objects a fact table is built from, source first."""
+    config = FACTS[fact]
+    entities = [config["source"]] + [entity for entity, _, _ in config["dimensions"]]
+    return [raw_blob_name(entity) for entity in dict.fromkeys(entities)]
+
+def run_fact(bucket_name, fact, staging_prefix, output_dir=".", output_format=OUTPUT_FORMAT, batch_size=DEFAULT_BATCH_SIZE,
+             skip_unchanged=True):
+    """
+    Build a fact table, stage it in GCS and record it like an entity's transform.
+
+    Args:
+        bucket_name (str): Name of the GCS bucket holding the raw objects, staged outputs and state.
+        fact (str): Key of endpoints.FACTS.
+        staging_prefix (str): Prefix the output is uploaded under.
+        output_dir (str): Local directory of the output before upload.
+        output_format (str): "parquet", "avro" or "csv".
+        batch_size (int): Source records transformed and joined per batch.
+        skip_unchanged (bool): Reuse the last staged output if the raw inputs and code are unchanged.
+
+    Returns:
+        dict: `rows`, `source_uri`, `seconds` and `skipped`.
+    """
+    started = time.perf_counter()
+    client = get_storage_client()
+    bucket = client.bucket(bucket_name)
+    inputs = []
+    for blob_name in fact_inputs(fact):
+        blob = bucket.get_blob(blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"The object '{blob_name}' does not exist in the bucket '{bucket_name}'.")
+        inputs.append(fingerprint.blob_fingerprint(blob))
+    fact_fingerprint = fingerprint.compute_fingerprint(
+        inputs, fingerprint.code_version(fingerprint.FACT_MODULES),
+        {"output_format": output_format, "missing_keys": FACTS[fact]["missing_keys"]},
+    )
+    state = fingerprint.load_stage_state(bucket, "transform", fact)
+    if skip_unchanged and fingerprint.is_unchanged(state, fact_fingerprint) \
+            and fingerprint.uri_fingerprints(client, state["source_uri"]):
+        logging.info(f"{fact}: raw data and code unchanged; reusing {state['source_uri']}")
+        return {"rows": state["rows"], "source_uri": state["source_uri"], "seconds": 0.0, "skipped": True}
+
+    output_file = output_path(os.path.join(output_dir, FACTS[fact]["output_stem"]), output_format)
+    rows = build_fact(bucket_name, fact, output_file, batch_size)
+    outputs = []
+    if rows:
+        staged_blob_name = f"{staging_prefix}/{fact}/{os.path.basename(output_file)}"
+        with metrics.stage("transform.upload", entity=fact) as timer:
+            bucket.blob(staged_blob_name).upload_from_filename(output_file)
+            timer.add(rows=rows, bytes=os.path.getsize(output_file))
+        outputs.append(f"gs://{bucket_name}/{staged_blob_name}")
+    if os.path.exists(output_file):
+        os.remove(output_file)
+
+    source_uri = staged_uri_pattern(bucket_name, staging_prefix, fact, output_format)
+    record_transform(bucket, fact, fact_fingerprint, source_uri, rows, outputs)
+    return {"rows": rows, "source_uri": source_uri, "seconds": time.perf_counter() - started, "skipped": False}
+
+if __name__ == "__main__":
+    bucket_name = "savannah_informatics_assesment"
+
+    for fact, config in FACTS.items():
+        try:
+            build_fact(bucket_name, fact, output_path(config["output_stem"]))
+        except Exception as e:
+            logging.error(f"Build of {fact} failed: {e}")
+
+    metrics.export_metrics(task="facts")
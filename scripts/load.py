@@ -2,16 +2,33 @@
 Loading Data to BigQuery
 The final step in the ETL pipeline is to load the transformed data into BigQuery.
 The load_csv_to_bigquery function loads a CSV file into a BigQuery table.
-It first infers the schema from the CSV file header and creates the table if it doesn't exist.
+It takes the column types declared for the table in endpoints.py (inferring a typed
+schema from a sample of the CSV rows only for other tables) and creates the table if it doesn't exist.
 The function then loads the CSV file into the table using the BigQuery client library.
+The load_columnar_to_bigquery function loads typed Parquet or Avro output of the
+transform step instead, letting BigQuery take column types from the file itself.
+The load_tables_to_bigquery function loads several tables at once with one shared
+client, so the load stage takes as long as the slowest job rather than their sum.
+Sources may be GCS URIs (with wildcards over many shards), which BigQuery ingests
+server-side without the data passing through the loading process.
+The stream_to_bigquery function appends rows through the Storage Write API instead
+of a load job, trading load job startup latency and quotas for seconds-level freshness.
+The upsert_to_bigquery function loads only changed rows into a staging table and
+MERGEs them into the target on its primary key instead of rewriting the table.
 '''
 
 
-import csv
 import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import bigquery
-from google.oauth2 import service_account
 from google.api_core.exceptions import GoogleAPIError, NotFound
+import fingerprint
+import metrics
+from clients import get_bigquery_client, get_storage_client
+from columnar import MONEY_COLUMNS
+from endpoints import ENTITIES, FACTS, TABLES, output_columns
+from schema_inference import SAMPLE_ROWS, infer_schema_from_file, infer_schema_from_gcs
 
 # Configure logging
 logging.basicConfig(
@@ -19,28 +36,59 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def infer_schema_from_csv(file_path):
+# BigQuery type of each column type used in endpoints.ENTITIES
+BIGQUERY_COLUMN_TYPES = {"int64": "INTEGER", "float64": "FLOAT", "string": "STRING"}
+
+# Entity or fact table loaded into each BigQuery table, by table name
+TABLE_ENTITIES = {table: entity for entity, table in TABLES.items()}
+
+# Separates a target table's name from the unique part of its upsert staging tables
+STAGING_SUFFIX = "__staging_"
+
+def declared_column_types(table_id):
+    """
+    Look up the column types declared in endpoints.py for a table.
+
+    Money columns (see columnar.MONEY_COLUMNS) are NUMERIC, as in the
+    columnar outputs. Staging tables of upsert_to_bigquery resolve to their
+    target table.
+
+    Args:
+        table_id (str): BigQuery table identifier in the format `project_id.dataset_name.table_name`.
+
+    Returns:
+        dict: Column name to BigQuery type, or None if no entity or fact table is loaded into the table.
+    """
+    table_name = table_id.rsplit(".", 1)[-1].split(STAGING_SUFFIX)[0]
+    entity = TABLE_ENTITIES.get(table_name)
+    if entity is None:
+        return None
+    return {name: "NUMERIC" if name in MONEY_COLUMNS else BIGQUERY_COLUMN_TYPES[column_type]
+            for name, column_type in output_columns(entity)}
+
+@metrics.timed("load.infer_schema")
+def infer_schema_from_csv(file_path, sample_rows=SAMPLE_ROWS, cache_source=None, table_id=None):
     """
-    Infer the schema for BigQuery based on the CSV file header.
+    Build the BigQuery schema of a CSV file.
+
+    The column types declared for `table_id` are used when it is an entity
+    or fact table; otherwise they are inferred from a sample of the rows.
 
     Args:
         file_path (str): Path to the CSV file.
+        sample_rows (int): Maximum rows examined; 0 streams through the whole file.
+        cache_source (str): Identifier an inferred schema is cached under; the file name if None.
+        table_id (str): Destination table, whose declared column types are used if it has any.
 
     Returns:
         list: A list of bigquery.SchemaField objects.
     """
-    schema = []
     try:
-        with open(file_path, mode="r", encoding="utf-8") as csv_file:
-            reader = csv.DictReader(csv_file)
-            for column_name in reader.fieldnames:
-                # Assuming all columns are strings by default (can be adjusted as needed)
-                schema.append(bigquery.SchemaField(column_name, "STRING"))
-            logging.info(f"Inferred schema: {[field.name for field in schema]}")
+        declared_types = declared_column_types(table_id) if table_id else None
+        return infer_schema_from_file(file_path, sample_rows, cache_source=cache_source, declared_types=declared_types)
     except Exception as e:
         logging.error(f"Error inferring schema from CSV: {e}")
         raise
-    return schema
 
 def create_table_if_not_exists(client, table_id, schema):
     """
@@ -76,12 +124,11 @@ def load_csv_to_bigquery(credentials_path, table_id, file_path):
         None
     """
     try:
-        # Authenticate using the service account
-        credentials = service_account.Credentials.from_service_account_file(credentials_path)
-        client = bigquery.Client(credentials=credentials)
+        # Reuse the process-wide client authenticated with the service account
+        client = get_bigquery_client(credentials_path)
 
-        # Infer schema from CSV
-        schema = infer_schema_from_csv(file_path)
+        # Take the declared schema of the table, or infer it from the CSV
+        schema = infer_schema_from_csv(file_path, table_id=table_id)
 
         # Ensure the table exists
         logging.info(f"Checking if table {table_id} exists...")
@@ -93,15 +140,78 @@ def load_csv_to_bigquery(credentials_path, table_id, file_path):
             source_format=bigquery.SourceFormat.CSV,
             field_delimiter=",",
             skip_leading_rows=1,
+            schema=schema,
         )
 
         # Load the CSV file into BigQuery
         logging.info(f"Starting the load job for table: {table_id}")
-        with open(file_path, "rb") as source_file:
-            job = client.load_table_from_file(source_file, table_id, job_config=job_config)
+        with metrics.stage("load.job", table=table_id) as timer:
+            with open(file_path, "rb") as source_file:
+                job = client.load_table_from_file(source_file, table_id, job_config=job_config)
+
+            # Wait for the job to complete
+            job.result()
+            timer.add(rows=job.output_rows or 0, bytes=job.input_file_bytes or 0)
+        logging.info("Data loaded successfully!")
+
+        # Retrieve table details and print summary
+        table = client.get_table(table_id)
+        logging.info(f"Loaded {table.num_rows} rows and {len(table.schema)} columns to {table_id}")
+
+    except FileNotFoundError:
+        logging.error(f"File not found: {file_path}")
+    except GoogleAPIError as e:
+        logging.error(f"Google API Error: {e.message}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {str(e)}")
+    finally:
+        logging.info("Script execution completed.")
+
+# BigQuery source formats of the columnar transform outputs
+COLUMNAR_SOURCE_FORMATS = {
+    ".parquet": bigquery.SourceFormat.PARQUET,
+    ".avro": bigquery.SourceFormat.AVRO,
+}
+
+def load_columnar_to_bigquery(credentials_path, table_id, file_path):
+    """
+    Load a Parquet or Avro file into a BigQuery table.
+
+    Column types come from the file's own schema, so no schema inference
+    pass is needed and the table is created by the load job if missing.
+
+    Args:
+        credentials_path (str): Path to the GCP service account JSON key file.
+        table_id (str): BigQuery table identifier in the format `project_id.dataset_name.table_name`.
+        file_path (str): Path to the .parquet or .avro file.
+
+    Returns:
+        None
+    """
+    try:
+        extension = file_path[file_path.rfind("."):]
+        if extension not in COLUMNAR_SOURCE_FORMATS:
+            raise ValueError(f"Unsupported columnar file: {file_path}")
+
+        # Reuse the process-wide client authenticated with the service account
+        client = get_bigquery_client(credentials_path)
+
+        # Configure the load job
+        job_config = bigquery.LoadJobConfig(
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            source_format=COLUMNAR_SOURCE_FORMATS[extension],
+            use_avro_logical_types=True,
+        )
+
+        # Load the file into BigQuery
+        logging.info(f"Starting the load job for table: {table_id}")
+        with metrics.stage("load.job", table=table_id) as timer:
+            with open(file_path, "rb") as source_file:
+                job = client.load_table_from_file(source_file, table_id, job_config=job_config)
 
-        # Wait for the job to complete
-        job.result()
+            # Wait for the job to complete
+            job.result()
+            timer.add(rows=job.output_rows or 0, bytes=job.input_file_bytes or 0)
         logging.info("Data loaded successfully!")
 
         # Retrieve table details and print summary
@@ -117,14 +227,304 @@ def load_csv_to_bigquery(credentials_path, table_id, file_path):
     finally:
         logging.info("Script execution completed.")
 
+def stream_to_bigquery(credentials_path, table_id, file_path, mode="committed"):
+    """
+    Stream a CSV or Parquet file into a BigQuery table through the Storage Write API.
+
+    Unlike the load job functions this appends to the table rather than
+    replacing it, and the rows are queryable within seconds. The table is
+    created from the file's schema if it does not exist.
+
+    Args:
+        credentials_path (str): Path to the GCP service account JSON key file.
+        table_id (str): BigQuery table identifier in the format `project_id.dataset_name.table_name`.
+        file_path (str): Path to the .csv or .parquet file.
+        mode (str): "committed" or "pending" (see storage_write.stream_table_to_bigquery).
+
+    Returns:
+        int: Number of rows written, or None on failure.
+    """
+    try:
+        import storage_write
+
+        schema = infer_schema_from_csv(file_path, table_id=table_id) if file_path.endswith(".csv") else None
+        table, schema = storage_write.read_arrow_table(file_path, schema)
+
+        # Ensure the table exists
+        client = create_bigquery_client(credentials_path)
+        logging.info(f"Checking if table {table_id} exists...")
+        create_table_if_not_exists(client, table_id, schema)
+
+        write_client = storage_write.create_write_client(credentials_path)
+        return storage_write.stream_table_to_bigquery(write_client, table_id, table, mode=mode)
+
+    except FileNotFoundError:
+        logging.error(f"File not found: {file_path}")
+    except GoogleAPIError as e:
+        logging.error(f"Google API Error: {e.message}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {str(e)}")
+    finally:
+        logging.info("Script execution completed.")
+
+def create_bigquery_client(credentials_path=None):
+    """
+    Return the shared BigQuery client, loading the service account credentials once.
+
+    Args:
+        credentials_path (str): Path to the GCP service account JSON key file,
+            or None to use application default credentials.
+
+    Returns:
+        bigquery.Client: The client.
+    """
+    return get_bigquery_client(credentials_path)
+
+def start_load_job(client, table_id, source):
+    """
+    Submit a load job for a CSV, Parquet or Avro source without waiting for it.
+
+    Sources starting with `gs://` (wildcards allowed, e.g. `gs://bucket/staged/users/*.parquet`)
+    are loaded server-side with load_table_from_uri, so BigQuery reads the
+    shards in parallel and the data never passes through this process.
+
+    Args:
+        client (bigquery.Client): Shared BigQuery client.
+        table_id (str): BigQuery table identifier in the format `project_id.dataset_name.table_name`.
+        source (str): Local file path or GCS URI to load.
+
+    Returns:
+        bigquery.LoadJob: The submitted job.
+    """
+    from_gcs = source.startswith("gs://")
+    extension = source[source.rfind("."):]
+    if extension in COLUMNAR_SOURCE_FORMATS:
+        job_config = bigquery.LoadJobConfig(
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            source_format=COLUMNAR_SOURCE_FORMATS[extension],
+            use_avro_logical_types=True,
+        )
+    else:
+        job_config = bigquery.LoadJobConfig(
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            source_format=bigquery.SourceFormat.CSV,
+            field_delimiter=",",
+            skip_leading_rows=1,
+        )
+        # Sources are staged under a new prefix every run, so an inferred schema is cached per table and format
+        cache_source = f"{table_id.split(STAGING_SUFFIX)[0]}{extension}"
+        if from_gcs:
+            # Sample the head of the first matching object instead of a server-side autodetect pass
+            schema = infer_schema_from_gcs(source, cache_source=cache_source,
+                                           declared_types=declared_column_types(table_id))
+        else:
+            schema = infer_schema_from_csv(source, cache_source=cache_source, table_id=table_id)
+        create_table_if_not_exists(client, table_id, schema)
+        job_config.schema = schema
+
+    logging.info(f"Starting the load job for table: {table_id} from {source}")
+    if from_gcs:
+        return client.load_table_from_uri(source, table_id, job_config=job_config)
+    with open(source, "rb") as source_file:
+        return client.load_table_from_file(source_file, table_id, job_config=job_config)
+
+# Primary keys used to MERGE each entity's deltas into its table
+ENTITY_KEYS = {entity: config["key_columns"] for entity, config in list(ENTITIES.items()) + list(FACTS.items())}
+
+def build_merge_statement(table_id, staging_table_id, columns, key_columns, order_by=None):
+    """
+    Build a MERGE statement upserting the staging table into the target table.
+
+    Duplicate keys in the staging table are collapsed to one row first, since
+    MERGE rejects a target row matching several source rows. The row kept is
+    the first by `order_by` (e.g. an update timestamp, descending), with ties
+    and the no-`order_by` case broken on the whole row's value, so reruns of
+    the same delta always keep the same row.
+
+    Args:
+        table_id (str): Target table.
+        staging_table_id (str): Staging table holding the delta rows.
+        columns (list): All column names of the staging table.
+        key_columns (list): Primary key columns.
+        order_by (list): Columns whose highest value wins among duplicate keys.
+
+    Returns:
+        str: The MERGE statement.
+    """
+    keys = ", ".join(f"`{column}`" for column in key_columns)
+    ordering = ", ".join([f"`{column}` DESC" for column in order_by or []] + ["TO_JSON_STRING(R)"])
+    on = " AND ".join(f"T.`{column}` = S.`{column}`" for column in key_columns)
+    updates = ", ".join(f"`{column}` = S.`{column}`" for column in columns if column not in key_columns)
+    names = ", ".join(f"`{column}`" for column in columns)
+    values = ", ".join(f"S.`{column}`" for column in columns)
+    statement = (
+        f"MERGE `{table_id}` T\n"
+        f"USING (\n"
+        f"  SELECT * EXCEPT(_row_number) FROM (\n"
+        f"    SELECT *, ROW_NUMBER() OVER (PARTITION BY {keys} ORDER BY {ordering}) AS _row_number\n"
+        f"    FROM `{staging_table_id}` R\n"
+        f"  ) WHERE _row_number = 1\n"
+        f") S\n"
+        f"ON {on}\n"
+    )
+    if updates:
+        statement += f"WHEN MATCHED THEN UPDATE SET {updates}\n"
+    statement += f"WHEN NOT MATCHED THEN INSERT ({names}) VALUES ({values})"
+    return statement
+
+def upsert_to_bigquery(client, table_id, source, key_columns, partitioning=None, clustering_fields=None, order_by=None):
+    """
+    Load a delta into a staging table and MERGE it into the target on its primary key.
+
+    The target is created from the staging schema (with the optional
+    partitioning and clustering) if it does not exist yet. Rows missing from
+    the delta are left untouched; deletes are not propagated.
+
+    The MERGE reads the whole staging table, so its cost follows the size of
+    `source`: merging a full transform output rewrites every target row,
+    while an incremental delta only touches the changed ones.
+
+    Every call stages into its own uniquely named table, dropped afterwards,
+    so overlapping runs of the same table cannot read each other's rows.
+
+    Args:
+        client (bigquery.Client): Shared BigQuery client.
+        table_id (str): Target table identifier in the format `project_id.dataset_name.table_name`.
+        source (str): Local file path or GCS URI of the delta rows.
+        key_columns (list): Primary key columns.
+        partitioning (bigquery.TimePartitioning or bigquery.RangePartitioning): Partitioning of a new target.
+        clustering_fields (list): Clustering columns of a new target.
+        order_by (list): Columns whose highest value wins among duplicate keys (see build_merge_statement).
+
+    Returns:
+        int: Number of target rows inserted or updated.
+    """
+    staging_table_id = f"{table_id}{STAGING_SUFFIX}{uuid.uuid4().hex}"
+    try:
+        # Labelled with the target table: a per-call staging name would start a new series every run
+        with metrics.stage("load.job", table=table_id, phase="staging") as timer:
+            job = start_load_job(client, staging_table_id, source)
+            job.result()
+            timer.add(rows=job.output_rows or 0, bytes=job.input_file_bytes or 0)
+        staging_table = client.get_table(staging_table_id)
+        columns = [field.name for field in staging_table.schema]
+
+        try:
+            client.get_table(table_id)
+        except NotFound:
+            table = bigquery.Table(table_id, schema=staging_table.schema)
+            if isinstance(partitioning, bigquery.TimePartitioning):
+                table.time_partitioning = partitioning
+            elif isinstance(partitioning, bigquery.RangePartitioning):
+                table.range_partitioning = partitioning
+            table.clustering_fields = clustering_fields
+            client.create_table(table)
+            logging.info(f"Table {table_id} created successfully.")
+
+        logging.info(f"Merging {staging_table.num_rows} staged rows into {table_id} on {key_columns}")
+        with metrics.stage("load.merge", table=table_id) as timer:
+            job = client.query(build_merge_statement(table_id, staging_table_id, columns, key_columns, order_by))
+            job.result()
+            affected = job.num_dml_affected_rows or 0
+            timer.add(rows=affected)
+        logging.info(f"Merged {affected} rows into {table_id}")
+        return affected
+    finally:
+        client.delete_table(staging_table_id, not_found_ok=True)
+
+def load_tables_to_bigquery(tables, credentials_path=None, client=None, max_workers=None, upserts=None,
+                            skip_unchanged=False, storage_client=None):
+    """
+    Load several sources into their BigQuery tables concurrently with one shared client.
+
+    Tables listed in `upserts` are merged on their primary key (see
+    upsert_to_bigquery); all others are replaced with WRITE_TRUNCATE.
+
+    With `skip_unchanged`, a GCS source whose objects, load code and load
+    options match the last successful load of its table is not loaded again.
+    The fingerprint is stored in the source's bucket once the load succeeds.
+
+    Args:
+        tables (dict): Mapping of table id to a local file path or GCS URI (wildcards allowed).
+        credentials_path (str): Path to the GCP service account JSON key file.
+        client (bigquery.Client): Client to use; the shared client for `credentials_path` if None.
+        max_workers (int): Number of jobs submitted in parallel; defaults to one per table.
+        upserts (dict): Mapping of table id to upsert_to_bigquery keyword arguments
+            (`key_columns`, and optionally `partitioning`, `clustering_fields` and `order_by`).
+        skip_unchanged (bool): Skip tables whose GCS sources are unchanged since their last load.
+        storage_client (storage.Client): GCS client used for the fingerprints; the shared one if None.
+
+    Returns:
+        dict: Per table id, the loaded (or merged) row count (`rows`), error message
+            (`error`, None on success) and whether the load was skipped (`skipped`).
+    """
+    client = client or create_bigquery_client(credentials_path)
+    upserts = upserts or {}
+    if skip_unchanged and storage_client is None:
+        storage_client = get_storage_client()
+    load_version = fingerprint.code_version(fingerprint.LOAD_MODULES) if skip_unchanged else None
+
+    def load_one(table_id, source):
+        try:
+            state_bucket = None
+            if skip_unchanged and source.startswith("gs://"):
+                inputs = fingerprint.uri_fingerprints(storage_client, source)
+                current = fingerprint.compute_fingerprint(inputs, load_version,
+                                                          {"table_id": table_id, "upsert": upserts.get(table_id)})
+                state_bucket = storage_client.bucket(source[len("gs://"):].split("/", 1)[0])
+                state = fingerprint.load_stage_state(state_bucket, "load", table_id)
+                if fingerprint.is_unchanged(state, current):
+                    logging.info(f"Sources of {table_id} unchanged since its last load; skipping.")
+                    return {"rows": state["rows"], "error": None, "skipped": True}
+
+            if table_id in upserts:
+                rows = upsert_to_bigquery(client, table_id, source, **upserts[table_id])
+            else:
+                with metrics.stage("load.job", table=table_id) as timer:
+                    job = start_load_job(client, table_id, source)
+                    job.result()
+                    timer.add(rows=job.output_rows or 0, bytes=job.input_file_bytes or 0)
+                table = client.get_table(table_id)
+                logging.info(f"Loaded {table.num_rows} rows and {len(table.schema)} columns to {table_id}")
+                rows = table.num_rows
+
+            if state_bucket is not None:
+                fingerprint.save_stage_state(state_bucket, "load", table_id, current, source=source, rows=rows)
+            return {"rows": rows, "error": None, "skipped": False}
+        except FileNotFoundError:
+            logging.error(f"File not found: {source}")
+            return {"rows": 0, "error": f"File not found: {source}", "skipped": False}
+        except GoogleAPIError as e:
+            logging.error(f"Google API Error loading {table_id}: {e.message}")
+            return {"rows": 0, "error": e.message, "skipped": False}
+        except Exception as e:
+            logging.error(f"An unexpected error occurred loading {table_id}: {str(e)}")
+            return {"rows": 0, "error": str(e), "skipped": False}
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(tables), 1)) as executor:
+        futures = {table_id: executor.submit(load_one, table_id, source) for table_id, source in tables.items()}
+        results = {table_id: future.result() for table_id, future in futures.items()}
+
+    failed = [table_id for table_id, result in results.items() if result["error"]]
+    if failed:
+        logging.error(f"Load failed for: {', '.join(failed)}")
+    else:
+        logging.info(f"All {len(results)} tables loaded successfully!")
+    return results
+
 # Usage
 if __name__ == "__main__":
     # Replace these paths with actual values
     credentials_path = r"/home/malcolmbuluku/data_pipeline/credentials /credentials.json"
-    table_id = "savannahinformaticsassessment.savannah_informatics_assessment_data.carts_table"
-    file_path = r"/home/malcolmbuluku/data_pipeline/scripts/flattened_carts.csv"
+    dataset_id = "savannahinformaticsassessment.savannah_informatics_assessment_data"
+    tables = {
+        f"{dataset_id}.users_table": r"/home/malcolmbuluku/data_pipeline/scripts/filtered_users.csv",
+        f"{dataset_id}.products_table": r"/home/malcolmbuluku/data_pipeline/scripts/filtered_products.csv",
+        f"{dataset_id}.carts_table": r"/home/malcolmbuluku/data_pipeline/scripts/flattened_carts.csv",
+    }
 
-    load_csv_to_bigquery(credentials_path, table_id, file_path)
+    load_tables_to_bigquery(tables, credentials_path)
+    metrics.export_metrics(task="load")
 
 
 
@@ -0,0 +1,395 @@
+'''
+Per-stage Pipeline Metrics
+
+Stages of the pipeline (fetching, downloading, parsing, normalizing,
+writing, uploading, loading) are wrapped in timers that record wall-clock
+time, the rows and bytes they moved and the peak resident memory of the
+process while they ran. Measurements are aggregated in-process per stage
+name and labels, so instrumenting a function called once per batch
+costs a few microseconds per call and a fixed amount of memory.
+
+At the end of a run or task the aggregate is exported as one JSON
+document, and optionally as a Prometheus textfile (for node_exporter's
+textfile collector) and as StatsD datagrams.
+
+'''
+import datetime
+import functools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Directory of the per-run JSON exports (empty to disable)
+METRICS_DIR = os.environ.get("PIPELINE_METRICS_DIR", "metrics")
+
+# Directory scraped by node_exporter's textfile collector (unset to disable)
+PROMETHEUS_TEXTFILE_DIR = os.environ.get("PIPELINE_PROMETHEUS_TEXTFILE_DIR")
+
+# StatsD daemon as host:port (unset to disable)
+STATSD_ADDRESS = os.environ.get("PIPELINE_STATSD_ADDRESS")
+
+# Prefix of exported metric names
+METRIC_PREFIX = "pipeline"
+
+# Seconds between resident memory samples while a stage is running
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get("PIPELINE_MEMORY_SAMPLE_INTERVAL", 0.05))
+
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_active = {}
+_started_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+_sampler = None
+_page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss():
+    """
+    Read the resident memory of this process.
+
+    Returns:
+        int: Resident set size in bytes, or the peak so far where the current size is unavailable.
+    """
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * _page_size
+    except OSError:
+        import resource
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+def _sample_memory():
+    """Raise the peak of every running stage to the current RSS until no stage is running."""
+    global _sampler
+    while True:
+        time.sleep(MEMORY_SAMPLE_INTERVAL)
+        rss = current_rss()
+        with _lock:
+            if not _active:
+                _sampler = None
+                return
+            for timer in _active.values():
+                timer.peak_rss = max(timer.peak_rss, rss)
+
+class StageTimer:
+    """
+    A running stage, yielded by stage(); add the rows and bytes it moved with add().
+
+    Args:
+        name (str): Stage name, e.g. `transform.normalize`.
+        labels (dict): Labels distinguishing instances of the stage (entity, table).
+    """
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.rows = 0
+        self.bytes = 0
+        self.peak_rss = 0
+        self.seconds = 0.0
+
+    def add(self, rows=0, bytes=0):
+        """
+        Count rows and bytes moved by the stage.
+
+        Args:
+            rows (int): Rows or records.
+            bytes (int): Bytes read or written.
+        """
+        self.rows += rows
+        self.bytes += bytes
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Time a block as one call of a stage.
+
+    Args:
+        name (str): Stage name, e.g. `extract.fetch_and_save`.
+        **labels: Labels of this instance of the stage, e.g. entity="users".
+
+    Yields:
+        StageTimer: Counter for the rows and bytes the block moves.
+    """
+    global _sampler
+    timer = StageTimer(name, {key: str(value) for key, value in labels.items()})
+    timer.peak_rss = current_rss()
+    with _lock:
+        _active[id(timer)] = timer
+        # A sampler inherited through fork is not running in this process
+        if (_sampler is None or not _sampler.is_alive()) and MEMORY_SAMPLE_INTERVAL > 0:
+            _sampler = threading.Thread(target=_sample_memory, name="metrics-memory-sampler", daemon=True)
+            _sampler.start()
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield timer
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        timer.seconds = time.perf_counter() - started
+        timer.peak_rss = max(timer.peak_rss, current_rss())
+        with _lock:
+            del _active[id(timer)]
+            _record(timer.name, timer.labels, 1, timer.seconds, timer.seconds, timer.rows, timer.bytes,
+                    timer.peak_rss, int(failed))
+
+def _record(name, labels, calls, seconds, max_seconds, rows, bytes, peak_rss, errors):
+    """Fold measurements into a stage's aggregate; the caller holds the lock."""
+    aggregate = _stages.setdefault(_key(name, labels), {
+        "stage": name, "labels": labels, "calls": 0, "seconds": 0.0, "max_seconds": 0.0,
+        "rows": 0, "bytes": 0, "peak_rss_bytes": 0, "errors": 0,
+    })
+    aggregate["calls"] += calls
+    aggregate["seconds"] += seconds
+    aggregate["max_seconds"] = max(aggregate["max_seconds"], max_seconds)
+    aggregate["rows"] += rows
+    aggregate["bytes"] += bytes
+    aggregate["peak_rss_bytes"] = max(aggregate["peak_rss_bytes"], peak_rss)
+    aggregate["errors"] += errors
+
+def timed(name, rows=None, bytes=None, **labels):
+    """
+    Decorate a function so each call is timed as a stage.
+
+    Args:
+        name (str): Stage name.
+        rows (function): Computes the rows moved from the function's result (e.g. len).
+        bytes (function): Computes the bytes moved from the function's result.
+        **labels: Labels of the stage.
+
+    Returns:
+        function: The decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name, **labels) as timer:
+                result = function(*args, **kwargs)
+                if result is not None:
+                    timer.add(rows=rows(result) if rows else 0, bytes=bytes(result) if bytes else 0)
+                return result
+        return wrapper
+    return decorator
+
+def increment(name, value=1, **labels):
+    """
+    Add to a counter.
+
+    Args:
+        name (str): Counter name, e.g. `extract.pages`.
+        value (int): Amount to add.
+        **labels: Labels of the counter.
+    """
+    labels = {key: str(label) for key, label in labels.items()}
+    with _lock:
+        counter = _counters.setdefault(_key(name, labels), {"counter": name, "labels": labels, "value": 0})
+        counter["value"] += value
+
+def snapshot(run_id=None, task=None):
+    """
+    Report every stage and counter recorded in this process.
+
+    Args:
+        run_id (str): Run the measurements belong to.
+        task (str): Task or script that produced them.
+
+    Returns:
+        dict: JSON-serializable metrics, stages sorted by total time.
+    """
+    from clients import client_stats
+
+    with _lock:
+        stages = sorted((dict(aggregate, labels=dict(aggregate["labels"])) for aggregate in _stages.values()),
+                        key=lambda aggregate: aggregate["seconds"], reverse=True)
+        counters = [dict(counter, labels=dict(counter["labels"])) for counter in _counters.values()]
+    return {
+        "run_id": run_id,
+        "task": task,
+        "pid": os.getpid(),
+        "started_at": _started_at,
+        "exported_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "stages": stages,
+        "counters": counters,
+        "clients": client_stats(),
+    }
+
+def drain():
+    """
+    Return this process's measurements and clear them, e.g. at the end of a pool worker's task.
+
+    Returns:
+        dict: The snapshot() taken before clearing.
+    """
+    metrics = snapshot()
+    reset()
+    return metrics
+
+def merge(metrics):
+    """
+    Fold measurements taken in another process (see drain) into this one.
+
+    Args:
+        metrics (dict): A snapshot from another process.
+    """
+    with _lock:
+        for aggregate in metrics["stages"]:
+            _record(aggregate["stage"], aggregate["labels"], aggregate["calls"], aggregate["seconds"],
+                    aggregate["max_seconds"], aggregate["rows"], aggregate["bytes"], aggregate["peak_rss_bytes"],
+                    aggregate["errors"])
+        for counter in metrics["counters"]:
+            merged = _counters.setdefault(_key(counter["counter"], counter["labels"]),
+                                          {"counter": counter["counter"], "labels": counter["labels"], "value": 0})
+            merged["value"] += counter["value"]
+
+def reset():
+    """Forget every stage and counter."""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+def _metric_name(name):
+    return f"{METRIC_PREFIX}_{name}".replace(".", "_").replace("-", "_")
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+def to_prometheus(metrics):
+    """
+    Render a snapshot in the Prometheus text exposition format.
+
+    Args:
+        metrics (dict): A snapshot.
+
+    Returns:
+        str: One sample per line.
+    """
+    series = {
+        "stage_calls_total": ("counter", "calls"),
+        "stage_seconds_total": ("counter", "seconds"),
+        "stage_max_seconds": ("gauge", "max_seconds"),
+        "stage_rows_total": ("counter", "rows"),
+        "stage_bytes_total": ("counter", "bytes"),
+        "stage_peak_rss_bytes": ("gauge", "peak_rss_bytes"),
+        "stage_errors_total": ("counter", "errors"),
+    }
+    lines = []
+    for suffix, (metric_type, field) in series.items():
+        name = _metric_name(suffix)
+        lines.append(f"# TYPE {name} {metric_type}")
+        for aggregate in metrics["stages"]:
+            labels = dict(aggregate["labels"], stage=aggregate["stage"])
+            lines.append(f"{name}{_prometheus_labels(labels)} {aggregate[field]}")
+    declared = set()
+    for counter in sorted(metrics["counters"], key=lambda counter: counter["counter"]):
+        name = _metric_name(counter["counter"]) + "_total"
+        if name not in declared:
+            lines.append(f"# TYPE {name} counter")
+            declared.add(name)
+        lines.append(f"{name}{_prometheus_labels(counter['labels'])} {counter['value']}")
+    return "\n".join(lines) + "\n"
+
+def to_statsd(metrics):
+    """
+    Render a snapshot as StatsD lines; labels become dotted name segments.
+
+    Args:
+        metrics (dict): A snapshot.
+
+    Returns:
+        list: Lines such as `pipeline.transform.normalize.users.seconds:812|ms`.
+    """
+    lines = []
+    for aggregate in metrics["stages"]:
+        name = ".".join([METRIC_PREFIX, aggregate["stage"], *aggregate["labels"].values()])
+        lines.append(f"{name}.seconds:{aggregate['seconds'] * 1000:.3f}|ms")
+        lines.append(f"{name}.calls:{aggregate['calls']}|c")
+        lines.append(f"{name}.rows:{aggregate['rows']}|c")
+        lines.append(f"{name}.bytes:{aggregate['bytes']}|c")
+        lines.append(f"{name}.peak_rss_bytes:{aggregate['peak_rss_bytes']}|g")
+    for counter in metrics["counters"]:
+        name = ".".join([METRIC_PREFIX, counter["counter"], *counter["labels"].values()])
+        lines.append(f"{name}:{counter['value']}|c")
+    return lines
+
+def send_statsd(metrics, address):
+    """
+    Send a snapshot to a StatsD daemon over UDP.
+
+    Args:
+        metrics (dict): A snapshot.
+        address (str): `host:port` of the daemon.
+    """
+    host, _, port = address.rpartition(":")
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for line in to_statsd(metrics):
+            sock.sendto(line.encode("utf-8"), (host, int(port)))
+
+def _write_atomically(path, text):
+    """Write a file through a temporary name so readers never see it half-written."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as output_file:
+        output_file.write(text)
+    os.replace(temporary, path)
+
+def export_metrics(run_id=None, task=None, bucket=None):
+    """
+    Export this process's measurements to every configured destination.
+
+    The JSON document is written to `<PIPELINE_METRICS_DIR>/<run_id>/<task>.json`
+    and, with a bucket, uploaded to `metrics/<run_id>/<task>.json` in it.
+    Exporting never raises; a failed destination is logged and skipped.
+
+    Args:
+        run_id (str): Run the measurements belong to; defaults to the current UTC time.
+        task (str): Task or script that produced them; defaults to the process id.
+        bucket (google.cloud.storage.Bucket): Bucket to upload the JSON document to, or None.
+
+    Returns:
+        dict: The exported snapshot.
+    """
+    run_id = run_id or datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S")
+    task = task or f"pid-{os.getpid()}"
+    metrics = snapshot(run_id, task)
+    document = json.dumps(metrics, indent=2)
+    file_name = f"{task}.json".replace(os.sep, "_")
+
+    destinations = []
+    if METRICS_DIR:
+        destinations.append(("JSON file", lambda: _write_atomically(os.path.join(METRICS_DIR, run_id, file_name),
+                                                                    document)))
+    if bucket is not None:
+        destinations.append(("GCS", lambda: bucket.blob(f"metrics/{run_id}/{file_name}").upload_from_string(
+            document, content_type="application/json")))
+    if PROMETHEUS_TEXTFILE_DIR:
+        destinations.append(("Prometheus textfile", lambda: _write_atomically(
+            os.path.join(PROMETHEUS_TEXTFILE_DIR, f"{METRIC_PREFIX}_{file_name[:-len('.json')]}.prom"),
+            to_prometheus(metrics))))
+    if STATSD_ADDRESS:
+        destinations.append(("StatsD", lambda: send_statsd(metrics, STATSD_ADDRESS)))
+
+    for destination, export in destinations:
+        try:
+            export()
+        except Exception as e:
+            logging.warning(f"Could not export metrics to {destination}: {e}")
+
+    slowest = ", ".join(f"{aggregate['stage']} {aggregate['seconds']:.2f}s" for aggregate in metrics["stages"][:3])
+    logging.info(f"Metrics of {task} in run {run_id}: {len(metrics['stages'])} stages"
+                 f"{f'; slowest {slowest}' if slowest else ''}")
+    return metrics
@@ -0,0 +1,179 @@
+'''
+Streaming NDJSON Reading and Writing for GCS
+
+Raw API pulls are stored as newline-delimited JSON (one compact record per
+line), optionally gzip-compressed, and written through a resumable upload
+(or as parallel composite parts, see transfer.py) as pages arrive so
+memory stays flat regardless of dataset size.
+
+'''
+import gzip
+import json
+import logging
+import uuid
+import metrics
+# Object names are declared with the entities so the DAG can build them without importing this module
+from endpoints import COMPRESS_RAW, delta_blob_name, raw_blob_name
+from record_spec import select_lines, select_records
+from transfer import ParallelCompositeWriter, download_bytes, replace_blob
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Resumable upload chunk size; must be a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+class NDJSONBlobWriter:
+    """
+    Write records to a GCS blob as NDJSON through a resumable upload.
+
+    Use as a context manager; the upload is only started by the first
+    record and goes to a temporary object that is moved over the blob
+    only when the block exits cleanly, so an empty or failed pull never
+    replaces the previous object.
+
+    With a `part_size`, the stream is uploaded as parts in parallel and
+    composed into the blob at the end instead (see ParallelCompositeWriter).
+
+    Args:
+        blob (google.cloud.storage.Blob): Destination blob.
+        compress (bool): Gzip the stream before uploading.
+        chunk_size (int): Resumable upload chunk size in bytes.
+        part_size (int): Parallel composite upload part size in bytes, or None for a resumable upload.
+    """
+
+    def __init__(self, blob, compress=False, chunk_size=UPLOAD_CHUNK_SIZE, part_size=None):
+        self.blob = blob
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.part_size = part_size
+        self.records_written = 0
+        self.bytes_written = 0
+        self._stream = None
+        self._out = None
+        self._staging_blob = None
+
+    def __enter__(self):
+        return self
+
+    def _open(self):
+        content_type = "application/gzip" if self.compress else "application/x-ndjson"
+        if self.part_size:
+            self._stream = ParallelCompositeWriter(self.blob, content_type=content_type, part_size=self.part_size)
+        else:
+            self._staging_blob = self.blob.bucket.blob(f"{self.blob.name}.tmp-{uuid.uuid4().hex}")
+            self._stream = self._staging_blob.open("wb", chunk_size=self.chunk_size, content_type=content_type,
+                                                   ignore_flush=True)
+        self._out = gzip.GzipFile(fileobj=self._stream, mode="wb") if self.compress else self._stream
+
+    def write_records(self, records):
+        """
+        Append records to the stream, one compact JSON document per line.
+
+        Args:
+            records (iterable): JSON-serializable records.
+        """
+        for record in records:
+            if self._out is None:
+                self._open()
+            line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+            self._out.write(line)
+            self.records_written += 1
+            self.bytes_written += len(line)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            logging.error(f"Aborting upload to '{self.blob.name}' after {self.records_written} records.")
+            self._abort()
+            return False
+        if self._stream is None:
+            logging.info(f"No records to upload to '{self.blob.name}'.")
+            return False
+        try:
+            self._close_streams()
+            if self._staging_blob is not None:
+                replace_blob(self._staging_blob, self.blob)
+        except Exception:
+            self._abort()
+            raise
+        logging.info(f"Uploaded {self.records_written} records ({self.bytes_written} bytes uncompressed) to '{self.blob.name}'")
+        return False
+
+    def _close_streams(self):
+        if self._out is not self._stream:
+            self._out.close()
+        self._stream.close()
+
+    def _abort(self):
+        from google.api_core.exceptions import NotFound
+
+        if isinstance(self._stream, ParallelCompositeWriter):
+            self._stream.abort()
+            return
+        if self._staging_blob is None:
+            return
+        # A resumable upload cannot be cancelled, and an unclosed writer is finalized when it is
+        # garbage collected, so finish it under the temporary name and delete that object
+        try:
+            self._close_streams()
+        except Exception as e:
+            logging.warning(f"Could not close the upload to '{self._staging_blob.name}': {e}")
+        try:
+            self._staging_blob.delete()
+        except NotFound:
+            pass
+        except Exception as e:
+            logging.warning(f"Could not delete '{self._staging_blob.name}': {e}")
+
+def parse_raw_records(payload, blob_name, record_key=None, spec=None):
+    """
+    Parse a raw dump into a list of records.
+
+    Handles NDJSON (optionally gzipped, by `.gz` suffix) as well as the
+    legacy pretty-printed JSON envelope. With a spec (see record_spec.py),
+    NDJSON records are filtered and projected line by line as they are
+    decoded, so only the accepted, projected records are ever held.
+
+    Args:
+        payload (bytes): The object contents.
+        blob_name (str): Object name, used to detect the format.
+        record_key (str): Key of the record list in a JSON envelope (e.g. "users").
+        spec (dict): Filter and projection applied while parsing, or None.
+
+    Returns:
+        list: The records.
+    """
+    if blob_name.endswith(".gz"):
+        payload = gzip.decompress(payload)
+        blob_name = blob_name[:-3]
+    if blob_name.endswith(".ndjson"):
+        return list(select_lines(payload.splitlines(), spec))
+
+    data = json.loads(payload.decode("utf-8"))
+    if isinstance(data, dict) and record_key in data:
+        data = data[record_key]
+    if spec is not None and isinstance(data, list):
+        return list(select_records(data, spec))
+    return data
+
+def read_raw_records(blob, record_key=None, spec=None):
+    """
+    Download a raw dump from GCS and parse it into a list of records.
+
+    Large objects are downloaded in parallel byte ranges (see transfer.download_bytes).
+
+    Args:
+        blob (google.cloud.storage.Blob): Source blob.
+        record_key (str): Key of the record list in a JSON envelope.
+        spec (dict): Filter and projection applied while parsing, or None.
+
+    Returns:
+        list: The records.
+    """
+    with metrics.stage("gcs.download", entity=record_key) as timer:
+        payload = download_bytes(blob)
+        timer.add(bytes=len(payload))
+    with metrics.stage("transform.parse", entity=record_key) as timer:
+        records = parse_raw_records(payload, blob.name, record_key, spec)
+        timer.add(rows=len(records), bytes=len(payload))
+    return records
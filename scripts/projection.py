@@ -0,0 +1,99 @@
+'''
+Compiled Field Projections
+
+Builds, once per list of column paths, a specialized extractor that pulls
+only those values out of each record into preallocated column arrays.
+Every path is read in a single pass over the records, nested objects
+shared by several paths (e.g. `address` for `address.city` and
+`address.postalCode`) are looked up once per record, and nothing else in
+the record is touched, so wide records cost no more than narrow ones.
+
+Paths use the syntax of endpoints.ENTITIES: dotted keys reach into
+nested objects and `a|b` falls back to `b` when `a` is missing or null.
+
+'''
+import functools
+import numpy as np
+
+# Stand-in for a missing or non-object parent; never modified
+_EMPTY = {}
+
+def _parse_paths(paths):
+    """Split each path into its alternatives, each a tuple of keys."""
+    return [[tuple(alternative.split(".")) for alternative in path.split("|")] for path in paths]
+
+def projection_source(paths):
+    """
+    Generate the source of the extractor of a list of paths.
+
+    Args:
+        paths (tuple): Column paths.
+
+    Returns:
+        str: Source defining `extract(records)`.
+    """
+    parsed = _parse_paths(paths)
+    # Variable holding each nested object, parents first
+    prefixes = sorted({keys[:depth] for alternatives in parsed for keys in alternatives for depth in range(1, len(keys))},
+                      key=len)
+    variables = {(): "record"}
+    variables.update((prefix, f"parent_{number}") for number, prefix in enumerate(prefixes))
+
+    lines = [
+        "def extract(records):",
+        "    size = len(records)",
+        f"    columns = [np.empty(size, dtype=object) for _ in range({len(paths)})]",
+    ]
+    lines += [f"    column_{number} = columns[{number}]" for number in range(len(paths))]
+    lines += [
+        "    for row, record in enumerate(records):",
+        "        if not isinstance(record, dict):",
+        "            record = EMPTY",
+    ]
+    for prefix in prefixes:
+        variable = variables[prefix]
+        lines += [
+            f"        {variable} = {variables[prefix[:-1]]}.get({prefix[-1]!r})",
+            f"        if not isinstance({variable}, dict):",
+            f"            {variable} = EMPTY",
+        ]
+    for number, alternatives in enumerate(parsed):
+        first, *fallbacks = [f"{variables[keys[:-1]]}.get({keys[-1]!r})" for keys in alternatives]
+        if not fallbacks:
+            lines.append(f"        column_{number}[row] = {first}")
+            continue
+        lines.append(f"        value = {first}")
+        for fallback in fallbacks:
+            lines += ["        if value is None:", f"            value = {fallback}"]
+        lines.append(f"        column_{number}[row] = value")
+    lines.append("    return columns")
+    return "\n".join(lines) + "\n"
+
+@functools.lru_cache(maxsize=None)
+def compile_projection(paths):
+    """
+    Compile column paths into an extractor of column arrays.
+
+    Args:
+        paths (tuple): Column paths, such as `("id", "address.city", "cart_id|id")`.
+
+    Returns:
+        function: Maps a sequence of records to one object array per path,
+            holding None where the path is absent.
+    """
+    namespace = {"np": np, "EMPTY": _EMPTY}
+    exec(compile(projection_source(paths), f"<projection {', '.join(paths)}>", "exec"), namespace)
+    return namespace["extract"]
+
+def extract_columns(records, paths):
+    """
+    Extract column arrays from records.
+
+    Args:
+        records (sequence): Decoded records.
+        paths (iterable): Column paths.
+
+    Returns:
+        list: One object array per path.
+    """
+    return compile_projection(tuple(paths))(records)
@@ -0,0 +1,188 @@
+'''
+Declarative Record Filters and Projections
+
+A spec names the fields a consumer keeps, the fields coerced to numbers
+and the conditions a record must meet. It is applied while raw records
+are parsed, so rejected records and unused fields are dropped as soon as
+each record is decoded rather than after the whole dump is materialized.
+For NDJSON lines, a record whose line does not even mention a filtered
+field is rejected before it is decoded at all.
+
+Specs are plain dicts:
+
+    {
+        "fields": ["id", "price"],     # projection, in output order (None keeps every field)
+        "numeric": ["price"],          # coerced to float; records where this fails are dropped
+        "where": [("price", ">", 50)], # all conditions must hold
+    }
+
+'''
+import json
+import logging
+import operator
+import os
+from endpoints import ENTITIES
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Products priced at or below this are left out of the transformed products document
+PREMIUM_PRODUCTS_MIN_PRICE = float(os.environ.get("PREMIUM_PRODUCTS_MIN_PRICE", 100))
+
+# Comparison of each condition operator
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda value, allowed: value in allowed,
+}
+
+def entity_spec(entity):
+    """
+    Derive the spec of an entity's transform from its configuration in endpoints.ENTITIES.
+
+    The projection keeps the top-level fields its column paths start from
+    (or its nested record list), so every other field is dropped as soon
+    as a record is decoded.
+
+    Args:
+        entity (str): Key of ENTITIES.
+
+    Returns:
+        dict: Filter and projection spec.
+    """
+    config = ENTITIES[entity]
+    columns = config["parent_columns"] + ([] if config["record_path"] else config["columns"])
+    fields = [alternative.split(".")[0] for _, path, _ in columns for alternative in path.split("|")]
+    if config["record_path"]:
+        fields.append(config["record_path"])
+    return {
+        "fields": list(dict.fromkeys(fields + config["numeric"] + [field for field, _, _ in config["where"]])),
+        "numeric": list(config["numeric"]),
+        "where": list(config["where"]),
+    }
+
+# Filter and projection of each entity's transform, and of other consumers of the raw data
+SPECS = {entity: entity_spec(entity) for entity in ENTITIES}
+
+# Transformed products document written by the DAG's transform_data task
+SPECS["premium_products"] = dict(SPECS["products"], where=[("price", ">", PREMIUM_PRODUCTS_MIN_PRICE)])
+
+def _to_number(value):
+    """Coerce a value to float the way pandas.to_numeric(errors='coerce') would, or return None."""
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else number
+
+def record_selector(spec):
+    """
+    Compile a spec into a function filtering and projecting one decoded record.
+
+    Args:
+        spec (dict): Filter and projection spec.
+
+    Returns:
+        function: Maps a record to its projected dict, or to None if it is rejected.
+    """
+    fields = spec.get("fields")
+    numeric = list(spec.get("numeric", ()))
+    conditions = [(field, OPERATORS[op], operand) for field, op, operand in spec.get("where", ())]
+
+    def select(record):
+        if not isinstance(record, dict):
+            return None
+        # Coerced values are kept aside so the caller's record is never modified
+        numbers = {}
+        for field in numeric:
+            number = _to_number(record.get(field))
+            if number is None:
+                return None
+            numbers[field] = number
+        for field, compare, operand in conditions:
+            value = numbers[field] if field in numbers else record.get(field)
+            if value is None or not compare(value, operand):
+                return None
+        if fields is None:
+            return dict(record, **numbers) if numbers else record
+        return {field: numbers[field] if field in numbers else record.get(field) for field in fields}
+
+    return select
+
+def line_decoder(spec):
+    """
+    Compile a spec into a function decoding, filtering and projecting one NDJSON line.
+
+    Every filtered field must be present for a record to pass, so a line
+    that does not contain a filtered field's quoted name is rejected
+    without being decoded.
+
+    Args:
+        spec (dict): Filter and projection spec, or None to decode every line as is.
+
+    Returns:
+        function: Maps a line (str, bytes or bytearray) to its projected dict,
+            or to None if it is blank or rejected.
+    """
+    if spec is None:
+        return lambda line: json.loads(line) if line.strip() else None
+
+    select = record_selector(spec)
+    required = {field for field, _, _ in spec.get("where", ())} | set(spec.get("numeric", ()))
+    markers_text = [f'"{field}"' for field in sorted(required)]
+    markers_bytes = [marker.encode("utf-8") for marker in markers_text]
+
+    def decode(line):
+        # Ranged downloads of large objects come back as a bytearray
+        markers = markers_bytes if isinstance(line, (bytes, bytearray)) else markers_text
+        for marker in markers:
+            if marker not in line:
+                return None
+        if not line.strip():
+            return None
+        return select(json.loads(line))
+
+    return decode
+
+def select_records(records, spec):
+    """
+    Filter and project decoded records lazily.
+
+    Args:
+        records (iterable): Decoded records.
+        spec (dict): Filter and projection spec, or None to pass records through.
+
+    Yields:
+        dict: Each accepted record, projected.
+    """
+    if spec is None:
+        yield from records
+        return
+    select = record_selector(spec)
+    for record in records:
+        selected = select(record)
+        if selected is not None:
+            yield selected
+
+def select_lines(lines, spec):
+    """
+    Decode, filter and project NDJSON lines lazily.
+
+    Args:
+        lines (iterable): NDJSON lines (str, bytes or bytearray).
+        spec (dict): Filter and projection spec, or None to decode every line.
+
+    Yields:
+        dict: Each accepted record, projected.
+    """
+    decode = line_decoder(spec)
+    for line in lines:
+        record = decode(line)
+        if record is not None:
+            yield record
@@ -0,0 +1,248 @@
+'''
+On-disk HTTP Response Cache with Conditional Revalidation
+
+Responses are cached on disk keyed by URL + query parameters and
+revalidated with If-None-Match / If-Modified-Since. A 304, or a 200 whose
+body hash matches the cached copy, counts as "unchanged", which lets the
+extractor skip the GCS upload (and everything downstream) entirely.
+
+Responses can be staged instead of stored: they are then served by the
+cache but only become permanent on commit(), so a caller can record new
+validators only once the data they describe has been saved elsewhere.
+
+Any object exposing `get_json(session, url, params, timeout)`, a
+`changed` flag and stage()/commit()/discard() can be passed to the
+extractor in place of DiskResponseCache.
+
+'''
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+def cache_key(url, params=None):
+    """
+    Build the cache key of a request.
+
+    Args:
+        url (str): Request URL.
+        params (dict): Query parameters.
+
+    Returns:
+        str: Hex digest identifying the URL and its sorted parameters.
+    """
+    query = urlencode(sorted((params or {}).items()))
+    return hashlib.sha256(f"{url}?{query}".encode("utf-8")).hexdigest()
+
+class DiskResponseCache:
+    """
+    Cache response bodies and validators on local disk with size and TTL eviction.
+
+    Args:
+        cache_dir (str): Directory holding the cache entries.
+        max_bytes (int): Total body size above which least recently used entries are evicted.
+        ttl_seconds (int): Age after which an entry is discarded instead of revalidated.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # Set when any response differs from its cached copy
+        self.changed = False
+        # When set, entries are served from disk without contacting upstream
+        self.offline = False
+        # Directory of the staged entries, while staging
+        self.staging_dir = None
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(
+            os.path.getsize(os.path.join(cache_dir, name))
+            for name in os.listdir(cache_dir) if name.endswith(".body")
+        )
+
+    def _paths(self, key, directory=None):
+        base = os.path.join(directory or self.cache_dir, key)
+        return f"{base}.meta.json", f"{base}.body"
+
+    def stage(self):
+        """
+        Start staging: responses stored from now on are kept aside until commit().
+
+        Staged entries are served by lookup() like committed ones, so a
+        second pass over the same pages (see `offline`) reads them back.
+        """
+        if self.staging_dir is None:
+            self.staging_dir = os.path.join(self.cache_dir, f"staging-{uuid.uuid4().hex}")
+            os.makedirs(self.staging_dir)
+
+    def commit(self):
+        """Make the staged entries permanent and stop staging."""
+        if self.staging_dir is None:
+            return
+        for name in sorted(os.listdir(self.staging_dir), key=lambda name: name.endswith(".meta.json")):
+            # Bodies move before their metadata, so a committed entry is never half-written
+            path = os.path.join(self.cache_dir, name)
+            previous_size = os.path.getsize(path) if name.endswith(".body") and os.path.exists(path) else 0
+            os.replace(os.path.join(self.staging_dir, name), path)
+            if name.endswith(".body"):
+                with self._lock:
+                    self._total_bytes += os.path.getsize(path) - previous_size
+        self.discard()
+        self.evict()
+
+    def discard(self):
+        """Drop the staged entries and stop staging; committed entries are untouched."""
+        if self.staging_dir is None:
+            return
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        self.staging_dir = None
+
+    def lookup(self, url, params=None):
+        """
+        Return a fresh cache entry, dropping it if it outlived the TTL.
+
+        Args:
+            url (str): Request URL.
+            params (dict): Query parameters.
+
+        Returns:
+            dict: Entry metadata plus its `body` bytes, or None on a miss.
+        """
+        key = cache_key(url, params)
+        if self.staging_dir is not None:
+            meta_path, body_path = self._paths(key, self.staging_dir)
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as meta_file:
+                    entry = json.load(meta_file)
+                with open(body_path, "rb") as body_file:
+                    entry["body"] = body_file.read()
+                return entry
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as meta_file:
+                entry = json.load(meta_file)
+            if time.time() - entry["stored_at"] > self.ttl_seconds:
+                with self._lock:
+                    self._drop(meta_path, body_path)
+                return None
+            with open(body_path, "rb") as body_file:
+                entry["body"] = body_file.read()
+            os.utime(meta_path)  # Mark as recently used for eviction
+            return entry
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def store(self, url, params, response, body_hash):
+        """
+        Store (or, while staging, stage) a response body and its validators.
+
+        Args:
+            url (str): Request URL.
+            params (dict): Query parameters.
+            response (requests.Response): The 200 response.
+            body_hash (str): Digest of the response body.
+        """
+        staging_dir = self.staging_dir
+        meta_path, body_path = self._paths(cache_key(url, params), staging_dir)
+        entry = {
+            "url": url,
+            "params": params,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body_hash": body_hash,
+            "stored_at": time.time(),
+        }
+        previous_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+        self._atomic_write(body_path, response.content)
+        self._atomic_write(meta_path, json.dumps(entry).encode("utf-8"))
+        if staging_dir is not None:
+            return  # Counted towards max_bytes on commit
+        with self._lock:
+            self._total_bytes += len(response.content) - previous_size
+        self.evict()
+
+    def evict(self):
+        """
+        Evict least recently used entries until the cache fits in `max_bytes`.
+        """
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+            metas = [
+                os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir) if name.endswith(".meta.json")
+            ]
+            metas.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+            for meta_path in metas:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._drop(meta_path, meta_path[:-len(".meta.json")] + ".body")
+            logging.info(f"Response cache evicted down to {self._total_bytes} bytes.")
+
+    def get_json(self, session, url, params, timeout):
+        """
+        Fetch a JSON response, revalidating any cached copy with conditional headers.
+
+        Args:
+            session (requests.Session): Session used for the request.
+            url (str): Request URL.
+            params (dict): Query parameters.
+            timeout (float): Request timeout in seconds.
+
+        Returns:
+            dict: The decoded JSON body.
+        """
+        cached = self.lookup(url, params)
+        if cached is not None and self.offline:
+            return json.loads(cached["body"])
+
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = session.get(url, params=params, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached is not None:
+            return json.loads(cached["body"])
+        response.raise_for_status()  # Will raise an HTTPError for bad responses (4xx, 5xx)
+
+        body_hash = hashlib.sha256(response.content).hexdigest()
+        if cached is None or cached["body_hash"] != body_hash:
+            self.changed = True
+        self.store(url, params, response, body_hash)
+        return response.json()
+
+    def _drop(self, meta_path, body_path):
+        # Callers hold self._lock
+        size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+        self._remove(meta_path, body_path)
+        self._total_bytes -= size
+
+    @staticmethod
+    def _atomic_write(path, payload):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(payload)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _remove(*paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,146 @@
+'''
+Rate Limiting and Retries for API Extraction
+
+A token bucket keeps concurrent page requests inside the upstream quota,
+and transient failures (timeouts, connection errors, 429 and 5xx) are
+retried per request with exponential backoff and full jitter. When the
+server sends Retry-After, the retry waits exactly that long; a request
+told to wait longer than the adapter's `max_retry_after` is not retried
+early but fails with the server's response. Both are applied by an HTTP
+adapter mounted on the extractor's session, so only the failed page is retried.
+
+'''
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Status codes worth retrying
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum burst size.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Block until `tokens` tokens are available, then take them.
+
+        Args:
+            tokens (float): Number of tokens to take.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Exponential backoff with full jitter.
+
+    Args:
+        attempt (int): Zero-based retry attempt.
+        base_delay (float): Delay ceiling of the first retry, in seconds.
+        max_delay (float): Upper bound on any delay, in seconds.
+
+    Returns:
+        float: Seconds to sleep before the next attempt.
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header (delta-seconds or HTTP-date).
+
+    Args:
+        value (str): The header value, or None.
+
+    Returns:
+        float: Seconds to wait, or None if absent or unparseable.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RetryingAdapter(HTTPAdapter):
+    """
+    HTTP adapter that rate limits every attempt and retries transient failures.
+
+    Args:
+        rate_limiter (TokenBucket): Shared limiter, or None for no limit.
+        max_retries (int): Retries after the first attempt.
+        base_delay (float): Backoff delay ceiling of the first retry, in seconds.
+        max_delay (float): Upper bound on any backoff wait, in seconds.
+        max_retry_after (float): Longest Retry-After honoured, in seconds; a response asking
+            for a longer wait is returned instead of retried.
+        **kwargs: Passed to HTTPAdapter (e.g. pool sizes).
+    """
+
+    def __init__(self, rate_limiter=None, max_retries=5, base_delay=0.5, max_delay=30.0, max_retry_after=300.0,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter
+        self.retry_attempts = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            except (ConnectionError, Timeout) as err:
+                if attempt >= self.retry_attempts:
+                    raise
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                logging.warning(f"{err.__class__.__name__} on {request.url}; retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retry_attempts:
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is None:
+                    delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                elif retry_after > self.max_retry_after:
+                    logging.warning(f"HTTP {response.status_code} on {request.url} asks to retry after "
+                                    f"{retry_after:.0f}s, beyond the {self.max_retry_after:.0f}s limit; giving up")
+                    return response
+                else:
+                    delay = retry_after
+                logging.warning(f"HTTP {response.status_code} on {request.url}; retrying in {delay:.2f}s")
+                response.close()
+            time.sleep(delay)
+            attempt += 1
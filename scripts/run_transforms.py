@@ -0,0 +1,316 @@
+'''
+Parallel Transform Runner
+
+Runs the transform of every configured entity concurrently in a process
+pool. Large uncompressed NDJSON objects are additionally split into byte
+range shards, each transformed by its own worker into its own output
+file, so every core of the Airflow worker is used. Results from all
+workers are consolidated into one per-entity summary.
+
+With a staging prefix, every output file is uploaded to
+gs://<bucket>/<staging_prefix>/<entity>/ and removed locally, ready for
+a wildcard load_table_from_uri (see staged_uri_pattern).
+
+With skip_unchanged, entities whose raw object and transform code match
+the fingerprint of their last successful transform are not transformed
+again; their previously staged outputs are reported instead.
+
+'''
+import logging
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from clients import get_storage_client
+import fingerprint
+import metrics
+from columnar import FILE_EXTENSIONS, OUTPUT_FORMAT, output_path
+from endpoints import ENTITIES
+from ndjson_io import raw_blob_name
+from streaming_transform import DEFAULT_BATCH_SIZE, stream_transform
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Output file stem of each entity
+ENTITY_OUTPUT_STEMS = {entity: config["output_stem"] for entity, config in ENTITIES.items()}
+
+# Raw objects larger than this are split into shards of about this size
+DEFAULT_SHARD_BYTES = int(os.environ.get("TRANSFORM_SHARD_BYTES", 256 * 1024 * 1024))
+
+DEFAULT_WORKERS = int(os.environ.get("TRANSFORM_WORKERS", os.cpu_count() or 1))
+
+def staged_uri_pattern(bucket_name, staging_prefix, entity, output_format=OUTPUT_FORMAT):
+    """
+    Build the wildcard GCS URI matching every staged shard of an entity.
+
+    Args:
+        bucket_name (str): Name of the GCS bucket.
+        staging_prefix (str): Prefix the outputs were staged under.
+        entity (str): "users", "products" or "carts".
+        output_format (str): "parquet", "avro" or "csv".
+
+    Returns:
+        str: URI such as `gs://bucket/staged/20240101T000000/users/*.parquet`.
+    """
+    return f"gs://{bucket_name}/{staging_prefix}/{entity}/*{FILE_EXTENSIONS[output_format]}"
+
+def plan_tasks(bucket_name, entities, output_dir=".", output_format=OUTPUT_FORMAT, shard_bytes=DEFAULT_SHARD_BYTES,
+               batch_size=DEFAULT_BATCH_SIZE, staging_prefix=None, blob_names=None):
+    """
+    Build one transform task per entity, or per shard of a large entity.
+
+    Only uncompressed NDJSON objects are sharded; gzip and JSON documents
+    cannot be split at arbitrary byte offsets.
+
+    An entity is read from its full raw dump unless `blob_names` names
+    another object for it, such as the delta of an incremental extraction
+    (see ndjson_io.delta_blob_name).
+
+    Args:
+        bucket_name (str): Name of the GCS bucket holding the raw objects.
+        entities (list): Entities to transform.
+        output_dir (str): Directory of the output files.
+        output_format (str): "parquet" or "csv".
+        shard_bytes (int): Target shard size in bytes.
+        batch_size (int): Records normalized per batch.
+        staging_prefix (str): GCS prefix to upload the outputs under, or None to keep them local.
+        blob_names (dict): Raw object to read per entity, instead of its full raw dump.
+
+    Returns:
+        list: Task dicts accepted by run_transform_task.
+    """
+    client = get_storage_client()
+    bucket = client.bucket(bucket_name)
+    tasks = []
+    for entity in entities:
+        blob_name = (blob_names or {}).get(entity) or raw_blob_name(entity)
+        blob = bucket.get_blob(blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"The object '{blob_name}' does not exist in the bucket '{bucket_name}'.")
+
+        shard_count = max(1, math.ceil(blob.size / shard_bytes)) if blob_name.endswith(".ndjson") else 1
+        stem = os.path.join(output_dir, ENTITY_OUTPUT_STEMS[entity])
+        for shard in range(shard_count):
+            byte_range = None
+            shard_stem = stem
+            if shard_count > 1:
+                byte_range = (blob.size * shard // shard_count, blob.size * (shard + 1) // shard_count)
+                shard_stem = f"{stem}-{shard:05d}-of-{shard_count:05d}"
+            output_file = output_path(shard_stem, output_format)
+            staged_blob_name = None
+            if staging_prefix:
+                staged_blob_name = f"{staging_prefix}/{entity}/{os.path.basename(output_file)}"
+            tasks.append({
+                "entity": entity,
+                "bucket_name": bucket_name,
+                "blob_name": blob_name,
+                "shard": shard,
+                "shard_count": shard_count,
+                "byte_range": byte_range,
+                "output_file": output_file,
+                "staged_blob_name": staged_blob_name,
+                "batch_size": batch_size,
+            })
+    return tasks
+
+def run_transform_task(task):
+    """
+    Run one transform task in a worker process.
+
+    The local output of a shard that wrote no rows, or that failed, is removed.
+
+    Args:
+        task (dict): A task built by plan_tasks.
+
+    Returns:
+        dict: The task plus `rows`, `seconds`, `output` (local path or staged URI)
+            and `error` (None on success).
+    """
+    started = time.perf_counter()
+    result = dict(task, rows=0, output=task["output_file"], error=None)
+    try:
+        result["rows"] = stream_transform(
+            task["bucket_name"], task["blob_name"], task["entity"], task["output_file"],
+            batch_size=task["batch_size"], byte_range=task["byte_range"],
+        )
+        if task["staged_blob_name"] and result["rows"]:
+            client = get_storage_client()
+            blob = client.bucket(task["bucket_name"]).blob(task["staged_blob_name"])
+            with metrics.stage("transform.upload", entity=task["entity"]) as timer:
+                blob.upload_from_filename(task["output_file"])
+                timer.add(rows=result["rows"], bytes=os.path.getsize(task["output_file"]))
+            os.remove(task["output_file"])
+            result["output"] = f"gs://{task['bucket_name']}/{task['staged_blob_name']}"
+    except Exception as e:
+        logging.error(f"Transform of {task['entity']} shard {task['shard']} failed: {e}")
+        result["error"] = str(e)
+    # A shard with no rows, or a failed one, leaves nothing worth keeping behind
+    if (result["error"] or not result["rows"]) and os.path.exists(task["output_file"]):
+        os.remove(task["output_file"])
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def run_transform_task_in_worker(task):
+    """
+    Run one transform task in a pool worker and hand its metrics back to the parent.
+
+    Args:
+        task (dict): A task built by plan_tasks.
+
+    Returns:
+        dict: The run_transform_task result plus the worker's `metrics` for this task.
+    """
+    result = run_transform_task(task)
+    result["metrics"] = metrics.drain()
+    return result
+
+def consolidate_results(results):
+    """
+    Summarize task results per entity.
+
+    Args:
+        results (list): Results returned by run_transform_task.
+
+    Returns:
+        dict: Per entity: total rows, shard count, outputs (local paths or staged URIs
+            of the shards that produced rows), slowest shard duration, errors and
+            whether the transform was skipped.
+    """
+    summary = {}
+    for result in sorted(results, key=lambda r: (r["entity"], r["shard"])):
+        entity = summary.setdefault(result["entity"], {
+            "rows": 0, "shards": 0, "outputs": [], "seconds": 0.0, "errors": [], "skipped": False,
+        })
+        entity["rows"] += result["rows"]
+        entity["shards"] += 1
+        entity["seconds"] = max(entity["seconds"], result["seconds"])
+        if result["rows"]:
+            entity["outputs"].append(result["output"])
+        if result["error"]:
+            entity["errors"].append(f"shard {result['shard']}: {result['error']}")
+    return summary
+
+def find_unchanged(bucket_name, entities, output_format=OUTPUT_FORMAT, blob_names=None):
+    """
+    Compare each entity's raw object and transform code against its last successful transform.
+
+    Args:
+        bucket_name (str): Name of the GCS bucket holding the raw objects and state.
+        entities (list): Entities to check.
+        output_format (str): Output format of this run; a different format is a change.
+        blob_names (dict): Raw object transformed per entity, as passed to plan_tasks.
+
+    Returns:
+        tuple: (fingerprints, unchanged) where `fingerprints` maps every entity with a
+            raw object to its current fingerprint and `unchanged` maps skippable
+            entities to their stored transform state.
+    """
+    client = get_storage_client()
+    bucket = client.bucket(bucket_name)
+    version = fingerprint.code_version(fingerprint.TRANSFORM_MODULES)
+    fingerprints = {}
+    unchanged = {}
+    for entity in entities:
+        blob = bucket.get_blob((blob_names or {}).get(entity) or raw_blob_name(entity))
+        if blob is None:
+            continue
+        fingerprints[entity] = fingerprint.compute_fingerprint(
+            [fingerprint.blob_fingerprint(blob)], version, {"output_format": output_format},
+        )
+        state = fingerprint.load_stage_state(bucket, "transform", entity)
+        # The staged outputs of the previous run must still be there to be reused
+        if fingerprint.is_unchanged(state, fingerprints[entity]) and fingerprint.uri_fingerprints(client, state["source_uri"]):
+            unchanged[entity] = state
+    return fingerprints, unchanged
+
+def record_transform(bucket, entity, fingerprint_value, source_uri, rows, outputs):
+    """
+    Record an entity's successful transform so unchanged reruns can reuse its outputs.
+
+    Args:
+        bucket (google.cloud.storage.Bucket): Bucket holding the state objects.
+        entity (str): "users", "products" or "carts".
+        fingerprint_value (str): Fingerprint from find_unchanged.
+        source_uri (str): Wildcard URI of the staged outputs.
+        rows (int): Rows written.
+        outputs (list): Staged output URIs.
+    """
+    fingerprint.save_stage_state(bucket, "transform", entity, fingerprint_value,
+                                 source_uri=source_uri, rows=rows, outputs=outputs)
+
+def run_transforms(bucket_name, entities=tuple(ENTITY_OUTPUT_STEMS), max_workers=DEFAULT_WORKERS, skip_unchanged=False,
+                   **plan_options):
+    """
+    Transform all entities concurrently in a process pool.
+
+    Args:
+        bucket_name (str): Name of the GCS bucket holding the raw objects.
+        entities (iterable): Entities to transform.
+        max_workers (int): Number of worker processes.
+        skip_unchanged (bool): Skip entities whose inputs and code are unchanged since their
+            last successful transform, and record the fingerprints of the ones transformed.
+            Requires a staging prefix.
+        **plan_options: Passed to plan_tasks (output_dir, output_format, shard_bytes, batch_size,
+            staging_prefix, blob_names).
+
+    Returns:
+        dict: Consolidated per-entity summary (see consolidate_results). Skipped entities report
+            the rows, outputs and `source_uri` of the transform they reuse.
+    """
+    entities = list(entities)
+    output_format = plan_options.get("output_format", OUTPUT_FORMAT)
+    staging_prefix = plan_options.get("staging_prefix")
+    fingerprints = {}
+    unchanged = {}
+    if skip_unchanged:
+        if not staging_prefix:
+            raise ValueError("Skipping unchanged entities requires a staging prefix.")
+        fingerprints, unchanged = find_unchanged(bucket_name, entities, output_format, plan_options.get("blob_names"))
+        entities = [entity for entity in entities if entity not in unchanged]
+        for entity in unchanged:
+            logging.info(f"{entity}: raw data and transform code unchanged; reusing {unchanged[entity]['source_uri']}")
+
+    results = []
+    if entities:
+        tasks = plan_tasks(bucket_name, entities, **plan_options)
+        logging.info(f"Running {len(tasks)} transform tasks on {max_workers} worker processes.")
+
+        # Spawn rather than fork so workers never inherit live client connections
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+            futures = [pool.submit(run_transform_task_in_worker, task) for task in tasks]
+            results = [future.result() for future in as_completed(futures)]
+        for result in results:
+            metrics.merge(result.pop("metrics"))
+
+    summary = consolidate_results(results)
+    for entity, entity_summary in summary.items():
+        logging.info(f"{entity}: {entity_summary['rows']} rows from {entity_summary['shards']} shards "
+                     f"in {entity_summary['seconds']:.2f}s")
+
+    if skip_unchanged:
+        bucket = get_storage_client().bucket(bucket_name)
+        for entity, entity_summary in summary.items():
+            if entity_summary["errors"] or entity not in fingerprints:
+                continue
+            entity_summary["source_uri"] = staged_uri_pattern(bucket_name, staging_prefix, entity, output_format)
+            record_transform(bucket, entity, fingerprints[entity], entity_summary["source_uri"],
+                             entity_summary["rows"], entity_summary["outputs"])
+        for entity, state in unchanged.items():
+            summary[entity] = {
+                "rows": state["rows"], "shards": 0, "outputs": state["outputs"], "seconds": 0.0, "errors": [],
+                "skipped": True, "source_uri": state["source_uri"],
+            }
+    return summary
+
+if __name__ == "__main__":
+    bucket_name = "savannah_informatics_assesment"
+
+    summary = run_transforms(bucket_name)
+    failed = [entity for entity, entity_summary in summary.items() if entity_summary["errors"]]
+    if failed:
+        logging.error(f"Transforms failed for: {', '.join(failed)}")
+
+    metrics.export_metrics(task="run_transforms")
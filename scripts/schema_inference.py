@@ -0,0 +1,275 @@
+'''
+Typed Schema Inference for CSV Sources
+
+Samples the rows of a CSV file (or reads all of it, one row at a time)
+and picks the narrowest BigQuery type every value of a column parses as:
+BOOLEAN, INTEGER, NUMERIC, FLOAT, DATE, TIMESTAMP, or STRING as the
+fallback. Numeric columns such as `price` and `total_cart_value` are thus
+stored as numbers rather than strings that every query has to CAST. The
+transform writes money columns with at most nine decimals (see
+columnar.MONEY_COLUMNS), so a NUMERIC inferred from a sample also fits
+the rows after it.
+
+Tables the pipeline declares (see endpoints.ENTITIES) are not sampled:
+their column types are passed in as `declared_types` and used as is, so a
+sample that happens to lack, say, a postal code with a leading zero cannot
+type the column INTEGER. Only undeclared sources are inferred.
+
+Inferred schemas are cached per source, keyed by a hash of the header
+row, so repeated loads of the same file layout skip the sampling pass.
+The loader names the source after the destination table and format, so
+the cache also hits across runs that stage their files under new paths.
+
+'''
+import csv
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+from google.cloud import bigquery
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Rows sampled per file; 0 scans the whole file
+SAMPLE_ROWS = int(os.environ.get("LOAD_SCHEMA_SAMPLE_ROWS", 10_000))
+
+# Bytes read from the head of a GCS object to sample it
+SAMPLE_BYTES = 4 * 1024 * 1024
+
+# Directory persisting inferred schemas between runs, or None for in-process caching only
+SCHEMA_CACHE_DIR = os.environ.get("LOAD_SCHEMA_CACHE_DIR")
+
+# Candidate types from narrowest to widest; a column gets the first one all its values fit
+TYPE_PREFERENCE = ["BOOLEAN", "INTEGER", "NUMERIC", "FLOAT", "DATE", "TIMESTAMP", "STRING"]
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+_INTEGER_PATTERN = re.compile(r"[+-]?\d+")
+# NUMERIC holds 29 integer digits and 9 fractional digits exactly
+_NUMERIC_PATTERN = re.compile(r"[+-]?\d{0,29}(\.\d{0,9})?")
+_FLOAT_PATTERN = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|[+-]?(inf|infinity|nan)", re.IGNORECASE)
+_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+_TIMESTAMP_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d{1,6})?)?(Z|[+-]\d{2}:?\d{2})?")
+
+# Digit strings with a leading zero (postal codes, ids) stay STRING so the zero is kept
+_LEADING_ZERO_PATTERN = re.compile(r"[+-]?0\d")
+
+_schema_cache = {}
+
+def _is_integer(value):
+    if not _INTEGER_PATTERN.fullmatch(value) or _LEADING_ZERO_PATTERN.match(value):
+        return False
+    return INT64_MIN <= int(value) <= INT64_MAX
+
+def _is_numeric(value):
+    if not _NUMERIC_PATTERN.fullmatch(value) or _LEADING_ZERO_PATTERN.match(value):
+        return False
+    return any(char.isdigit() for char in value)
+
+def _is_date(value):
+    if not _DATE_PATTERN.fullmatch(value):
+        return False
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+def _is_timestamp(value):
+    if _is_date(value):
+        return True
+    if not _TIMESTAMP_PATTERN.fullmatch(value):
+        return False
+    try:
+        datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    return True
+
+# Value tests of every candidate type except the STRING fallback
+TYPE_CHECKS = {
+    "BOOLEAN": lambda value: value.lower() in ("true", "false"),
+    "INTEGER": _is_integer,
+    "NUMERIC": _is_numeric,
+    "FLOAT": lambda value: bool(_FLOAT_PATTERN.fullmatch(value)) and not _LEADING_ZERO_PATTERN.match(value),
+    "DATE": _is_date,
+    "TIMESTAMP": _is_timestamp,
+}
+
+def infer_column_types(header, rows, sample_rows=SAMPLE_ROWS):
+    """
+    Infer the BigQuery type of every column from its values.
+
+    Empty values are treated as NULL and do not constrain the type; a column
+    with no values at all is typed STRING.
+
+    Args:
+        header (list): Column names.
+        rows (iterable): Data rows as lists of strings.
+        sample_rows (int): Maximum rows examined; 0 examines every row.
+
+    Returns:
+        list: bigquery.SchemaField objects, all NULLABLE.
+    """
+    candidates = [set(TYPE_CHECKS) for _ in header]
+    seen = [False] * len(header)
+    open_columns = set(range(len(header)))
+
+    for number, row in enumerate(rows):
+        if sample_rows and number >= sample_rows:
+            break
+        for index in list(open_columns):
+            value = row[index].strip() if index < len(row) else ""
+            if not value:
+                continue
+            seen[index] = True
+            candidates[index] = {name for name in candidates[index] if TYPE_CHECKS[name](value)}
+            if not candidates[index]:
+                open_columns.discard(index)
+        if not open_columns:
+            break
+
+    schema = []
+    for name, types, has_values in zip(header, candidates, seen):
+        field_type = next((t for t in TYPE_PREFERENCE if t in types), "STRING") if has_values else "STRING"
+        schema.append(bigquery.SchemaField(name, field_type))
+    return schema
+
+def schema_cache_key(source, header):
+    """
+    Build the cache key of a source's schema.
+
+    Args:
+        source (str): Source identifier, e.g. a file name or GCS URI pattern.
+        header (list): Column names from the header row.
+
+    Returns:
+        str: Hex digest of the source and its header.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(source.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(header).encode("utf-8"))
+    return digest.hexdigest()
+
+def _load_cached_schema(key, cache_dir):
+    if key in _schema_cache:
+        return _schema_cache[key]
+    if not cache_dir:
+        return None
+    path = os.path.join(cache_dir, f"{key}.schema.json")
+    try:
+        with open(path, "r", encoding="utf-8") as cache_file:
+            schema = [bigquery.SchemaField.from_api_repr(field) for field in json.load(cache_file)]
+    except (OSError, ValueError):
+        return None
+    _schema_cache[key] = schema
+    return schema
+
+def _store_cached_schema(key, schema, cache_dir):
+    _schema_cache[key] = schema
+    if not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.schema.json")
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as cache_file:
+        json.dump([field.to_api_repr() for field in schema], cache_file)
+    os.replace(temp_path, path)
+
+def infer_schema_from_rows(source, reader, sample_rows=SAMPLE_ROWS, cache_dir=SCHEMA_CACHE_DIR, refresh=False,
+                           declared_types=None):
+    """
+    Infer a typed schema from a CSV reader, consulting the schema cache first.
+
+    Args:
+        source (str): Source identifier used in the cache key.
+        reader (csv.reader): Reader positioned at the header row.
+        sample_rows (int): Maximum rows examined; 0 examines every row.
+        cache_dir (str): Directory persisting schemas, or None.
+        refresh (bool): Ignore a cached schema and sample again.
+        declared_types (dict): Column name to BigQuery type; used instead of sampling
+            when it covers every column of the header.
+
+    Returns:
+        list: bigquery.SchemaField objects.
+    """
+    header = next(reader)
+    if declared_types and all(name in declared_types for name in header):
+        logging.info(f"Using the declared schema for {source}")
+        return [bigquery.SchemaField(name, declared_types[name]) for name in header]
+    if declared_types:
+        logging.warning(f"Columns of {source} not declared: {[name for name in header if name not in declared_types]}")
+    key = schema_cache_key(source, header)
+    schema = None if refresh else _load_cached_schema(key, cache_dir)
+    if schema is not None:
+        logging.info(f"Using cached schema for {source}")
+        return schema
+
+    schema = infer_column_types(header, reader, sample_rows)
+    _store_cached_schema(key, schema, cache_dir)
+    logging.info(f"Inferred schema for {source}: {[(field.name, field.field_type) for field in schema]}")
+    return schema
+
+def infer_schema_from_file(file_path, sample_rows=SAMPLE_ROWS, cache_dir=SCHEMA_CACHE_DIR, refresh=False,
+                           cache_source=None, declared_types=None):
+    """
+    Infer a typed schema from a local CSV file.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        sample_rows (int): Maximum rows examined; 0 streams through the whole file.
+        cache_dir (str): Directory persisting schemas, or None.
+        refresh (bool): Ignore a cached schema and sample again.
+        cache_source (str): Source identifier used in the cache key; the file name if None.
+        declared_types (dict): Declared column types (see infer_schema_from_rows).
+
+    Returns:
+        list: bigquery.SchemaField objects.
+    """
+    source = cache_source or os.path.basename(file_path)
+    with open(file_path, mode="r", encoding="utf-8", newline="") as csv_file:
+        return infer_schema_from_rows(source, csv.reader(csv_file), sample_rows, cache_dir, refresh, declared_types)
+
+def infer_schema_from_gcs(uri, storage_client=None, sample_rows=SAMPLE_ROWS, cache_dir=SCHEMA_CACHE_DIR, refresh=False,
+                          cache_source=None, declared_types=None):
+    """
+    Infer a typed schema from the head of the first CSV object matching a GCS URI.
+
+    Only the first SAMPLE_BYTES of the object are downloaded.
+
+    Args:
+        uri (str): `gs://bucket/path` URI, optionally with a wildcard.
+        storage_client (storage.Client): Client to use; the shared one if None.
+        sample_rows (int): Maximum rows examined.
+        cache_dir (str): Directory persisting schemas, or None.
+        refresh (bool): Ignore a cached schema and sample again.
+        cache_source (str): Source identifier used in the cache key; the URI if None.
+        declared_types (dict): Declared column types (see infer_schema_from_rows).
+
+    Returns:
+        list: bigquery.SchemaField objects.
+    """
+    import fnmatch
+    from clients import get_storage_client
+
+    storage_client = storage_client or get_storage_client()
+    bucket_name, _, pattern = uri[len("gs://"):].partition("/")
+    prefix = pattern.split("*", 1)[0]
+    blob = next(
+        (blob for blob in storage_client.list_blobs(bucket_name, prefix=prefix) if fnmatch.fnmatchcase(blob.name, pattern)),
+        None,
+    )
+    if blob is None:
+        raise FileNotFoundError(f"No object matches {uri}")
+
+    head = blob.download_as_bytes(start=0, end=SAMPLE_BYTES - 1)
+    if len(head) >= SAMPLE_BYTES:
+        # Drop the row cut off at the end of the sampled range
+        head = head[:head.rfind(b"\n") + 1]
+    reader = csv.reader(io.StringIO(head.decode("utf-8", errors="replace")))
+    return infer_schema_from_rows(cache_source or uri, reader, sample_rows, cache_dir, refresh, declared_types)
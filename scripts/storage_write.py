@@ -0,0 +1,249 @@
+'''
+BigQuery Storage Write API Sink
+
+Streams transformed rows into BigQuery through the Storage Write API
+instead of a load job, so a run's rows become queryable within seconds
+and do not count against the per-table load job quota.
+
+Rows are sent as serialized Arrow record batches on an explicitly created
+write stream. Every append carries its row offset, so an append retried
+after a dropped connection is rejected as ALREADY_EXISTS rather than
+written twice. In "committed" mode rows are visible as soon as each
+append is acknowledged; in "pending" mode they become visible atomically
+when the stream is finalized and committed.
+
+Requires the optional `google-cloud-bigquery-storage` package.
+
+'''
+import logging
+import os
+import time
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from google.api_core.exceptions import (
+    AlreadyExists, DeadlineExceeded, InternalServerError, ServiceUnavailable, TooManyRequests,
+)
+from google.cloud import bigquery
+from clients import get_write_client
+import metrics
+from retry import backoff_delay
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Rows per append request
+DEFAULT_BATCH_ROWS = int(os.environ.get("STREAM_BATCH_ROWS", 50_000))
+
+# AppendRows requests are limited to 10 MB; leave room for the envelope
+MAX_APPEND_BYTES = 9 * 1024 * 1024
+
+MAX_RETRIES = int(os.environ.get("STREAM_MAX_RETRIES", 5))
+
+# google.rpc.Code values reported in AppendRowsResponse.error
+ALREADY_EXISTS_CODE = 6
+
+# Errors after which the connection is reopened and unacknowledged appends resent
+TRANSIENT_ERRORS = (DeadlineExceeded, InternalServerError, ServiceUnavailable, TooManyRequests)
+
+# Arrow column type for each BigQuery type of an inferred CSV schema
+ARROW_TYPES = {
+    "STRING": pa.string(),
+    "INTEGER": pa.int64(),
+    "FLOAT": pa.float64(),
+    "NUMERIC": pa.decimal128(38, 9),
+    "BOOLEAN": pa.bool_(),
+    "DATE": pa.date32(),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+}
+
+# BigQuery type for each Arrow type of a Parquet file
+BIGQUERY_TYPES = {
+    pa.string(): "STRING",
+    pa.int64(): "INTEGER",
+    pa.float64(): "FLOAT",
+    pa.decimal128(38, 9): "NUMERIC",
+    pa.bool_(): "BOOLEAN",
+    pa.date32(): "DATE",
+}
+
+def create_write_client(credentials_path=None):
+    """
+    Return the shared Storage Write API client.
+
+    Args:
+        credentials_path (str): Path to the GCP service account JSON key file,
+            or None to use application default credentials.
+
+    Returns:
+        bigquery_storage_v1.BigQueryWriteClient: The client.
+    """
+    return get_write_client(credentials_path)
+
+def table_path(table_id):
+    """
+    Convert a `project.dataset.table` id into the resource path used by the Storage Write API.
+
+    Args:
+        table_id (str): Fully qualified table id.
+
+    Returns:
+        str: Path such as `projects/p/datasets/d/tables/t`.
+    """
+    parts = table_id.split(".")
+    if len(parts) != 3:
+        raise ValueError(f"Table id must be fully qualified as project.dataset.table: {table_id}")
+    return "projects/{}/datasets/{}/tables/{}".format(*parts)
+
+def read_arrow_table(file_path, schema=None):
+    """
+    Read a transform output into an Arrow table with a matching BigQuery schema.
+
+    Args:
+        file_path (str): Path ending in .parquet or .csv.
+        schema (list): bigquery.SchemaField objects typing a CSV file's columns.
+
+    Returns:
+        tuple: (pyarrow.Table, list of bigquery.SchemaField).
+    """
+    if file_path.endswith(".parquet"):
+        table = pq.read_table(file_path).replace_schema_metadata(None)
+        schema = [bigquery.SchemaField(field.name, BIGQUERY_TYPES.get(field.type, "STRING")) for field in table.schema]
+        return table, schema
+    if file_path.endswith(".csv"):
+        column_types = {field.name: ARROW_TYPES[field.field_type] for field in schema}
+        table = pa_csv.read_csv(file_path, convert_options=pa_csv.ConvertOptions(column_types=column_types))
+        return table, schema
+    raise ValueError(f"Unsupported file for streaming: {file_path}")
+
+def split_batches(table, batch_rows=DEFAULT_BATCH_ROWS, max_bytes=MAX_APPEND_BYTES):
+    """
+    Split a table into serialized record batches that each fit in one append request.
+
+    Args:
+        table (pyarrow.Table): Rows to send.
+        batch_rows (int): Maximum rows per batch.
+        max_bytes (int): Maximum serialized size per batch.
+
+    Returns:
+        list: (row_count, serialized_record_batch) tuples in row order.
+    """
+    batches = []
+    pending = list(reversed(table.combine_chunks().to_batches(max_chunksize=batch_rows)))
+    while pending:
+        batch = pending.pop()
+        payload = batch.serialize().to_pybytes()
+        if len(payload) > max_bytes and batch.num_rows > 1:
+            half = batch.num_rows // 2
+            pending.extend([batch.slice(half), batch.slice(0, half)])
+            continue
+        batches.append((batch.num_rows, payload))
+    return batches
+
+def _append_requests(types, stream_name, serialized_schema, batches, offsets, first):
+    """Yield the append requests of one connection, starting at batch `first`."""
+    for index in range(first, len(batches)):
+        row_count, payload = batches[index]
+        arrow_rows = types.AppendRowsRequest.ArrowData(
+            rows=types.ArrowRecordBatch(serialized_record_batch=payload, row_count=row_count),
+        )
+        if index == first:
+            # The writer schema is only sent on the first request of a connection
+            arrow_rows.writer_schema = types.ArrowSchema(serialized_schema=serialized_schema)
+        yield types.AppendRowsRequest(write_stream=stream_name, offset=offsets[index], arrow_rows=arrow_rows)
+
+def append_batches(write_client, stream_name, schema, batches, max_retries=MAX_RETRIES):
+    """
+    Append serialized batches to a write stream, exactly once.
+
+    Each batch is sent at its row offset. After a transient failure the
+    connection is reopened and every unacknowledged batch is resent; a batch
+    the server had already written is answered with ALREADY_EXISTS and
+    counted as acknowledged.
+
+    Args:
+        write_client (bigquery_storage_v1.BigQueryWriteClient): Storage Write API client.
+        stream_name (str): Name of an explicitly created write stream.
+        schema (pyarrow.Schema): Schema of the batches.
+        batches (list): (row_count, serialized_record_batch) tuples from split_batches.
+        max_retries (int): Reconnect attempts before giving up.
+
+    Returns:
+        int: Number of rows appended.
+    """
+    from google.cloud.bigquery_storage_v1 import types
+
+    serialized_schema = schema.serialize().to_pybytes()
+    offsets = []
+    total = 0
+    for row_count, _ in batches:
+        offsets.append(total)
+        total += row_count
+
+    # Routes the bidirectional stream to the write stream's backend
+    metadata = (("x-goog-request-params", f"write_stream={stream_name}"),)
+    acknowledged = 0
+    attempt = 0
+    while acknowledged < len(batches):
+        requests = _append_requests(types, stream_name, serialized_schema, batches, offsets, acknowledged)
+        try:
+            for response in write_client.append_rows(requests=requests, metadata=metadata):
+                if response.error.code and response.error.code != ALREADY_EXISTS_CODE:
+                    raise RuntimeError(f"Append at offset {offsets[acknowledged]} failed: {response.error.message}")
+                if response.row_errors:
+                    raise RuntimeError(f"Append at offset {offsets[acknowledged]} rejected rows: {response.row_errors}")
+                acknowledged += 1
+                if acknowledged == len(batches):
+                    break
+        except AlreadyExists:
+            # The connection ended on a batch the server had already written
+            acknowledged += 1
+        except TRANSIENT_ERRORS as e:
+            if attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt, 0.5, 30.0)
+            attempt += 1
+            logging.warning(f"Append stream interrupted at offset {offsets[acknowledged]} ({e}); "
+                            f"resending in {delay:.2f}s (attempt {attempt}/{max_retries})")
+            time.sleep(delay)
+    return total
+
+def stream_table_to_bigquery(write_client, table_id, table, mode="committed", batch_rows=DEFAULT_BATCH_ROWS,
+                             max_retries=MAX_RETRIES):
+    """
+    Write an Arrow table to an existing BigQuery table through the Storage Write API.
+
+    Rows are appended to the table; they do not replace its contents.
+
+    Args:
+        write_client (bigquery_storage_v1.BigQueryWriteClient): Storage Write API client.
+        table_id (str): Destination table in the format `project_id.dataset_name.table_name`.
+        table (pyarrow.Table): Rows to write, with columns matching the destination schema.
+        mode (str): "committed" (rows visible per append) or "pending" (visible at once on commit).
+        batch_rows (int): Maximum rows per append request.
+        max_retries (int): Reconnect attempts per stream.
+
+    Returns:
+        int: Number of rows written.
+    """
+    from google.cloud.bigquery_storage_v1 import types
+
+    stream_types = {"committed": types.WriteStream.Type.COMMITTED, "pending": types.WriteStream.Type.PENDING}
+    if mode not in stream_types:
+        raise ValueError(f"Unsupported stream mode: {mode}")
+
+    parent = table_path(table_id)
+    stream = write_client.create_write_stream(parent=parent, write_stream=types.WriteStream(type_=stream_types[mode]))
+    batches = split_batches(table, batch_rows)
+    logging.info(f"Streaming {table.num_rows} rows to {table_id} in {len(batches)} appends ({mode} mode)")
+    with metrics.stage("load.stream", table=table_id, mode=mode) as timer:
+        rows = append_batches(write_client, stream.name, table.schema, batches, max_retries)
+
+        if mode == "pending":
+            write_client.finalize_write_stream(name=stream.name)
+            response = write_client.batch_commit_write_streams(parent=parent, write_streams=[stream.name])
+            if response.stream_errors:
+                raise RuntimeError(f"Commit of {stream.name} failed: {response.stream_errors}")
+        timer.add(rows=rows, bytes=sum(len(payload) for _, payload in batches))
+    logging.info(f"Streamed {rows} rows to {table_id}")
+    return rows
@@ -0,0 +1,261 @@
+'''
+Chunked, Bounded-memory Transform Engine
+
+Reads a raw object from GCS incrementally (NDJSON line by line, or a JSON
+array/envelope with the optional `ijson` parser), runs the existing
+entity transform (transform.transform_records) on fixed-size batches and appends each
+batch to the output file, so peak memory tracks the batch size rather
+than the size of the raw dump.
+
+'''
+import gzip
+import io
+import json
+import logging
+import os
+import metrics
+import pyarrow as pa
+import pyarrow.parquet as pq
+from clients import get_storage_client
+from columnar import ENTITY_SCHEMAS, PARQUET_COMPRESSION, avro_schema, output_path, round_money, to_arrow_table
+from ndjson_io import raw_blob_name
+from endpoints import ENTITIES
+from record_spec import SPECS, line_decoder, select_lines, select_records
+from transform import transform_records
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Records normalized per batch; bounds peak memory
+DEFAULT_BATCH_SIZE = int(os.environ.get("TRANSFORM_BATCH_SIZE", 50_000))
+
+# Download buffer of the streaming GCS reader
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+def iter_raw_records(stream, blob_name, record_key=None, spec=None):
+    """
+    Iterate over the records of a raw dump without loading it whole.
+
+    Args:
+        stream (file-like): Binary stream of the object contents.
+        blob_name (str): Object name, used to detect gzip and NDJSON.
+        record_key (str): Key of the record list in a JSON envelope (e.g. "users").
+        spec (dict): Filter and projection applied while parsing (see record_spec.py), or None.
+
+    Yields:
+        dict: One accepted record at a time.
+    """
+    if blob_name.endswith(".gz"):
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+        blob_name = blob_name[:-3]
+
+    if blob_name.endswith(".ndjson"):
+        yield from select_lines(stream, spec)
+        return
+
+    try:
+        import ijson
+    except ImportError:
+        logging.warning("ijson is not installed; parsing the JSON document in memory.")
+        data = json.load(stream)
+        yield from select_records(data.get(record_key, []) if isinstance(data, dict) else data, spec)
+        return
+
+    # Peek at the first significant byte to tell an envelope from a bare array
+    buffered = io.BufferedReader(stream) if not hasattr(stream, "peek") else stream
+    head = buffered.peek(64).lstrip()[:1]
+    prefix = "item" if head == b"[" else f"{record_key}.item"
+    yield from select_records(ijson.items(buffered, prefix, use_float=True), spec)
+
+def iter_ndjson_range(stream, start, end, chunk_size=DOWNLOAD_CHUNK_SIZE, spec=None):
+    """
+    Iterate over the NDJSON records whose line starts in the byte range [start, end).
+
+    Splitting an uncompressed NDJSON object into byte ranges this way gives
+    every line to exactly one shard, so shards can be transformed independently.
+
+    Args:
+        stream (file-like): Seekable binary stream of the object contents.
+        start (int): First byte of the range.
+        end (int): Byte just past the range.
+        chunk_size (int): Bytes read per call.
+        spec (dict): Filter and projection applied while parsing (see record_spec.py), or None.
+
+    Yields:
+        dict: One accepted record at a time.
+    """
+    decode = line_decoder(spec)
+    # Start one byte early: the piece up to the first newline belongs to the previous shard
+    position = max(start - 1, 0)
+    skip_first = start > 0
+    stream.seek(position)
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop() if chunk else b""
+        for line in lines:
+            line_start = position
+            position += len(line) + 1
+            if skip_first:
+                skip_first = False
+                continue
+            if line_start >= end:
+                return
+            record = decode(line)
+            if record is not None:
+                yield record
+        if not chunk:
+            return
+
+def iter_batches(records, batch_size):
+    """
+    Group an iterable of records into lists of at most `batch_size`.
+
+    Args:
+        records (iterable): Records to group.
+        batch_size (int): Maximum records per batch.
+
+    Yields:
+        list: A batch of records.
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class BatchOutputWriter:
+    """
+    Append transformed batches to a single Parquet, Avro or CSV file.
+
+    Every batch is conformed to the entity's typed schema, so batches that
+    happen to lack an optional column still line up. Avro output requires
+    the optional `fastavro` package.
+
+    Args:
+        output_file (str): Path ending in .parquet, .avro or .csv.
+        entity (str): "users", "products" or "carts".
+    """
+
+    def __init__(self, output_file, entity):
+        if not output_file.endswith((".parquet", ".avro", ".csv")):
+            raise ValueError(f"Unsupported output format: {output_file}")
+        self.output_file = output_file
+        self.schema = ENTITY_SCHEMAS[entity]
+        self.entity = entity
+        self.rows_written = 0
+        self._parquet_writer = None
+        self._avro_file = None
+        self._avro_writer = None
+
+    def __enter__(self):
+        return self
+
+    def write(self, df):
+        """
+        Append one transformed batch.
+
+        Args:
+            df (pd.DataFrame): Transformed batch.
+        """
+        if self.output_file.endswith(".parquet"):
+            table = self._conform(df)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.output_file, self.schema, compression=PARQUET_COMPRESSION)
+            with metrics.stage("transform.write_output", entity=self.entity) as timer:
+                self._parquet_writer.write_table(table)
+                timer.add(rows=len(df))
+        elif self.output_file.endswith(".avro"):
+            table = self._conform(df)
+            if self._avro_writer is None:
+                self._open_avro()
+            with metrics.stage("transform.write_output", entity=self.entity) as timer:
+                for batch in table.to_batches():
+                    for row in batch.to_pylist():
+                        self._avro_writer.write(row)
+                timer.add(rows=len(df))
+        else:
+            df = round_money(df.reindex(columns=self.schema.names))
+            with metrics.stage("transform.write_output", entity=self.entity) as timer:
+                df.to_csv(self.output_file, index=False, mode="w" if self.rows_written == 0 else "a",
+                          header=self.rows_written == 0)
+                timer.add(rows=len(df))
+        self.rows_written += len(df)
+
+    def _conform(self, df):
+        """Convert a batch to an Arrow table with every column of the schema, in order."""
+        table = to_arrow_table(df, self.entity)
+        columns = [
+            table.column(field.name) if field.name in table.column_names else pa.nulls(len(table), field.type)
+            for field in self.schema
+        ]
+        return pa.Table.from_arrays(columns, schema=self.schema)
+
+    def _open_avro(self):
+        try:
+            from fastavro import parse_schema
+            from fastavro.write import Writer
+        except ImportError as e:
+            raise ImportError("Avro output requires the 'fastavro' package.") from e
+        self._avro_file = open(self.output_file, "wb")
+        self._avro_writer = Writer(self._avro_file, parse_schema(avro_schema(self.entity, self.schema)), codec="deflate")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        if self._avro_writer is not None:
+            self._avro_writer.flush()
+            self._avro_file.close()
+        return False
+
+def stream_transform(bucket_name, blob_name, entity, output_file, batch_size=DEFAULT_BATCH_SIZE, byte_range=None):
+    """
+    Transform a raw GCS object batch by batch into a single output file.
+
+    Args:
+        bucket_name (str): Name of the GCS bucket.
+        blob_name (str): Name of the raw object.
+        entity (str): "users", "products" or "carts".
+        output_file (str): Path of the .parquet, .avro or .csv output.
+        batch_size (int): Records normalized per batch.
+        byte_range (tuple): Optional (start, end) shard of an uncompressed NDJSON object.
+
+    Returns:
+        int: Number of rows written.
+    """
+    spec = SPECS[entity]
+    logging.info(f"Streaming transform of gs://{bucket_name}/{blob_name} in batches of {batch_size}")
+    client = get_storage_client()
+    blob = client.bucket(bucket_name).blob(blob_name)
+
+    with metrics.stage("transform.stream", entity=entity) as timer, \
+            blob.open("rb", chunk_size=DOWNLOAD_CHUNK_SIZE) as stream, BatchOutputWriter(output_file, entity) as writer:
+        if byte_range is not None:
+            records = iter_ndjson_range(stream, *byte_range, spec=spec)
+        else:
+            records = iter_raw_records(stream, blob_name, ENTITIES[entity]["record_key"], spec)
+        for number, batch in enumerate(iter_batches(records, batch_size)):
+            df = transform_records(batch, entity)
+            writer.write(df)
+            logging.info(f"Batch {number}: {len(batch)} records in, {writer.rows_written} rows written so far")
+        # The ijson reader closes the stream once the document is parsed
+        bytes_read = (blob.size or 0) if stream.closed else stream.tell() - (byte_range[0] if byte_range else 0)
+        timer.add(rows=writer.rows_written, bytes=bytes_read)
+
+    logging.info(f"Streaming transform of {entity} wrote {writer.rows_written} rows to {output_file}")
+    return writer.rows_written
+
+if __name__ == "__main__":
+    bucket_name = "savannah_informatics_assesment"
+
+    for entity, config in ENTITIES.items():
+        try:
+            stream_transform(bucket_name, raw_blob_name(entity), entity, output_path(config["output_stem"]))
+        except Exception as e:
+            logging.error(f"Streaming transform of {entity} failed: {e}")
+
+    metrics.export_metrics(task="streaming_transform")
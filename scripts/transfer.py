@@ -0,0 +1,247 @@
+'''
+Parallel GCS Transfers for Large Raw Objects
+
+Large downloads are split into byte ranges fetched concurrently and
+reassembled in memory; large uploads are written as parts uploaded in
+parallel while the data is still being produced, then composed into a
+temporary object server-side. Both verify the CRC32C of the whole
+object against GCS, so a torn range or a lost part cannot go unnoticed,
+and a composed upload only replaces its destination once verified.
+Objects below the threshold take the ordinary single-request path.
+
+'''
+import base64
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import google_crc32c
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Objects at least this large are transferred in parallel parts
+PARALLEL_THRESHOLD_BYTES = int(os.environ.get("TRANSFER_PARALLEL_THRESHOLD", 64 * 1024 * 1024))
+
+# Size of each byte range or uploaded part
+PART_SIZE = int(os.environ.get("TRANSFER_PART_SIZE", 32 * 1024 * 1024))
+
+# Ranges or parts in flight at once
+TRANSFER_WORKERS = int(os.environ.get("TRANSFER_WORKERS", 8))
+
+# Maximum number of source objects of one compose request
+COMPOSE_LIMIT = 32
+
+def encode_crc32c(checksum):
+    """
+    Encode a CRC32C checksum the way GCS reports it in object metadata.
+
+    Args:
+        checksum (google_crc32c.Checksum): Checksum of the data.
+
+    Returns:
+        str: Base64 of the big-endian 32-bit checksum.
+    """
+    return base64.b64encode(checksum.digest()).decode("ascii")
+
+def verify_crc32c(blob, checksum):
+    """
+    Compare a locally computed CRC32C with the object's.
+
+    Args:
+        blob (google.cloud.storage.Blob): Object with loaded metadata.
+        checksum (google_crc32c.Checksum): Checksum of the transferred bytes.
+    """
+    local = encode_crc32c(checksum)
+    if blob.crc32c is not None and blob.crc32c != local:
+        raise RuntimeError(f"CRC32C mismatch for '{blob.name}': GCS reports {blob.crc32c}, transferred data {local}")
+
+def download_bytes(blob, part_size=PART_SIZE, workers=TRANSFER_WORKERS, threshold=PARALLEL_THRESHOLD_BYTES):
+    """
+    Download an object, in concurrent byte ranges if it is large.
+
+    Every range is pinned to the same object generation, so an object
+    overwritten mid-download fails instead of mixing two versions.
+
+    Args:
+        blob (google.cloud.storage.Blob): Source object.
+        part_size (int): Bytes per range.
+        workers (int): Ranges fetched concurrently.
+        threshold (int): Smaller objects are downloaded with a single request.
+
+    Returns:
+        bytes: The object contents (a bytearray when downloaded in ranges, to avoid a second copy).
+    """
+    if blob.size is None:
+        blob.reload()
+    if blob.size < threshold:
+        return blob.download_as_bytes()
+
+    size = blob.size
+    generation = blob.generation
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+
+    def fetch(start):
+        end = min(start + part_size, size)
+        view[start:end] = blob.download_as_bytes(start=start, end=end - 1, if_generation_match=generation,
+                                                 checksum=None)
+
+    logging.info(f"Downloading '{blob.name}' ({size} bytes) in {-(-size // part_size)} ranges with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(fetch, start) for start in range(0, size, part_size)]:
+            future.result()
+
+    # The checksum needs read-only input, so it is fed one range-sized copy at a time rather than the whole buffer
+    checksum = google_crc32c.Checksum()
+    for start in range(0, size, part_size):
+        checksum.update(bytes(view[start:start + part_size]))
+    view.release()
+    verify_crc32c(blob, checksum)
+    return buffer
+
+def replace_blob(source, destination):
+    """
+    Copy an object over another server-side, then delete the source.
+
+    Large objects take several rewrite requests; the destination only
+    changes once the last one completes.
+
+    Args:
+        source (google.cloud.storage.Blob): Object to move.
+        destination (google.cloud.storage.Blob): Object to create or replace.
+    """
+    token, _, _ = destination.rewrite(source)
+    while token is not None:
+        token, _, _ = destination.rewrite(source, token=token)
+    source.delete()
+
+class ParallelCompositeWriter:
+    """
+    Writable stream uploading to a GCS object as parallel parts composed server-side.
+
+    Data is cut into parts of `part_size` bytes that upload in the background
+    while writing continues; at most `workers` parts are in flight, so up to
+    (workers + 1) * part_size bytes are held in memory. close() composes the
+    parts (in several rounds beyond 32 parts) into a temporary object,
+    verifies its CRC32C, copies it over the destination and deletes the
+    parts, so a failed or corrupt upload never replaces the destination.
+    A stream that never fills one part is uploaded with a single request instead.
+
+    Composite objects carry a CRC32C but no MD5 hash.
+
+    Args:
+        blob (google.cloud.storage.Blob): Destination object.
+        content_type (str): Content type of the destination object.
+        part_size (int): Bytes per part.
+        workers (int): Parts uploaded concurrently.
+    """
+
+    def __init__(self, blob, content_type=None, part_size=PART_SIZE, workers=TRANSFER_WORKERS):
+        self.blob = blob
+        self.content_type = content_type
+        self.part_size = part_size
+        self.workers = workers
+        self.bytes_written = 0
+        self.closed = False
+        self._checksum = google_crc32c.Checksum()
+        self._buffer = bytearray()
+        self._parts = []
+        self._futures = []
+        self._executor = None
+        self._prefix = f"{blob.name}.parts/{uuid.uuid4().hex}"
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        """
+        Append bytes to the object.
+
+        Args:
+            data (bytes): Data to write.
+
+        Returns:
+            int: Number of bytes accepted.
+        """
+        self._buffer += data
+        self._checksum.update(bytes(data))
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _submit_part(self, data):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        # Bound memory: wait for the oldest part once `workers` parts are in flight
+        if len(self._futures) >= self.workers:
+            self._futures.pop(0).result()
+        part = self.blob.bucket.blob(f"{self._prefix}/{len(self._parts):05d}")
+        self._parts.append(part)
+        self._futures.append(self._executor.submit(part.upload_from_string, data, checksum="crc32c"))
+
+    def _compose(self, sources, destination):
+        """Compose `sources` into `destination`, through intermediate objects beyond COMPOSE_LIMIT."""
+        round_number = 0
+        while len(sources) > COMPOSE_LIMIT:
+            groups = [sources[i:i + COMPOSE_LIMIT] for i in range(0, len(sources), COMPOSE_LIMIT)]
+            sources = []
+            for index, group in enumerate(groups):
+                intermediate = self.blob.bucket.blob(f"{self._prefix}/compose-{round_number}-{index:05d}")
+                intermediate.compose(group)
+                self._parts.append(intermediate)
+                sources.append(intermediate)
+            round_number += 1
+        if self.content_type:
+            destination.content_type = self.content_type
+        destination.compose(sources)
+
+    def close(self):
+        """Upload the remaining data, compose the parts and verify the result."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if not self._parts:
+                self.blob.upload_from_string(bytes(self._buffer), content_type=self.content_type, checksum="crc32c")
+                return
+            if self._buffer:
+                self._submit_part(bytes(self._buffer))
+                self._buffer = bytearray()
+            for future in self._futures:
+                future.result()
+            logging.info(f"Composing {len(self._parts)} parts ({self.bytes_written} bytes) into '{self.blob.name}'")
+            composed = self.blob.bucket.blob(f"{self._prefix}/composed")
+            self._compose(list(self._parts), composed)
+            self._parts.append(composed)
+            composed.reload()
+            verify_crc32c(composed, self._checksum)
+            if self.content_type:
+                self.blob.content_type = self.content_type
+            replace_blob(composed, self.blob)
+            self._parts.remove(composed)
+            self.blob.reload()
+        finally:
+            self._cleanup()
+
+    def abort(self):
+        """Discard the upload without creating or replacing the destination object."""
+        self.closed = True
+        for future in self._futures:
+            future.cancel()
+        self._cleanup()
+
+    def _cleanup(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        for part in self._parts:
+            try:
+                part.delete()
+            except Exception as e:
+                logging.warning(f"Could not delete part '{part.name}': {e}")
+        self._parts = []
@@ -1,335 +1,175 @@
 '''
-Cleaning Users Data
+Cleaning Users, Products and Carts Data
 
-'''
+Every entity is declared as configuration in endpoints.ENTITIES (record
+path, column paths, renames, filters, required and derived columns) and
+transformed by the one code path below, so an optimization of it
+applies to all entities at once and a new endpoint needs no new code.
 
+Records are filtered and projected while they are parsed (see
+record_spec.py); transform_records then pulls the configured columns into
+column arrays with an extractor compiled for the entity (projection.py),
+drops rows missing a required value, computes the derived columns with
+array operations and returns a typed DataFrame.
 
-import json
-from google.cloud import storage
-import pandas as pd
+'''
 import logging
+import numpy as np
+import pandas as pd
+import metrics
+from clients import get_storage_client
+from columnar import output_path, save_output
+from endpoints import ENTITIES, output_columns
+from ndjson_io import raw_blob_name, read_raw_records
+from projection import extract_columns
+from record_spec import SPECS, select_records
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def download_json_from_gcs(bucket_name, blob_name):
-    """
-    Download a JSON file from a Google Cloud Storage bucket.
+def _multiply(columns, record_index, sources):
+    return np.prod([np.asarray(columns[source], dtype=np.float64) for source in sources], axis=0)
 
-    Args:
-        bucket_name (str): Name of the GCS bucket.
-        blob_name (str): Name of the blob in the bucket.
+def _record_sum(columns, record_index, sources):
+    # Sum over the rows of each parent record, repeated on each of its rows
+    values = np.asarray(columns[sources[0]], dtype=np.float64)
+    return np.bincount(record_index, weights=values)[record_index] if len(values) else values
 
-    Returns:
-        list: JSON data as a list of objects.
-    """
-    try:
-        logging.info(f"Downloading JSON from GCS bucket '{bucket_name}', blob '{blob_name}'")
-        client = storage.Client()  # Use default credentials in Cloud Shell
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        json_data = json.loads(blob.download_as_text())
-        logging.info("JSON data successfully downloaded.")
-        return json_data
-    except Exception as e:
-        logging.error(f"Failed to download JSON from GCS: {e}")
-        raise
+# Operation of each derived column kind: (columns, parent record index of each row, source columns) -> array
+DERIVED_OPERATIONS = {
+    "multiply": _multiply,
+    "record_sum": _record_sum,
+}
 
-def flatten_json(json_data):
+def download_json_from_gcs(bucket_name, blob_name, entity):
     """
-    Flatten JSON data into a tabular format.
+    Download an entity's raw dump from a Google Cloud Storage bucket.
 
-    Args:
-        json_data (list): List of JSON objects.
-
-    Returns:
-        pd.DataFrame: Flattened data.
-    """
-    try:
-        logging.info("Flattening JSON data.")
-        # Normalize JSON and flatten nested fields
-        flat_data = pd.json_normalize(
-            json_data,
-            sep='_'
-        )
-        # Select required fields if they exist
-        required_fields = ['id', 'firstName', 'lastName', 'gender', 'age', 
-                           'address.street', 'address.city', 'address.postalCode']
-        missing_fields = [field for field in required_fields if field not in flat_data.columns]
-        if missing_fields:
-            logging.warning(f"Missing fields in JSON data: {missing_fields}")
-        
-        # Keep only the fields that exist in the data
-        flat_data = flat_data[[field for field in required_fields if field in flat_data.columns]]
-
-        # Rename address fields for clarity
-        flat_data.rename(
-            columns={
-                'address.street': 'street',
-                'address.city': 'city',
-                'address.postalCode': 'postal_code',
-                'firstName': 'first_name',
-                'lastName': 'last_name',
-            }, inplace=True
-        )
-        logging.info("JSON data successfully flattened.")
-        return flat_data
-    except Exception as e:
-        logging.error(f"Failed to flatten JSON data: {e}")
-        raise
-
-def save_to_csv(df, output_file):
-    """
-    Save a DataFrame to a CSV file.
-
-    Args:
-        df (pd.DataFrame): DataFrame to save.
-        output_file (str): Path to save the CSV file.
-    """
-    try:
-        logging.info(f"Saving data to CSV file '{output_file}'")
-        df.to_csv(output_file, index=False)
-        logging.info(f"Flattened data successfully saved to {output_file}")
-    except Exception as e:
-        logging.error(f"Failed to save data to CSV: {e}")
-        raise
-
-if __name__ == "__main__":
-    # GCS bucket and file details
-    bucket_name = "savannah_informatics_assesment"  # Replace with your GCS bucket name
-    blob_name = "raw/users_raw.json"         # Replace with your JSON file name
-    output_file = "users.csv"  # Output file name in Cloud Shell
-
-    try:
-        # Download JSON data from GCS
-        json_data = download_json_from_gcs(bucket_name, blob_name)
-        
-        # Flatten the JSON data
-        flattened_data = flatten_json(json_data)
-        
-        # Save the flattened data to CSV
-        save_to_csv(flattened_data, output_file)
-    except Exception as e:
-        logging.error(f"An error occurred in the main process: {e}")
-
-
-'''
-Cleaning Products Data
-
-'''
-
-
-
-import json
-from google.cloud import storage
-import pandas as pd
-import logging
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-def download_json_from_gcs(bucket_name, blob_name):
-    """
-    Download a JSON file from a Google Cloud Storage bucket.
+    Records are filtered and projected by the entity's spec while they are parsed.
 
     Args:
         bucket_name (str): Name of the GCS bucket.
         blob_name (str): Name of the blob in the bucket.
+        entity (str): Key of endpoints.ENTITIES.
 
     Returns:
-        list: JSON data as a list of dictionaries or None if download fails.
-    """
-    try:
-        logging.info(f"Downloading JSON from GCS bucket '{bucket_name}', blob '{blob_name}'")
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-
-        # Check if the blob exists
-        if not blob.exists():
-            logging.error(f"The object '{blob_name}' does not exist in the bucket '{bucket_name}'.")
-            return None
-
-        # Download and parse JSON
-        json_data = json.loads(blob.download_as_text())
-
-        # Handle cases where JSON is not a list
-        if isinstance(json_data, dict):
-            # Attempt to extract a list of products from a known key
-            if 'products' in json_data:
-                json_data = json_data['products']
-            else:
-                logging.error("The JSON data is a dictionary but does not contain the expected 'products' key.")
-                return None
-
+        list: The accepted records.
+    """
+    with metrics.stage("transform.download", entity=entity) as timer:
+        try:
+            logging.info(f"Downloading JSON from GCS bucket '{bucket_name}', blob '{blob_name}'")
+            blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+            if not blob.exists():
+                raise FileNotFoundError(f"The object '{blob_name}' does not exist in the bucket '{bucket_name}'.")
+            json_data = read_raw_records(blob, ENTITIES[entity]["record_key"], spec=SPECS[entity])
+        except Exception as e:
+            logging.error(f"Failed to download JSON from GCS: {e}")
+            raise
         if not isinstance(json_data, list):
-            logging.error("The JSON data is not in the expected list format.")
-            return None
-
-        logging.info("JSON data successfully downloaded.")
+            raise ValueError(f"The {entity} data is not a list of records.")
+        timer.add(rows=len(json_data))
+        logging.info(f"Downloaded {len(json_data)} {entity} records.")
         return json_data
-    except Exception as e:
-        logging.error(f"Failed to download JSON from GCS: {e}")
-        return None
 
-def process_products(json_data):
+def transform_records(json_data, entity):
     """
-    Process the products JSON data to extract required fields, normalize, and filter rows.
+    Transform raw records of an entity into its typed output rows.
 
     Args:
-        json_data (list): List of JSON objects.
+        json_data (list): Raw or already filtered records.
+        entity (str): Key of endpoints.ENTITIES.
 
     Returns:
-        pd.DataFrame: Cleaned and filtered DataFrame or None if processing fails.
-    """
-    if not json_data:
-        logging.error("No data to process.")
-        return None
-
-    try:
-        # Normalize JSON data into a DataFrame
-        logging.info("Normalizing JSON data into a DataFrame.")
-        products_df = pd.json_normalize(json_data)
-
-        # The required fields
-        required_fields = ['id', 'title', 'category', 'brand', 'price']
-        missing_fields = [field for field in required_fields if field not in products_df.columns]
-
-        if missing_fields:
-            logging.error(f"Missing required fields: {', '.join(missing_fields)}")
-            return None
-
-        # Select required fields
-        products_df = products_df[required_fields]
-
-        # Handle missing or invalid price values
-        products_df['price'] = pd.to_numeric(products_df['price'], errors='coerce')
-        products_df = products_df.dropna(subset=['price'])
-
-        # Filter out products with price <= 50
-        filtered_df = products_df[products_df['price'] > 50]
-
-        logging.info(f"Filtered products count: {len(filtered_df)}")
-        return filtered_df
-    except Exception as e:
-        logging.error(f"Error processing products data: {e}")
-        return None
+        pd.DataFrame: One row per record (or per nested item with a record path),
+            with the entity's output columns in order.
+    """
+    config = ENTITIES[entity]
+    with metrics.stage("transform.normalize", entity=entity) as timer:
+        # The extractor below reads only the configured paths, so the spec is applied for its coercions and filters alone
+        spec = SPECS[entity]
+        records = list(select_records(json_data, spec) if spec["numeric"] or spec["where"] else json_data)
+
+        # Expand the nested record list, remembering the parent record of every row
+        record_path = config["record_path"]
+        if record_path:
+            nested = [(record.get(record_path) if isinstance(record, dict) else None) or [] for record in records]
+            counts = np.fromiter((len(items) for items in nested), dtype=np.int64, count=len(nested))
+            rows = [item for items in nested for item in items]
+        else:
+            counts = np.ones(len(records), dtype=np.int64)
+            rows = records
+        record_index = np.repeat(np.arange(len(records)), counts)
+
+        # Only the configured paths are read, in one pass over the records and one over the rows
+        parents = extract_columns(records, [path for _, path, _ in config["parent_columns"]])
+        values = extract_columns(rows, [path for _, path, _ in config["columns"]])
+        columns = {name: np.repeat(parent, counts) for (name, _, _), parent in zip(config["parent_columns"], parents)}
+        columns.update((name, value) for (name, _, _), value in zip(config["columns"], values))
+
+        missing = [name for name, values in columns.items() if len(values) and all(value is None for value in values)]
+        if missing:
+            logging.warning(f"Missing fields in {entity} data: {missing}")
+
+        # Drop rows without a value in a required column
+        if config["required"] and len(rows):
+            keep = np.ones(len(rows), dtype=bool)
+            for name in config["required"]:
+                keep &= np.array([value is not None for value in columns[name]], dtype=bool)
+            dropped = int(len(rows) - keep.sum())
+            if dropped:
+                logging.warning(f"Dropped {dropped} {entity} rows missing one of {config['required']}")
+                columns = {name: values[keep] for name, values in columns.items()}
+                record_index = record_index[keep]
+
+        # Float columns are stored as numbers even where the API sends them as text; None becomes NaN
+        for name, _, column_type in config["parent_columns"] + config["columns"]:
+            if column_type == "float64":
+                columns[name] = np.asarray(columns[name], dtype=np.float64)
+
+        for name, operation, sources in config["derived"]:
+            columns[name] = DERIVED_OPERATIONS[operation](columns, record_index, sources)
+
+        df = pd.DataFrame({name: columns[name] for name, _ in output_columns(entity)})
+        df = df.infer_objects()
+        timer.add(rows=len(df))
+        logging.info(f"Transformed {len(records)} {entity} records into {len(df)} rows.")
+        return df
 
-def save_to_csv(df, output_file):
+def flatten_json(json_data):
     """
-    Save a DataFrame to a CSV file.
+    Flatten users into their output rows (see transform_records).
 
     Args:
-        df (pd.DataFrame): DataFrame to save.
-        output_file (str): Path to save the CSV file.
-    """
-    try:
-        logging.info(f"Saving filtered data to CSV file '{output_file}'.")
-        df.to_csv(output_file, index=False)
-        logging.info(f"Filtered products saved to {output_file}")
-    except Exception as e:
-        logging.error(f"Failed to save DataFrame to CSV: {e}")
-
-if __name__ == "__main__":
-    # GCS bucket and file details
-    bucket_name = "savannah_informatics_assesment"
-    blob_name = "raw/products_raw.json"  # Ensure this is the correct path
-    output_file = "products.csv"  # Output file name
-
-    # Download JSON data from GCS
-    json_data = download_json_from_gcs(bucket_name, blob_name)
-
-    if json_data is not None:
-        # Process the products data
-        filtered_data = process_products(json_data)
-
-        if filtered_data is not None:
-            # Save the filtered data to CSV
-            save_to_csv(filtered_data, output_file)
-        else:
-            logging.error("Product processing failed. No data to save.")
-    else:
-        logging.error("Failed to download or process the product data.")
+        json_data (list): User records.
 
-'''
-Cleaning Carts Data
-'''
-
-
-import json
-from google.cloud import storage
-import pandas as pd
+    Returns:
+        pd.DataFrame: Flattened data.
+    """
+    return transform_records(json_data, "users")
 
-def download_json_from_gcs(bucket_name, blob_name):
+def process_products(json_data):
     """
-    Download a JSON file from a Google Cloud Storage bucket.
+    Select, clean and filter products into their output rows (see transform_records).
 
     Args:
-        bucket_name (str): Name of the GCS bucket.
-        blob_name (str): Name of the blob in the bucket.
+        json_data (list): Product records.
 
     Returns:
-        list: JSON data as a list of dictionaries.
+        pd.DataFrame: Cleaned and filtered products.
     """
-    try:
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        json_data = json.loads(blob.download_as_text())
-        return json_data
-    except Exception as e:
-        raise RuntimeError(f"Error downloading or parsing JSON file: {e}")
+    return transform_records(json_data, "products")
 
 def process_cart_data(json_data):
     """
-    Process the cart JSON data to flatten the products array and calculate total cart value.
+    Flatten carts into one row per cart line with its cart's total value (see transform_records).
 
     Args:
-        json_data (list): List of JSON objects representing carts.
+        json_data (list): Cart records.
 
     Returns:
-        pd.DataFrame: Processed DataFrame with flattened product rows and total cart values.
+        pd.DataFrame: Cart lines.
     """
-    try:
-        # Check if 'products' key exists in any of the cart records
-        for record in json_data:
-            if 'products' not in record:
-                raise KeyError("'products' key not found in one or more cart records.")
-
-        # Convert JSON data to DataFrame and flatten the 'products' array
-        carts_df = pd.json_normalize(
-            json_data, 
-            record_path=['products'], 
-            meta=['cart_id', 'user_id'], 
-            sep='_', 
-            meta_prefix='cart_',
-            record_prefix='product_'
-        )
-
-        # Required fields are present
-        required_fields = ['cart_id', 'user_id', 'product_id', 'quantity', 'price', 'product_title']
-        for field in required_fields:
-            if field not in carts_df.columns:
-                raise KeyError(f"Missing required field: {field}")
-
-        # Renaming 'product_title' to 'name' to reflect the correct field
-        carts_df.rename(columns={'product_title': 'name'}, inplace=True)
-
-        # Calculating total_cart_value for each cart
-        carts_df['total_price'] = carts_df['quantity'] * carts_df['price']
-        total_cart_values = carts_df.groupby('cart_id')['total_price'].sum().reset_index()
-        total_cart_values.rename(columns={'total_price': 'total_cart_value'}, inplace=True)
-
-        # Merging total_cart_value back into the main DataFrame
-        final_df = carts_df.merge(total_cart_values, on='cart_id')
-
-        # Select and reorder columns
-        final_df = final_df[['cart_id', 'user_id', 'product_id', 'name', 'quantity', 'price', 'total_cart_value']]
-
-        return final_df
-
-    except Exception as e:
-        raise RuntimeError(f"Error processing cart data: {e}")
+    return transform_records(json_data, "carts")
 
 def save_to_csv(df, output_file):
     """
@@ -340,26 +180,40 @@ def save_to_csv(df, output_file):
         output_file (str): Path to save the CSV file.
     """
     try:
+        logging.info(f"Saving data to CSV file '{output_file}'")
         df.to_csv(output_file, index=False)
-        print(f"Processed cart data saved to {output_file}")
+        logging.info(f"{len(df)} rows saved to {output_file}")
     except Exception as e:
-        raise RuntimeError(f"Error saving CSV file: {e}")
+        logging.error(f"Failed to save data to CSV: {e}")
+        raise
 
-if __name__ == "__main__":
-    # GCS bucket and file credentials
-    bucket_name = "savannah_informatics_assesment"  
-    blob_name = "raw/carts_raw.json"  
-    output_file = "cart.csv" 
+def transform_entity(bucket_name, entity, output_file=None):
+    """
+    Download, transform and save one entity.
 
-    try:
-        # Download JSON data from GCS
-        json_data = download_json_from_gcs(bucket_name, blob_name)
+    Args:
+        bucket_name (str): Name of the GCS bucket holding the raw dump.
+        entity (str): Key of endpoints.ENTITIES.
+        output_file (str): Output path; the entity's output stem in the configured format if None.
 
-        # Process the cart data
-        processed_data = process_cart_data(json_data)
+    Returns:
+        int: Rows written.
+    """
+    output_file = output_file or output_path(ENTITIES[entity]["output_stem"])
+    json_data = download_json_from_gcs(bucket_name, raw_blob_name(entity), entity)
+    df = transform_records(json_data, entity)
+    # Parquet by default, see TRANSFORM_OUTPUT_FORMAT
+    save_output(df, output_file, entity)
+    return len(df)
 
-        # Save the processed data to CSV
-        save_to_csv(processed_data, output_file)
+if __name__ == "__main__":
+    # GCS bucket holding the raw dumps
+    bucket_name = "savannah_informatics_assesment"
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    for entity in ENTITIES:
+        try:
+            transform_entity(bucket_name, entity)
+        except Exception as e:
+            logging.error(f"Transform of {entity} failed: {e}")
+
+    metrics.export_metrics(task="transform")
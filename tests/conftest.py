@@ -0,0 +1,18 @@
+import os
+import sys
+import pytest
+
+# The pipeline modules import each other as top-level modules from scripts/
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path[:0] = [os.path.join(ROOT, "scripts"), os.path.join(ROOT, "benchmarks")]
+
+from clients import register_client, reset_clients
+from fake_gcs import FakeStorageClient
+
+@pytest.fixture
+def storage_client():
+    """An in-memory GCS registered as the process-wide storage client."""
+    client = FakeStorageClient()
+    register_client("storage", client)
+    yield client
+    reset_clients()
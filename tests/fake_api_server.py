@@ -0,0 +1,137 @@
+'''
+Local Stand-in for the dummyjson API
+
+Serves users, products and carts with the same `total`/`skip`/`limit`
+envelope as https://dummyjson.com so the paginated extractor can be
+exercised offline. `python tests/fake_api_server.py` serves the sample
+users on port 8000; point the extractor at it with API_BASE_URL.
+
+'''
+import hashlib
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Sample dump served when run as a script
+SAMPLE_USERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", "data", "users_raw.json")
+
+# dummyjson returns 30 records when no limit is given
+DEFAULT_LIMIT = 30
+
+def make_handler(datasets, max_limit=None, failures=None):
+    """
+    Build a request handler class serving the given datasets.
+
+    Args:
+        datasets (dict): Mapping of entity name (e.g. "users") to a list of records.
+        max_limit (int): Optional cap on the page size, like a real API would enforce.
+        failures (list): (status, Retry-After or None) answered to the next requests, in
+            order, before serving records again; consumed as they are sent.
+
+    Returns:
+        type: A BaseHTTPRequestHandler subclass.
+    """
+    class DummyJSONHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, so session reuse is exercised
+
+        def do_GET(self):
+            if failures:
+                status, retry_after = failures.pop(0)
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header("Retry-After", str(retry_after))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            parsed = urlparse(self.path)
+            entity = parsed.path.strip("/")
+            if entity not in datasets:
+                self.send_error(404, f"Unknown endpoint: {entity}")
+                return
+
+            query = parse_qs(parsed.query)
+            records = datasets[entity]
+            skip = int(query.get("skip", [0])[0])
+            limit = int(query.get("limit", [DEFAULT_LIMIT])[0])
+            if limit == 0:
+                limit = len(records)  # dummyjson treats limit=0 as "everything"
+            if max_limit is not None:
+                limit = min(limit, max_limit)
+
+            page = records[skip:skip + limit]
+            body = json.dumps({entity: page, "total": len(records), "skip": skip, "limit": len(page)}).encode("utf-8")
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"{self.address_string()} - {format % args}")
+
+    return DummyJSONHandler
+
+def start_server(datasets, host="127.0.0.1", port=0, max_limit=None, failures=None):
+    """
+    Start the stand-in API server on a background thread.
+
+    Args:
+        datasets (dict): Mapping of entity name to a list of records.
+        host (str): Interface to bind to.
+        port (int): Port to bind to; 0 picks a free port.
+        max_limit (int): Optional cap on the page size.
+        failures (list): Error responses sent before any records (see make_handler).
+
+    Returns:
+        tuple: The running server and its base URL (use as API_BASE_URL).
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(datasets, max_limit, failures))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logging.info(f"Stand-in API server listening on {base_url}")
+    return server, base_url
+
+def load_dataset(file_path, entity):
+    """
+    Load the records of a raw dummyjson dump (envelope or plain list).
+
+    Args:
+        file_path (str): Path to the JSON file.
+        entity (str): Key of the record list in the envelope.
+
+    Returns:
+        list: The records.
+    """
+    with open(file_path, "r", encoding="utf-8") as json_file:
+        data = json.load(json_file)
+    return data.get(entity, []) if isinstance(data, dict) else data
+
+if __name__ == "__main__":
+    datasets = {
+        "users": load_dataset(SAMPLE_USERS_PATH, "users"),
+        "products": [],
+        "carts": [],
+    }
+    server, base_url = start_server(datasets, port=8000)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,335 @@
+'''
+In-memory Stand-in for the BigQuery Client
+
+Implements the subset of google.cloud.bigquery.Client used by load.py so
+the loaders can be exercised offline. Load jobs count the rows of the
+submitted file and can simulate server-side latency, which makes the
+effect of submitting jobs concurrently visible without a GCP project.
+Queries (such as the MERGE of an upsert) are recorded rather than executed.
+FakeBigQueryWriteClient stands in for the Storage Write API endpoint,
+enforcing append offsets and optionally dropping connections, so the
+exactly-once streaming sink can be exercised offline as well.
+
+'''
+import csv
+import fnmatch
+import io
+import re
+import threading
+import time
+import uuid
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+class FakeTable:
+    """
+    Table metadata as returned by FakeBigQueryClient.get_table.
+
+    Args:
+        table_id (str): Fully qualified table id.
+        schema (list): List of bigquery.SchemaField objects.
+    """
+
+    def __init__(self, table_id, schema=None):
+        self.table_id = table_id
+        self.schema = list(schema or [])
+        self.num_rows = 0
+
+class FakeLoadJob:
+    """
+    A load job that completes after the configured latency.
+
+    Args:
+        client (FakeBigQueryClient): Owning client.
+        table_id (str): Destination table.
+        num_rows (int): Rows in the loaded source.
+        job_config (bigquery.LoadJobConfig): The submitted configuration.
+        schema (list): Schema carried by a self-describing (Parquet) source.
+        input_file_bytes (int): Size of the loaded source.
+    """
+
+    def __init__(self, client, table_id, num_rows, job_config, schema=None, input_file_bytes=0):
+        self.job_id = f"fake-load-{uuid.uuid4().hex[:12]}"
+        self.client = client
+        self.destination = table_id
+        self.output_rows = num_rows
+        self.input_file_bytes = input_file_bytes
+        self.job_config = job_config
+        self.schema = schema
+        self.state = "RUNNING"
+        self._submitted = time.monotonic()
+
+    def result(self, timeout=None):
+        remaining = self.client.job_latency - (time.monotonic() - self._submitted)
+        if remaining > 0:
+            time.sleep(remaining)
+        if self.state != "DONE":
+            self.client._finish_load(self)
+            self.state = "DONE"
+        return self
+
+    def done(self):
+        return self.state == "DONE"
+
+class FakeQueryJob:
+    """
+    A recorded query. DML statements report the row count of the table they
+    read from as affected rows; the target table itself is not modified.
+
+    Args:
+        query (str): The SQL text.
+        num_dml_affected_rows (int): Rows reported as affected.
+    """
+
+    def __init__(self, query, num_dml_affected_rows=None):
+        self.job_id = f"fake-query-{uuid.uuid4().hex[:12]}"
+        self.query = query
+        self.num_dml_affected_rows = num_dml_affected_rows
+        self.state = "DONE"
+
+    def result(self, timeout=None):
+        return self
+
+    def done(self):
+        return True
+
+class FakeBigQueryClient:
+    """
+    Thread-safe in-memory replacement for bigquery.Client.
+
+    Args:
+        project (str): Project id reported by the client.
+        job_latency (float): Seconds each job takes to complete after submission.
+        storage_client (storage.Client): Client used to read `gs://` sources of
+            load_table_from_uri; without one, URI loads report zero rows.
+    """
+
+    def __init__(self, project="fake-project", job_latency=0.0, storage_client=None):
+        self.project = project
+        self.job_latency = job_latency
+        self.storage_client = storage_client
+        self.tables = {}
+        self.jobs = []
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def get_table(self, table_id):
+        table_id = str(table_id)
+        with self._lock:
+            if table_id not in self.tables:
+                raise NotFound(f"Not found: Table {table_id}")
+            return self.tables[table_id]
+
+    def create_table(self, table, exists_ok=False):
+        table_id = f"{table.project}.{table.dataset_id}.{table.table_id}"
+        with self._lock:
+            if table_id not in self.tables:
+                self.tables[table_id] = FakeTable(table_id, table.schema)
+            return self.tables[table_id]
+
+    def delete_table(self, table_id, not_found_ok=False):
+        table_id = str(table_id)
+        with self._lock:
+            if table_id not in self.tables and not not_found_ok:
+                raise NotFound(f"Not found: Table {table_id}")
+            self.tables.pop(table_id, None)
+
+    def query(self, query, job_config=None, **kwargs):
+        affected = None
+        source = re.search(r"FROM `([^`]+)`", query)
+        if query.lstrip().upper().startswith(("MERGE", "INSERT", "UPDATE", "DELETE")) and source:
+            with self._lock:
+                table = self.tables.get(source.group(1))
+                affected = table.num_rows if table is not None else 0
+        job = FakeQueryJob(query, affected)
+        with self._lock:
+            self.queries.append(job)
+        return job
+
+    def load_table_from_file(self, file_obj, destination, job_config=None, **kwargs):
+        payload = file_obj.read()
+        job = FakeLoadJob(self, str(destination), count_rows(payload, job_config), job_config, payload_schema(payload),
+                          len(payload))
+        with self._lock:
+            self.jobs.append(job)
+        return job
+
+    def load_table_from_uri(self, source_uris, destination, job_config=None, **kwargs):
+        if isinstance(source_uris, str):
+            source_uris = [source_uris]
+        num_rows = 0
+        input_file_bytes = 0
+        schema = None
+        for uri in source_uris:
+            for payload in self._read_uri(uri):
+                num_rows += count_rows(payload, job_config)
+                input_file_bytes += len(payload)
+                schema = schema or payload_schema(payload)
+        job = FakeLoadJob(self, str(destination), num_rows, job_config, schema, input_file_bytes)
+        with self._lock:
+            self.jobs.append(job)
+        return job
+
+    def _read_uri(self, uri):
+        """Yield the contents of every object matching a `gs://bucket/pattern` URI."""
+        if self.storage_client is None:
+            return
+        bucket_name, _, pattern = uri[len("gs://"):].partition("/")
+        prefix = pattern.split("*", 1)[0]
+        for blob in self.storage_client.list_blobs(bucket_name, prefix=prefix):
+            if fnmatch.fnmatchcase(blob.name, pattern):
+                yield blob.download_as_bytes()
+
+    def _finish_load(self, job):
+        with self._lock:
+            table = self.tables.setdefault(job.destination, FakeTable(job.destination))
+            append = job.job_config is not None and job.job_config.write_disposition == "WRITE_APPEND"
+            table.num_rows = (table.num_rows if append else 0) + job.output_rows
+            if job.job_config is not None and job.job_config.schema:
+                table.schema = list(job.job_config.schema)
+            elif job.schema:
+                table.schema = list(job.schema)
+
+class FakeWriteStream:
+    """
+    State of one write stream of FakeBigQueryWriteClient.
+
+    Args:
+        name (str): Stream resource name.
+        table_id (str): Destination table id.
+        stream_type: bigquery_storage_v1.types.WriteStream.Type of the stream.
+    """
+
+    def __init__(self, name, table_id, stream_type):
+        self.name = name
+        self.table_id = table_id
+        self.type_ = stream_type
+        self.row_count = 0
+        self.finalized = False
+        self.committed = False
+
+class FakeBigQueryWriteClient:
+    """
+    In-memory replacement for bigquery_storage_v1.BigQueryWriteClient.
+
+    Appends must arrive at the stream's current row offset: an earlier
+    offset is answered with ALREADY_EXISTS and a later one with OUT_OF_RANGE,
+    as the real service does. Rows of committed streams are added to the
+    matching table of `bigquery_client` on each append, rows of pending
+    streams when the stream is committed.
+
+    Args:
+        bigquery_client (FakeBigQueryClient): Client whose tables receive the rows.
+        drop_after_appends (iterable): Append counts after which the connection is
+            dropped with ServiceUnavailable, after the append was written but before
+            it was acknowledged.
+    """
+
+    def __init__(self, bigquery_client=None, drop_after_appends=()):
+        self.bigquery_client = bigquery_client
+        self.drop_after_appends = set(drop_after_appends)
+        self.streams = {}
+        self.appends = 0
+        self._lock = threading.Lock()
+
+    def create_write_stream(self, parent, write_stream, **kwargs):
+        _, project, _, dataset, _, table = parent.split("/")
+        name = f"{parent}/streams/fake-{uuid.uuid4().hex[:12]}"
+        stream = FakeWriteStream(name, f"{project}.{dataset}.{table}", write_stream.type_)
+        with self._lock:
+            self.streams[name] = stream
+        return stream
+
+    def append_rows(self, requests, **kwargs):
+        from google.api_core.exceptions import ServiceUnavailable
+        from google.cloud.bigquery_storage_v1 import types
+
+        for request in requests:
+            with self._lock:
+                stream = self.streams[request.write_stream]
+                row_count = request.arrow_rows.rows.row_count
+                if stream.finalized:
+                    error = {"code": 9, "message": f"Stream {stream.name} is finalized"}
+                elif request.offset < stream.row_count:
+                    error = {"code": 6, "message": f"Offset {request.offset} already written"}
+                elif request.offset > stream.row_count:
+                    error = {"code": 11, "message": f"Offset {request.offset} beyond end of stream"}
+                else:
+                    error = None
+                    stream.row_count += row_count
+                    if stream.type_ == types.WriteStream.Type.COMMITTED:
+                        self._add_rows(stream.table_id, row_count)
+                    self.appends += 1
+                    drop = self.appends in self.drop_after_appends
+            if error is not None:
+                yield types.AppendRowsResponse(error=error)
+                continue
+            if drop:
+                raise ServiceUnavailable("Connection reset by fake write endpoint")
+            yield types.AppendRowsResponse(append_result={"offset": request.offset})
+
+    def finalize_write_stream(self, name, **kwargs):
+        with self._lock:
+            stream = self.streams[name]
+            stream.finalized = True
+            return stream
+
+    def batch_commit_write_streams(self, parent, write_streams, **kwargs):
+        from google.cloud.bigquery_storage_v1 import types
+
+        stream_errors = []
+        with self._lock:
+            for name in write_streams:
+                stream = self.streams[name]
+                if not stream.finalized:
+                    stream_errors.append({"entity": name, "error_message": "Stream is not finalized"})
+                elif not stream.committed:
+                    stream.committed = True
+                    self._add_rows(stream.table_id, stream.row_count)
+        return types.BatchCommitWriteStreamsResponse(stream_errors=stream_errors)
+
+    def _add_rows(self, table_id, row_count):
+        """Add streamed rows to the fake BigQuery table; the caller holds the lock."""
+        if self.bigquery_client is None:
+            return
+        with self.bigquery_client._lock:
+            table = self.bigquery_client.tables.setdefault(table_id, FakeTable(table_id))
+            table.num_rows += row_count
+
+def payload_schema(payload):
+    """
+    Read the BigQuery schema implied by a self-describing Parquet payload.
+
+    Args:
+        payload (bytes): File contents.
+
+    Returns:
+        list: bigquery.SchemaField objects, or None for other formats.
+    """
+    if payload[:4] != b"PAR1":
+        return None
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    field_types = {pa.int64(): "INTEGER", pa.float64(): "FLOAT", pa.decimal128(38, 9): "NUMERIC", pa.bool_(): "BOOLEAN"}
+    schema = pq.ParquetFile(io.BytesIO(payload)).schema_arrow
+    return [bigquery.SchemaField(field.name, field_types.get(field.type, "STRING")) for field in schema]
+
+def count_rows(payload, job_config=None):
+    """
+    Count the data rows of a CSV, Parquet or Avro payload.
+
+    Args:
+        payload (bytes): File contents.
+        job_config (bigquery.LoadJobConfig): Used for the CSV header row count.
+
+    Returns:
+        int: Number of rows.
+    """
+    if payload[:4] == b"PAR1":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(io.BytesIO(payload)).metadata.num_rows
+    if payload[:4] == b"Obj\x01":
+        import fastavro
+        return sum(1 for _ in fastavro.reader(io.BytesIO(payload)))
+    skip = (job_config.skip_leading_rows or 0) if job_config is not None else 0
+    return max(0, sum(1 for _ in csv.reader(io.StringIO(payload.decode("utf-8")))) - skip)
@@ -0,0 +1,241 @@
+'''
+In-memory Stand-in for the GCS Client
+
+Implements the subset of google.cloud.storage used by the pipeline
+(buckets, blob metadata, ranged downloads, uploads, streaming open,
+compose, rewrite and delete) so transfers can be exercised offline.
+Objects carry generations and CRC32C/MD5 checksums like real GCS, and
+every request can be given a latency and a bandwidth cap, which makes the effect of
+parallel ranged downloads and composite uploads measurable.
+
+Register it for the whole process with
+clients.register_client("storage", FakeStorageClient()).
+
+'''
+import base64
+import hashlib
+import io
+import threading
+import time
+import google_crc32c
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+def _crc32c(data):
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode("ascii")
+
+def _md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+class _FakeUploadStream(io.BytesIO):
+    """Writable stream returned by FakeBlob.open("wb"); the object is created on close."""
+
+    def __init__(self, blob, content_type):
+        super().__init__()
+        self._blob = blob
+        self._content_type = content_type
+
+    def close(self):
+        if not self.closed:
+            self._blob.upload_from_string(self.getvalue(), content_type=self._content_type)
+        super().close()
+
+class FakeBlob:
+    """
+    An object reference, with metadata filled in by reload, get_blob, list_blobs or an upload.
+
+    Args:
+        bucket (FakeBucket): Owning bucket.
+        name (str): Object name.
+    """
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.size = None
+        self.crc32c = None
+        self.md5_hash = None
+        self.generation = None
+        self.content_type = None
+        self.component_count = None
+
+    def _set_metadata(self, stored):
+        self.size = len(stored["data"])
+        self.crc32c = stored["crc32c"]
+        self.md5_hash = stored["md5_hash"]
+        self.generation = stored["generation"]
+        self.content_type = stored["content_type"]
+        self.component_count = stored["component_count"]
+
+    def reload(self, **kwargs):
+        self.bucket.client._request()
+        self._set_metadata(self.bucket._get(self.name))
+
+    def exists(self, **kwargs):
+        self.bucket.client._request()
+        try:
+            self.bucket._get(self.name)
+        except NotFound:
+            return False
+        return True
+
+    def download_as_bytes(self, start=None, end=None, if_generation_match=None, checksum="md5", **kwargs):
+        stored = self.bucket._get(self.name)
+        if if_generation_match is not None and stored["generation"] != if_generation_match:
+            raise PreconditionFailed(f"Generation of {self.name} is {stored['generation']}, not {if_generation_match}")
+        data = stored["data"]
+        if start is not None or end is not None:
+            data = data[start or 0:(end + 1) if end is not None else None]
+        self.bucket.client._request(len(data))
+        return data
+
+    def download_as_text(self, encoding="utf-8", **kwargs):
+        return self.download_as_bytes(**kwargs).decode(encoding)
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None, checksum=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.bucket.client._request(len(data))
+        stored = self.bucket._put(self.name, bytes(data), content_type, if_generation_match)
+        self._set_metadata(stored)
+
+    def upload_from_file(self, file_obj, content_type=None, **kwargs):
+        self.upload_from_string(file_obj.read(), content_type=content_type, **kwargs)
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, "rb") as source_file:
+            self.upload_from_string(source_file.read(), content_type=content_type, **kwargs)
+
+    def open(self, mode="r", chunk_size=None, content_type=None, ignore_flush=False, **kwargs):
+        if mode == "rb":
+            return io.BytesIO(self.download_as_bytes())
+        if mode == "wb":
+            return _FakeUploadStream(self, content_type)
+        raise ValueError(f"Unsupported mode for the fake blob: {mode}")
+
+    def compose(self, sources, **kwargs):
+        self.bucket.client._request()
+        stored = [self.bucket._get(source.name) for source in sources]
+        data = b"".join(source["data"] for source in stored)
+        composed = self.bucket._put(self.name, data, self.content_type, None, md5=False,
+                                    component_count=sum(source["component_count"] or 1 for source in stored))
+        self._set_metadata(composed)
+
+    def rewrite(self, source, token=None, **kwargs):
+        self.bucket.client._request()
+        stored = source.bucket._get(source.name)
+        copied = self.bucket._put(self.name, stored["data"], stored["content_type"], None,
+                                  md5=stored["md5_hash"] is not None, component_count=stored["component_count"])
+        self._set_metadata(copied)
+        return None, len(stored["data"]), len(stored["data"])
+
+    def delete(self, **kwargs):
+        self.bucket.client._request()
+        self.bucket._delete(self.name)
+
+class FakeBucket:
+    """
+    A bucket of FakeStorageClient.
+
+    Args:
+        client (FakeStorageClient): Owning client.
+        name (str): Bucket name.
+    """
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name, **kwargs):
+        self.client._request()
+        try:
+            stored = self._get(name)
+        except NotFound:
+            return None
+        blob = FakeBlob(self, name)
+        blob._set_metadata(stored)
+        return blob
+
+    def list_blobs(self, prefix=None, **kwargs):
+        return self.client.list_blobs(self, prefix=prefix)
+
+    def _get(self, name):
+        with self.client._lock:
+            objects = self.client._objects.get(self.name, {})
+            if name not in objects:
+                raise NotFound(f"No such object: {self.name}/{name}")
+            return objects[name]
+
+    def _put(self, name, data, content_type, if_generation_match, md5=True, component_count=None):
+        with self.client._lock:
+            objects = self.client._objects.setdefault(self.name, {})
+            current = objects.get(name)
+            if if_generation_match is not None and (current["generation"] if current else 0) != if_generation_match:
+                raise PreconditionFailed(f"Generation precondition failed for {self.name}/{name}")
+            self.client._generation += 1
+            stored = {
+                "data": data,
+                "generation": self.client._generation,
+                "content_type": content_type,
+                "crc32c": _crc32c(data),
+                "md5_hash": _md5(data) if md5 else None,
+                "component_count": component_count,
+            }
+            objects[name] = stored
+            return stored
+
+    def _delete(self, name):
+        with self.client._lock:
+            objects = self.client._objects.get(self.name, {})
+            if name not in objects:
+                raise NotFound(f"No such object: {self.name}/{name}")
+            del objects[name]
+
+class FakeStorageClient:
+    """
+    Thread-safe in-memory replacement for storage.Client.
+
+    Args:
+        project (str): Project id reported by the client.
+        latency (float): Seconds added to every request.
+        bandwidth (float): Bytes per second of a single request's payload, or None for no limit.
+    """
+
+    def __init__(self, project="fake-project", latency=0.0, bandwidth=None):
+        self.project = project
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests = 0
+        self._objects = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _request(self, payload_bytes=0):
+        with self._lock:
+            self.requests += 1
+        delay = self.latency + (payload_bytes / self.bandwidth if self.bandwidth else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def bucket(self, bucket_name):
+        return FakeBucket(self, bucket_name)
+
+    def get_bucket(self, bucket_name):
+        return FakeBucket(self, bucket_name)
+
+    def list_blobs(self, bucket_or_name, prefix=None, **kwargs):
+        bucket = bucket_or_name if isinstance(bucket_or_name, FakeBucket) else FakeBucket(self, bucket_or_name)
+        self._request()
+        with self._lock:
+            names = sorted(name for name in self._objects.get(bucket.name, {}) if name.startswith(prefix or ""))
+        blobs = []
+        for name in names:
+            blob = FakeBlob(bucket, name)
+            try:
+                blob._set_metadata(bucket._get(name))
+            except NotFound:
+                continue
+            blobs.append(blob)
+        return blobs
@@ -0,0 +1,12 @@
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import bigquery, storage
+from clients import pooled_client
+
+@pytest.mark.parametrize("client_class", [storage.Client, bigquery.Client])
+def test_clients_run_on_the_pooled_session(client_class, caplog):
+    client = pooled_client(client_class, "project", AnonymousCredentials(), pool_size=4)
+
+    # A library release dropping or ignoring `_http` fails here instead of quietly losing the pool
+    assert not caplog.records
+    assert client._http.get_adapter("https://storage.googleapis.com")._pool_maxsize == 4
@@ -0,0 +1,110 @@
+import json
+import pytest
+import extract
+import fake_gcs
+import watermark
+from fake_api_server import start_server
+from synthetic import iter_users
+
+BUCKET = "bucket"
+
+@pytest.fixture
+def users_api(monkeypatch):
+    """The stand-in API serving 25 users, with the extractor pointed at it."""
+    users = list(iter_users(25, seed=0))
+    server, base_url = start_server({"users": users})
+    monkeypatch.setitem(extract.API_ENDPOINTS, "users", f"{base_url}/users")
+    yield users
+    server.shutdown()
+    server.server_close()
+
+def fail_uploads(monkeypatch, count):
+    """Make the next `count` object uploads fail."""
+    upload = fake_gcs.FakeBlob.upload_from_string
+    remaining = [count]
+
+    def failing_upload(self, *args, **kwargs):
+        if remaining[0]:
+            remaining[0] -= 1
+            raise ConnectionError("upload interrupted")
+        return upload(self, *args, **kwargs)
+
+    monkeypatch.setattr(fake_gcs.FakeBlob, "upload_from_string", failing_upload)
+
+def extract_users(cache_dir):
+    return extract.fetch_and_save_to_gcs("users", BUCKET, page_size=10, concurrency=2, compress=False,
+                                         cache_dir=str(cache_dir))
+
+def stored_ids(storage_client):
+    data = storage_client.bucket(BUCKET).blob("raw/users_raw.ndjson").download_as_text()
+    return [json.loads(line)["id"] for line in data.splitlines()]
+
+def test_unchanged_upstream_skips_upload(storage_client, users_api, tmp_path):
+    assert extract_users(tmp_path)["unchanged"] is False
+    assert extract_users(tmp_path)["unchanged"] is True
+    assert stored_ids(storage_client) == [user["id"] for user in users_api]
+
+def test_failed_upload_is_retried_by_next_run(storage_client, users_api, tmp_path, monkeypatch):
+    fail_uploads(monkeypatch, 1)
+    assert extract_users(tmp_path) is None
+    assert storage_client.bucket(BUCKET).get_blob("raw/users_raw.ndjson") is None
+
+    # The validators of the failed run were not kept, so this is not reported unchanged
+    result = extract_users(tmp_path)
+    assert result["unchanged"] is False
+    assert result["records"] == 25
+    assert stored_ids(storage_client) == [user["id"] for user in users_api]
+
+def test_missing_raw_object_is_written_despite_unchanged_upstream(storage_client, users_api, tmp_path):
+    extract_users(tmp_path)
+    storage_client.bucket(BUCKET).blob("raw/users_raw.ndjson").delete()
+
+    result = extract_users(tmp_path)
+    assert result["unchanged"] is False
+    assert stored_ids(storage_client) == [user["id"] for user in users_api]
+
+def extract_delta(cache_dir, run_ts, mode):
+    return extract.fetch_incremental_to_gcs("users", BUCKET, run_ts=run_ts, mode=mode, page_size=10, concurrency=2,
+                                            compress=False, cache_dir=str(cache_dir))
+
+def delta_ids(storage_client, blob_name):
+    data = storage_client.bucket(BUCKET).blob(blob_name).download_as_text()
+    return [json.loads(line)["id"] for line in data.splitlines()]
+
+def test_changes_mode_emits_new_and_updated_records(storage_client, users_api, tmp_path):
+    first = extract_delta(tmp_path, "20240101T000000", "changes")
+    assert first["records"] == first["scanned"] == 25
+
+    users_api[3] = dict(users_api[3], firstName="Renamed")
+    users_api.append(dict(users_api[0], id=26))
+    second = extract_delta(tmp_path, "20240102T000000", "changes")
+    assert (second["records"], second["scanned"]) == (2, 26)
+    assert delta_ids(storage_client, second["blob_name"]) == [users_api[3]["id"], 26]
+
+    # Nothing changed: no delta object, nothing to merge
+    assert extract_delta(tmp_path, "20240103T000000", "changes")["blob_name"] is None
+
+def test_append_mode_only_fetches_past_the_offset(storage_client, users_api, tmp_path):
+    extract_delta(tmp_path, "20240101T000000", "append")
+    users_api[3] = dict(users_api[3], firstName="Renamed")
+    users_api.extend(dict(users_api[0], id=number) for number in (26, 27))
+
+    result = extract_delta(tmp_path, "20240102T000000", "append")
+    # Updates before the offset are not seen in append mode
+    assert (result["records"], result["scanned"]) == (2, 2)
+    assert delta_ids(storage_client, result["blob_name"]) == [26, 27]
+    assert watermark.load_watermark(storage_client.bucket(BUCKET), "users")["offset"] == 27
+
+@pytest.mark.parametrize("mode", ["changes", "append"])
+def test_failed_delta_upload_does_not_advance_watermark(storage_client, users_api, tmp_path, monkeypatch, mode):
+    extract_delta(tmp_path, "20240101T000000", mode)
+    before = watermark.load_watermark(storage_client.bucket(BUCKET), "users")
+    users_api.append(dict(users_api[0], id=26))
+
+    fail_uploads(monkeypatch, 1)
+    assert extract_delta(tmp_path, "20240102T000000", mode) is None
+    assert watermark.load_watermark(storage_client.bucket(BUCKET), "users") == before
+
+    # The next run picks up the same change again
+    result = extract_delta(tmp_path, "20240103T000000", mode)
+    assert delta_ids(storage_client, result["blob_name"]) == [26]
@@ -0,0 +1,90 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import facts
+from endpoints import FACTS
+from ndjson_io import NDJSONBlobWriter, raw_blob_name
+
+BUCKET = "bucket"
+
+USERS = [
+    {"id": 1, "firstName": "a", "gender": "female", "age": 30, "address": {"city": "Nairobi"}},
+    {"id": 2, "firstName": "b", "gender": "male", "age": 40, "address": {"city": "Mombasa"}},
+    # A later record of the same key replaces the earlier one
+    {"id": 1, "firstName": "a", "gender": "female", "age": 31, "address": {"city": "Kisumu"}},
+]
+PRODUCTS = [
+    {"id": 10, "title": "p", "category": "beauty", "brand": "x", "price": 60},
+    # Below the products transform's price filter, but still a dimension row
+    {"id": 11, "title": "q", "category": "groceries", "price": 5},
+]
+CARTS = [
+    {"id": 100, "userId": 1, "products": [{"id": 10, "title": "p", "quantity": 1, "price": 60},
+                                          {"id": 11, "title": "q", "quantity": 2, "price": 5}]},
+    # Neither the user nor the product exist
+    {"id": 101, "userId": 3, "products": [{"id": 12, "title": "r", "quantity": 1, "price": 9}]},
+]
+
+def write_raw(storage_client, entity, records):
+    with NDJSONBlobWriter(storage_client.bucket(BUCKET).blob(raw_blob_name(entity))) as writer:
+        writer.write_records(records)
+
+@pytest.fixture
+def raw_data(storage_client):
+    for entity, records in (("users", USERS), ("products", PRODUCTS), ("carts", CARTS)):
+        write_raw(storage_client, entity, records)
+    return storage_client
+
+def cart_lines():
+    return pd.DataFrame({"cart_id": [100, 100, 101], "user_id": [1, 1, 3], "product_id": [10, 11, 12]})
+
+def test_dimension_index_reads_every_raw_record_and_keeps_the_last(raw_data):
+    users = facts.build_dimension_index(BUCKET, "users", ["city", "age"])
+    products = facts.build_dimension_index(BUCKET, "products", ["category", "brand"])
+
+    assert users["index"].tolist() == [2, 1]
+    assert users["attributes"]["city"].tolist()[:2] == ["Mombasa", "Kisumu"]
+    assert products["index"].tolist() == [10, 11]
+
+@pytest.mark.parametrize("missing_keys, product_ids, cities", [
+    ("keep", [10, 11, 12], ["Kisumu", "Kisumu", None]),
+    ("drop", [10, 11], ["Kisumu", "Kisumu"]),
+])
+def test_unmatched_keys_are_kept_or_dropped(raw_data, missing_keys, product_ids, cities):
+    users = facts.build_dimension_index(BUCKET, "users", ["city"])
+
+    df = facts.join_dimension(cart_lines(), users, "user_id", [("user_city", "city")], missing_keys, "cart_lines")
+
+    assert df["product_id"].tolist() == product_ids
+    assert [None if pd.isna(city) else city for city in df["user_city"]] == cities
+
+def test_unmatched_keys_fail_the_join(raw_data):
+    users = facts.build_dimension_index(BUCKET, "users", ["city"])
+    with pytest.raises(ValueError, match="missing from users"):
+        facts.join_dimension(cart_lines(), users, "user_id", [("user_city", "city")], "fail", "cart_lines")
+    with pytest.raises(ValueError, match="Unknown missing key handling"):
+        facts.join_dimension(cart_lines(), users, "user_id", [("user_city", "city")], "ignore", "cart_lines")
+
+def test_fact_is_enriched_from_both_dimensions(raw_data, tmp_path):
+    output_file = str(tmp_path / "cart_lines.parquet")
+    assert facts.build_fact(BUCKET, "cart_lines", output_file) == 3
+
+    table = pq.read_table(output_file)
+    assert table.column("user_city").to_pylist() == ["Kisumu", "Kisumu", None]
+    assert table.column("user_age").to_pylist() == [31, 31, None]
+    assert table.column("product_category").to_pylist() == ["beauty", "groceries", None]
+
+def test_unchanged_inputs_reuse_the_staged_fact(raw_data, tmp_path, monkeypatch):
+    run = lambda prefix: facts.run_fact(BUCKET, "cart_lines", prefix, output_dir=str(tmp_path))
+
+    first, second = run("staged/1"), run("staged/2")
+    assert (first["skipped"], second["skipped"]) == (False, True)
+    assert second["rows"] == first["rows"] == 3
+    assert second["source_uri"] == first["source_uri"]
+
+    # A changed dimension or unmatched-key policy builds the fact again
+    write_raw(raw_data, "users", USERS[:2])
+    assert run("staged/3")["skipped"] is False
+    monkeypatch.setitem(FACTS["cart_lines"], "missing_keys", "drop")
+    changed = run("staged/4")
+    assert changed["skipped"] is False and changed["rows"] == 2
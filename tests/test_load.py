@@ -0,0 +1,87 @@
+import pandas as pd
+import load
+import metrics
+from columnar import save_to_parquet
+from fake_bigquery import FakeBigQueryClient
+
+TABLE_ID = "project.dataset.products_table"
+
+def test_upsert_stages_into_a_private_table_and_drops_it(tmp_path):
+    source = str(tmp_path / "products.parquet")
+    save_to_parquet(pd.DataFrame({"id": [1, 1, 2], "title": ["a", "b", "c"], "category": ["x", "x", "y"],
+                                  "brand": ["p", "p", "q"], "price": [60.0, 61.0, 70.0]}), source, "products")
+    client = FakeBigQueryClient()
+
+    load.upsert_to_bigquery(client, TABLE_ID, source, ["id"])
+    load.upsert_to_bigquery(client, TABLE_ID, source, ["id"])
+
+    staging_tables = [job.destination for job in client.jobs]
+    assert len(set(staging_tables)) == 2
+    assert all(table.startswith(f"{TABLE_ID}__staging_") for table in staging_tables)
+    assert list(client.tables) == [TABLE_ID]
+    # The row kept among duplicate keys does not depend on the order BigQuery reads them in
+    assert "ROW_NUMBER() OVER (PARTITION BY `id` ORDER BY TO_JSON_STRING(R))" in client.queries[0].query
+
+def test_upsert_metrics_are_labelled_with_the_target_table(tmp_path):
+    source = str(tmp_path / "products.parquet")
+    save_to_parquet(pd.DataFrame({"id": [1], "title": ["a"], "category": ["x"], "brand": ["p"], "price": [60.0]}),
+                    source, "products")
+    metrics.reset()
+
+    for _ in range(2):
+        load.upsert_to_bigquery(FakeBigQueryClient(), TABLE_ID, source, ["id"])
+
+    series = [(stage["stage"], stage["labels"], stage["calls"]) for stage in metrics.snapshot()["stages"]]
+    assert sorted(series, key=str) == [("load.job", {"phase": "staging", "table": TABLE_ID}, 2),
+                                       ("load.merge", {"table": TABLE_ID}, 2)]
+
+def test_declared_tables_are_not_typed_by_sampling(storage_client):
+    bucket = storage_client.bucket("bucket")
+    # No leading zero in the sample, which inference would type INTEGER
+    bucket.blob("staged/run/users/users.csv").upload_from_string("id,postal_code\n1,12345\n")
+    bucket.blob("staged/run/products/products.csv").upload_from_string("id,price\n1,60.5\n")
+
+    client = FakeBigQueryClient(storage_client=storage_client)
+    for table_id, entity in (("project.dataset.users_table", "users"), (TABLE_ID, "products")):
+        load.start_load_job(client, table_id, f"gs://bucket/staged/run/{entity}/*.csv").result()
+
+    assert [(field.name, field.field_type) for field in client.get_table("project.dataset.users_table").schema] == \
+        [("id", "INTEGER"), ("postal_code", "STRING")]
+    assert [(field.name, field.field_type) for field in client.get_table(TABLE_ID).schema] == \
+        [("id", "INTEGER"), ("price", "NUMERIC")]
+
+def test_csv_schema_is_cached_per_table_across_staged_paths(storage_client, monkeypatch):
+    import schema_inference
+
+    # Only tables the pipeline does not declare are inferred
+    table_id = "project.dataset.vendors_table"
+    inferred = []
+    infer = schema_inference.infer_column_types
+    monkeypatch.setattr(schema_inference, "infer_column_types", lambda *args: inferred.append(1) or infer(*args))
+    monkeypatch.setattr(schema_inference, "_schema_cache", {})
+    bucket = storage_client.bucket("bucket")
+    for run in ("20240101T000000", "20240102T000000"):
+        bucket.blob(f"staged/{run}/products/products.csv").upload_from_string("id,price\n1,60.5\n")
+
+    client = FakeBigQueryClient(storage_client=storage_client)
+    for run in ("20240101T000000", "20240102T000000"):
+        load.start_load_job(client, table_id, f"gs://bucket/staged/{run}/products/*.csv").result()
+    assert len(inferred) == 1
+
+def test_unchanged_staged_sources_are_not_loaded_again(storage_client):
+    bucket = storage_client.bucket("bucket")
+    uri = "gs://bucket/staged/run/products/*.csv"
+    bucket.blob("staged/run/products/products.csv").upload_from_string("id,price\n1,60.5\n")
+    client = FakeBigQueryClient(storage_client=storage_client)
+    load_all = lambda: load.load_tables_to_bigquery({TABLE_ID: uri}, client=client, skip_unchanged=True,
+                                                    storage_client=storage_client)[TABLE_ID]
+
+    first, second = load_all(), load_all()
+    assert (first["skipped"], second["skipped"]) == (False, True)
+    assert second["rows"] == first["rows"] == 1
+    assert len(client.jobs) == 1
+
+    bucket.blob("staged/run/products/products.csv").upload_from_string("id,price\n1,60.5\n2,70.0\n")
+    changed = load_all()
+    assert changed["skipped"] is False and changed["rows"] == 2
+    assert len(client.jobs) == 2
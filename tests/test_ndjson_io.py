@@ -0,0 +1,50 @@
+import gc
+import pytest
+from ndjson_io import NDJSONBlobWriter, raw_blob_name
+
+PREVIOUS = b'{"id":1}\n{"id":2}\n{"id":3}\n'
+
+class PullFailed(Exception):
+    pass
+
+def object_names(storage_client, bucket):
+    return [blob.name for blob in storage_client.list_blobs(bucket)]
+
+@pytest.mark.parametrize("options", [{}, {"compress": True}, {"part_size": 16}])
+def test_failed_pull_keeps_previous_object(storage_client, options):
+    bucket = storage_client.bucket("raw-bucket")
+    blob_name = raw_blob_name("users", compress=False)
+    bucket.blob(blob_name).upload_from_string(PREVIOUS)
+
+    with pytest.raises(PullFailed):
+        with NDJSONBlobWriter(bucket.blob(blob_name), **options) as writer:
+            writer.write_records([{"id": 1}, {"id": 2}])
+            raise PullFailed("API went away mid-pull")
+    del writer
+    # An abandoned upload stream must not be finalized by its finalizer either
+    gc.collect()
+
+    assert bucket.blob(blob_name).download_as_bytes() == PREVIOUS
+    assert object_names(storage_client, bucket) == [blob_name]
+
+@pytest.mark.parametrize("options", [{}, {"part_size": 16}])
+def test_clean_pull_replaces_object(storage_client, options):
+    bucket = storage_client.bucket("raw-bucket")
+    blob_name = raw_blob_name("users", compress=False)
+    bucket.blob(blob_name).upload_from_string(PREVIOUS)
+
+    with NDJSONBlobWriter(bucket.blob(blob_name), **options) as writer:
+        writer.write_records([{"id": 4}, {"id": 5}])
+
+    assert bucket.blob(blob_name).download_as_bytes() == b'{"id":4}\n{"id":5}\n'
+    assert object_names(storage_client, bucket) == [blob_name]
+
+def test_empty_pull_keeps_previous_object(storage_client):
+    bucket = storage_client.bucket("raw-bucket")
+    blob_name = raw_blob_name("users", compress=False)
+    bucket.blob(blob_name).upload_from_string(PREVIOUS)
+
+    with NDJSONBlobWriter(bucket.blob(blob_name)) as writer:
+        writer.write_records([])
+
+    assert bucket.blob(blob_name).download_as_bytes() == PREVIOUS
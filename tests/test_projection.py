@@ -0,0 +1,37 @@
+import pandas as pd
+from projection import compile_projection, extract_columns
+from synthetic import iter_users
+from transform import flatten_json
+
+def test_fallback_path_is_read_when_the_first_is_missing_or_null():
+    records = [{"cart_id": 7, "id": 1}, {"id": 2}, {"cart_id": None, "id": 3}, {}]
+    [values] = extract_columns(records, ["cart_id|id"])
+    assert values.tolist() == [7, 2, 3, None]
+
+def test_missing_or_non_object_parents_read_as_none():
+    records = [
+        {"address": {"city": "a", "geo": {"lat": 1.5}}},
+        {"address": None},
+        {"address": "somewhere"},
+        {"address": ["a", "b"]},
+        {"address": {"geo": 3}},
+        {},
+        None,
+        "not a record",
+    ]
+    cities, latitudes = extract_columns(records, ["address.city", "address.geo.lat"])
+    assert cities.tolist() == ["a"] + [None] * 7
+    assert latitudes.tolist() == [1.5] + [None] * 7
+
+def test_empty_input_and_compiled_extractor_is_reused():
+    assert [values.tolist() for values in extract_columns([], ["id", "address.city"])] == [[], []]
+    assert compile_projection(("id", "address.city")) is compile_projection(("id", "address.city"))
+
+def test_flatten_json_matches_json_normalize():
+    users = list(iter_users(200, seed=0))
+    expected = pd.json_normalize(users)[
+        ["id", "firstName", "lastName", "gender", "age", "address.address", "address.city", "address.postalCode"]
+    ]
+    expected.columns = ["id", "first_name", "last_name", "gender", "age", "street", "city", "postal_code"]
+
+    pd.testing.assert_frame_equal(flatten_json(users), expected, check_dtype=False)
@@ -0,0 +1,43 @@
+import json
+import pytest
+from record_spec import SPECS, select_lines, select_records
+
+RECORDS = [
+    {"id": 1, "title": "a", "category": "x", "brand": "p", "price": 60.5, "stock": 3},
+    {"id": 2, "title": "b", "category": "x", "price": "75"},           # brand missing, price as text
+    {"id": 3, "title": "c", "category": "y", "price": 10},             # filtered out by price
+    {"id": 4, "title": "d", "category": "y"},                          # price missing
+    {"id": 5, "title": "e", "category": "y", "price": None},
+    {"id": 6, "title": "f", "category": "y", "price": "n/a"},
+    {"id": 7, "title": "g with \"price\" in it", "category": "z"},     # marker matches, field does not
+]
+
+def as_lines(kind):
+    lines = [json.dumps(record, separators=(",", ":")) for record in RECORDS] + [""]
+    if kind == "str":
+        return lines
+    encoded = [line.encode("utf-8") for line in lines]
+    return encoded if kind == "bytes" else [bytearray(line) for line in encoded]
+
+@pytest.mark.parametrize("kind", ["str", "bytes", "bytearray"])
+@pytest.mark.parametrize("spec_name", ["products", "premium_products", "users"])
+def test_pushdown_matches_full_parse(kind, spec_name):
+    spec = SPECS[spec_name]
+    full_parse = list(select_records(RECORDS, spec))
+    assert list(select_lines(as_lines(kind), spec)) == full_parse
+
+@pytest.mark.parametrize("kind", ["str", "bytes", "bytearray"])
+def test_products_projection_and_coercion(kind):
+    assert list(select_lines(as_lines(kind), SPECS["products"])) == [
+        {"id": 1, "title": "a", "category": "x", "brand": "p", "price": 60.5},
+        {"id": 2, "title": "b", "category": "x", "brand": None, "price": 75.0},
+    ]
+
+def test_no_spec_decodes_every_line():
+    assert list(select_lines(as_lines("bytearray"), None)) == RECORDS
+    assert list(select_records(RECORDS, None)) == RECORDS
+
+def test_records_are_not_modified():
+    record = {"id": 2, "price": "75"}
+    list(select_records([record], SPECS["products"]))
+    assert record == {"id": 2, "price": "75"}
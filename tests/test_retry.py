@@ -0,0 +1,80 @@
+import pytest
+import requests
+import retry
+from email.utils import formatdate
+from fake_api_server import start_server
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep, recording every sleep."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(retry.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(retry.time, "sleep", clock.sleep)
+    return clock
+
+@pytest.fixture
+def api():
+    """Start the stand-in API answering the given failures first; yields a session factory."""
+    servers = []
+
+    def session(failures, **options):
+        server, base_url = start_server({"users": [{"id": 1}]}, failures=list(failures))
+        servers.append(server)
+        session = requests.Session()
+        session.mount("http://", retry.RetryingAdapter(base_delay=0.5, **options))
+        return session, f"{base_url}/users"
+
+    yield session
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_token_bucket_throttles_past_the_burst(clock):
+    bucket = retry.TokenBucket(rate=10, capacity=2)
+    for _ in range(6):
+        bucket.acquire()
+    # Two requests fit in the burst, the other four wait 0.1s each
+    assert clock.now == pytest.approx(0.4)
+
+def test_parse_retry_after():
+    assert retry.parse_retry_after("3") == 3.0
+    assert retry.parse_retry_after("-1") == 0.0
+    assert retry.parse_retry_after(None) is None
+    assert retry.parse_retry_after("soon") is None
+    assert retry.parse_retry_after(formatdate(retry.time.time() + 60, usegmt=True)) == pytest.approx(60, abs=2)
+
+def test_retry_after_is_honoured_beyond_the_backoff_cap(api, clock):
+    session, url = api([(429, 45)], max_delay=30.0)
+    response = session.get(url)
+    assert response.status_code == 200
+    assert clock.sleeps == [45.0]
+
+def test_unavailable_is_retried_with_backoff(api, clock):
+    session, url = api([(503, None), (503, None)])
+    response = session.get(url)
+    assert response.status_code == 200
+    assert len(clock.sleeps) == 2
+    assert 0 <= clock.sleeps[0] <= 0.5 and 0 <= clock.sleeps[1] <= 1.0
+
+def test_retries_are_exhausted(api, clock):
+    session, url = api([(503, None)] * 3, max_retries=2)
+    assert session.get(url).status_code == 503
+    assert len(clock.sleeps) == 2
+
+def test_retry_after_beyond_the_limit_is_not_retried_early(api, clock):
+    session, url = api([(429, 600)], max_retry_after=300.0)
+    assert session.get(url).status_code == 429
+    assert clock.sleeps == []
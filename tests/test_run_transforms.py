@@ -0,0 +1,89 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+import run_transforms
+from ndjson_io import NDJSONBlobWriter, delta_blob_name, raw_blob_name
+from synthetic import iter_users
+
+BUCKET = "bucket"
+
+@pytest.fixture
+def in_process_pool(monkeypatch):
+    # Spawned workers would not see the in-memory GCS, so the tasks run on threads instead
+    monkeypatch.setattr(run_transforms, "ProcessPoolExecutor",
+                        lambda max_workers, mp_context: ThreadPoolExecutor(max_workers))
+
+def write_users(storage_client, blob_name, count):
+    with NDJSONBlobWriter(storage_client.bucket(BUCKET).blob(blob_name)) as writer:
+        writer.write_records(list(iter_users(count, seed=0)))
+
+def test_delta_is_transformed_instead_of_the_raw_dump(storage_client, tmp_path):
+    write_users(storage_client, raw_blob_name("users"), 20)
+    delta = delta_blob_name("users", "20240101T000000")
+    write_users(storage_client, delta, 3)
+
+    tasks = run_transforms.plan_tasks(BUCKET, ["users"], output_dir=str(tmp_path), blob_names={"users": delta})
+    assert [task["blob_name"] for task in tasks] == [delta]
+    result = run_transforms.run_transform_task(tasks[0])
+    assert result["error"] is None
+    assert result["rows"] == 3
+
+def test_unchanged_raw_dump_is_not_transformed_again(storage_client, tmp_path, in_process_pool):
+    write_users(storage_client, raw_blob_name("users"), 20)
+    options = {"output_dir": str(tmp_path), "skip_unchanged": True, "max_workers": 2}
+
+    first = run_transforms.run_transforms(BUCKET, ["users"], staging_prefix="staged/1", **options)
+    second = run_transforms.run_transforms(BUCKET, ["users"], staging_prefix="staged/2", **options)
+
+    assert not first["users"]["skipped"] and second["users"]["skipped"]
+    assert second["users"]["rows"] == first["users"]["rows"] == 20
+    assert second["users"]["source_uri"] == first["users"]["source_uri"]
+
+def test_changed_raw_dump_is_transformed_again(storage_client, tmp_path, in_process_pool):
+    write_users(storage_client, raw_blob_name("users"), 20)
+    options = {"output_dir": str(tmp_path), "skip_unchanged": True, "max_workers": 2}
+    run_transforms.run_transforms(BUCKET, ["users"], staging_prefix="staged/1", **options)
+
+    write_users(storage_client, raw_blob_name("users"), 25)
+    summary = run_transforms.run_transforms(BUCKET, ["users"], staging_prefix="staged/2", **options)
+
+    assert not summary["users"]["skipped"]
+    assert summary["users"]["rows"] == 25
+
+def test_new_delta_is_not_skipped_as_the_unchanged_raw_dump(storage_client, tmp_path, in_process_pool):
+    write_users(storage_client, raw_blob_name("users"), 20)
+    options = {"output_dir": str(tmp_path), "skip_unchanged": True, "max_workers": 2}
+    run_transforms.run_transforms(BUCKET, ["users"], staging_prefix="staged/1", **options)
+
+    delta = delta_blob_name("users", "20240101T000000")
+    write_users(storage_client, delta, 3)
+    summary = run_transforms.run_transforms(BUCKET, ["users"], staging_prefix="staged/2", blob_names={"users": delta},
+                                            **options)
+
+    assert not summary["users"]["skipped"]
+    assert summary["users"]["rows"] == 3
+
+def test_shards_read_every_record_exactly_once(storage_client, tmp_path):
+    users = list(iter_users(40, seed=0))
+    # Every fifth user has no id, so the shards holding only that user write no rows
+    for user in users[::5]:
+        user["id"] = None
+    with NDJSONBlobWriter(storage_client.bucket(BUCKET).blob(raw_blob_name("users"))) as writer:
+        writer.write_records(users)
+    size = storage_client.bucket(BUCKET).get_blob(raw_blob_name("users")).size
+    # Shards much smaller than a line: most hold no line start at all
+    tasks = run_transforms.plan_tasks(BUCKET, ["users"], output_dir=str(tmp_path), shard_bytes=size // 97)
+    assert len(tasks) == 98
+    assert tasks[0]["byte_range"][0] == 0 and tasks[-1]["byte_range"][1] == size
+    assert all(a["byte_range"][1] == b["byte_range"][0] for a, b in zip(tasks, tasks[1:]))
+
+    results = [run_transforms.run_transform_task(task) for task in tasks]
+    summary = run_transforms.consolidate_results(results)["users"]
+
+    assert summary["errors"] == [] and summary["shards"] == 98
+    # Only the shards that wrote rows leave an output behind
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(output) for output in summary["outputs"])
+    ids = pd.concat(pd.read_parquet(output) for output in summary["outputs"])["id"].tolist()
+    assert sorted(ids) == [user["id"] for user in users if user["id"] is not None]
+    assert summary["rows"] == 32
@@ -0,0 +1,23 @@
+import pyarrow as pa
+import pytest
+import storage_write
+from fake_bigquery import FakeBigQueryClient, FakeBigQueryWriteClient
+
+TABLE_ID = "project.dataset.users_table"
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(storage_write.time, "sleep", lambda seconds: None)
+
+@pytest.mark.parametrize("mode", ["committed", "pending"])
+def test_dropped_connection_writes_every_row_once(mode):
+    table = pa.table({"id": list(range(10)), "first_name": [f"user{number}" for number in range(10)]})
+    bigquery_client = FakeBigQueryClient()
+    # The second append is written but the connection drops before it is acknowledged
+    write_client = FakeBigQueryWriteClient(bigquery_client, drop_after_appends=[2])
+
+    rows = storage_write.stream_table_to_bigquery(write_client, TABLE_ID, table, mode=mode, batch_rows=3)
+
+    assert rows == 10
+    assert write_client.appends == 4
+    assert bigquery_client.get_table(TABLE_ID).num_rows == 10
@@ -0,0 +1,27 @@
+import fastavro
+import pandas as pd
+import pytest
+from streaming_transform import BatchOutputWriter
+
+def test_avro_output_is_avro(tmp_path):
+    output_file = str(tmp_path / "products.avro")
+    batches = [
+        pd.DataFrame({"id": [1, 2], "title": ["a", "b"], "category": ["x", "y"], "brand": ["p", None],
+                      "price": [60.5, 70.0]}),
+        # A batch lacking an optional column still lines up with the schema
+        pd.DataFrame({"id": [3], "title": ["c"], "category": ["z"], "price": [80.25]}),
+    ]
+    with BatchOutputWriter(output_file, "products") as writer:
+        for batch in batches:
+            writer.write(batch)
+
+    with open(output_file, "rb") as avro_file:
+        rows = list(fastavro.reader(avro_file))
+    assert writer.rows_written == len(rows) == 3
+    assert [row["id"] for row in rows] == [1, 2, 3]
+    assert rows[1]["brand"] is None and rows[2]["brand"] is None
+    assert rows[2]["price"] == 80.25
+
+def test_unsupported_output_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        BatchOutputWriter(str(tmp_path / "products.orc"), "products")
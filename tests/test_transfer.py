@@ -0,0 +1,36 @@
+import pytest
+from transfer import ParallelCompositeWriter, download_bytes
+
+BUCKET = "bucket"
+
+def test_ranged_download_matches_object(storage_client):
+    data = bytes(range(256)) * 100
+    blob = storage_client.bucket(BUCKET).blob("raw/object")
+    blob.upload_from_string(data)
+
+    assert download_bytes(blob, part_size=1000, workers=4, threshold=0) == data
+
+def test_composite_upload_replaces_destination(storage_client):
+    bucket = storage_client.bucket(BUCKET)
+    bucket.blob("raw/object").upload_from_string(b"previous")
+
+    writer = ParallelCompositeWriter(bucket.blob("raw/object"), part_size=16, workers=2)
+    writer.write(b"x" * 100)
+    writer.close()
+
+    assert bucket.blob("raw/object").download_as_bytes() == b"x" * 100
+    assert [blob.name for blob in storage_client.list_blobs(BUCKET)] == ["raw/object"]
+
+def test_corrupt_composite_upload_keeps_destination(storage_client):
+    bucket = storage_client.bucket(BUCKET)
+    bucket.blob("raw/object").upload_from_string(b"previous")
+
+    writer = ParallelCompositeWriter(bucket.blob("raw/object"), part_size=16, workers=2)
+    writer.write(b"x" * 100)
+    # The composed object no longer matches what was written, like a lost or torn part
+    writer._checksum.update(b"y")
+    with pytest.raises(RuntimeError, match="CRC32C mismatch"):
+        writer.close()
+
+    assert bucket.blob("raw/object").download_as_bytes() == b"previous"
+    assert [blob.name for blob in storage_client.list_blobs(BUCKET)] == ["raw/object"]
@@ -0,0 +1,62 @@
+import functools
+import ndjson_io
+import transfer
+import transform
+from ndjson_io import NDJSONBlobWriter, raw_blob_name
+
+BUCKET = "bucket"
+
+def write_records(storage_client, blob_name, records):
+    with NDJSONBlobWriter(storage_client.bucket(BUCKET).blob(blob_name)) as writer:
+        writer.write_records(records)
+
+def test_ranged_download_of_products_is_filtered(storage_client, monkeypatch):
+    # Downloads at or above the threshold are assembled into a bytearray
+    monkeypatch.setattr(ndjson_io, "download_bytes", functools.partial(transfer.download_bytes, part_size=64, threshold=0))
+    write_records(storage_client, raw_blob_name("products"), [
+        {"id": 1, "title": "a", "category": "x", "brand": "p", "price": 60.5},
+        {"id": 2, "title": "b", "category": "x", "price": 10},
+        {"id": 3, "title": "c", "category": "y"},
+    ])
+
+    records = transform.download_json_from_gcs(BUCKET, raw_blob_name("products"), "products")
+
+    assert [record["id"] for record in records] == [1]
+
+CARTS = [
+    {"id": 1, "userId": 5, "products": [{"id": 10, "title": "a", "quantity": 2, "price": "12.5"},
+                                        {"id": 11, "title": "b", "quantity": 1, "price": 3}]},
+    # The line without a price is dropped, and left out of the cart total
+    {"id": 2, "userId": 6, "products": [{"id": 12, "title": "c", "quantity": 1, "price": None},
+                                        {"id": 13, "title": "d", "quantity": 3, "price": 2.0}]},
+    {"id": 3, "products": [{"id": 14, "title": "e", "quantity": 1, "price": 1}]},
+    {"id": 4, "userId": 7},
+]
+
+def test_cart_lines_drop_missing_values_and_sum_per_cart():
+    df = transform.transform_records(CARTS, "carts")
+
+    assert list(df.columns) == ["cart_id", "user_id", "product_id", "name", "quantity", "price", "total_cart_value"]
+    assert df["product_id"].tolist() == [10, 11, 13]
+    assert df["price"].dtype == "float64" and df["price"].tolist() == [12.5, 3.0, 2.0]
+    # record_sum over multiply(quantity, price) of the remaining lines of each cart
+    assert df["total_cart_value"].tolist() == [28.0, 28.0, 6.0]
+
+def test_products_coerce_text_prices_and_drop_invalid_ones():
+    products = [
+        {"id": 1, "title": "a", "price": "75"},
+        {"id": 2, "title": "b", "price": None},
+        {"id": None, "title": "c", "price": 80},
+        {"id": 4, "title": "d", "price": "n/a"},
+        {"id": 5, "title": "e", "price": 49},
+    ]
+    df = transform.transform_records(products, "products")
+
+    assert df.to_dict("records") == [{"id": 1, "title": "a", "category": None, "brand": None, "price": 75.0}]
+
+def test_users_without_an_id_are_dropped():
+    users = [{"id": 1, "firstName": "a", "address": {"postalCode": "01234"}}, {"firstName": "b"}]
+    df = transform.transform_records(users, "users")
+
+    assert df["id"].tolist() == [1]
+    assert df["postal_code"].tolist() == ["01234"]
@@ -0,0 +1,24 @@
+import watermark
+
+def test_select_changes_keeps_new_and_changed_records():
+    state = watermark.empty_watermark()
+    records = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+    assert watermark.select_changes(records, state) == records
+    assert state["last_id"] == 2
+
+    # Key order does not make a record look changed
+    assert watermark.select_changes([{"name": "a", "id": 1}], state) == []
+    assert watermark.select_changes([{"id": 2, "name": "c"}, {"id": 3, "name": "d"}], state) == \
+        [{"id": 2, "name": "c"}, {"id": 3, "name": "d"}]
+    assert state["last_id"] == 3
+
+def test_watermark_round_trips_through_gcs(storage_client):
+    bucket = storage_client.bucket("bucket")
+    assert watermark.load_watermark(bucket, "users") == watermark.empty_watermark()
+
+    state = watermark.empty_watermark()
+    watermark.select_changes([{"id": 1, "name": "a"}], state)
+    state.update(offset=1, updated_at="20240101T000000")
+    watermark.save_watermark(bucket, "users", state)
+
+    assert watermark.load_watermark(bucket, "users") == state